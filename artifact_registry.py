@@ -0,0 +1,303 @@
+# ml-old-car-price-prediction/artifact_registry.py
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_DIR = os.environ.get("ARTIFACTS_DIR", "artifacts")
+
+# Native XGBoost model; preferred over the pickled model.joblib when present.
+NATIVE_MODEL_FILE = "model.ubj"
+
+# Optional {"version": ..., "path": ...} file naming the live artifact set.
+MANIFEST_FILE = "manifest.json"
+
+
+# -------------------- helpers --------------------
+def _rss_bytes() -> int | None:
+    """Current resident set size of this process (Linux), else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _load_joblib(path: str):
+    # mmap_mode only kicks in for numpy arrays stored uncompressed in the
+    # pickle; everything else is loaded normally.
+    return joblib.load(path, mmap_mode="r")
+
+
+def model_path(root: str) -> str:
+    """The model file load_model() reads: model.ubj when present, else model.joblib."""
+    native = os.path.join(root, NATIVE_MODEL_FILE)
+    return native if os.path.exists(native) else os.path.join(root, "model.joblib")
+
+
+def load_model(root: str):
+    path = model_path(root)
+    if path.endswith(NATIVE_MODEL_FILE):
+        from xgboost import XGBRegressor
+
+        model = XGBRegressor()
+        model.load_model(path)
+        return model
+    return _load_joblib(path)
+
+
+def _load_mapping(root: str):
+    import pandas as pd
+
+    return pd.read_csv(os.path.join(root, "model_target_mapping.csv"))
+
+
+def read_version(root: str = ARTIFACTS_DIR) -> tuple[str, str]:
+    """
+    Return (version, directory holding the artifact files).
+
+    With a manifest, the version and the (relative) directory come from it,
+    so a retrain can write a new directory and then flip the manifest.
+    Without one, the version is a fingerprint of the files' sizes and
+    modification times.
+    """
+    manifest = os.path.join(root, MANIFEST_FILE)
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            data = json.load(f)
+        return str(data["version"]), os.path.normpath(os.path.join(root, data.get("path", ".")))
+
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        path = os.path.join(root, name)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            digest.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12], root
+
+
+def export_native_model(root: str = ARTIFACTS_DIR) -> str:
+    """Write model.joblib to model.ubj (XGBoost's native UBJSON format)."""
+    model = joblib.load(os.path.join(root, "model.joblib"))
+    path = os.path.join(root, NATIVE_MODEL_FILE)
+    model.save_model(path)
+    return path
+
+
+# -------------------- registry --------------------
+class ArtifactRegistry:
+    """
+    Lazily loaded trained artifacts.
+
+    Nothing is read until an artifact is first requested with get(). Derived
+    artifacts (lookup tables, encoders) can be registered with a builder
+    that receives the registry. warmup() loads everything up front, e.g.
+    before forking workers so they share the loaded pages copy-on-write.
+    """
+
+    def __init__(self, root: str = ARTIFACTS_DIR, version: str | None = None):
+        self.root = root
+        self.version = version
+        self._builders = {
+            "model": lambda reg: load_model(reg.root),
+            "log_scaler": lambda reg: _load_joblib(os.path.join(reg.root, "log_scaler.joblib")),
+            "direct_scaler": lambda reg: _load_joblib(os.path.join(reg.root, "direct_scaler.joblib")),
+            "log_transformer": lambda reg: _load_joblib(os.path.join(reg.root, "log_transformer.joblib")),
+            "model_target_mapping": lambda reg: _load_mapping(reg.root),
+            "feature_order": _load_feature_order,
+        }
+        self._values: dict = {}
+        self._stats: dict = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, builder) -> None:
+        """Add a derived artifact built lazily as builder(registry)."""
+        with self._lock:
+            self._builders[name] = builder
+            self._values.pop(name, None)
+
+    def names(self) -> list[str]:
+        return list(self._builders)
+
+    def get(self, name: str):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name in self._values:
+                return self._values[name]
+            if name not in self._builders:
+                raise KeyError(f"Unknown artifact: {name}")
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            value = self._builders[name](self)
+            elapsed = time.perf_counter() - start
+            rss_after = _rss_bytes()
+            self._stats[name] = {
+                "load_seconds": elapsed,
+                "resident_bytes": (
+                    max(rss_after - rss_before, 0)
+                    if rss_before is not None and rss_after is not None else None
+                ),
+            }
+            self._values[name] = value
+            return value
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._values
+
+    def warmup(self, names: list[str] | None = None) -> dict:
+        """Load the given (default: all) artifacts now; returns stats()."""
+        for name in names or self.names():
+            self.get(name)
+        return self.stats()
+
+    def stats(self) -> dict:
+        """
+        Per-artifact load time and resident-size growth at load. Figures for
+        derived artifacts include any dependencies loaded on the way.
+        """
+        with self._lock:
+            return {name: dict(s) for name, s in self._stats.items()}
+
+
+def _load_feature_order(reg: ArtifactRegistry) -> list[str]:
+    path = os.path.join(reg.root, "feature_order.joblib")
+    if os.path.exists(path):
+        return list(joblib.load(path))
+    return reg.get("model").get_booster().feature_names
+
+
+def check_feature_order(reg: ArtifactRegistry) -> None:
+    """Reject an artifact set whose model was trained on other features."""
+    feature_order = list(reg.get("feature_order"))
+    model_features = reg.get("model").get_booster().feature_names
+    if model_features and list(model_features) != feature_order:
+        raise ValueError("model feature names do not match feature_order")
+
+
+# -------------------- versioned store --------------------
+class ArtifactStore:
+    """
+    Holds the live ArtifactRegistry and swaps in new versions without a
+    restart.
+
+    reload() loads a new version into a fresh registry, warms it up fully,
+    validates it and only then replaces the current one with a single
+    reference assignment. Callers take current() once per request and use
+    that registry throughout, so a prediction never mixes artifacts from
+    two versions. start_watching() polls read_version() in a daemon thread.
+    """
+
+    def __init__(self, root: str = ARTIFACTS_DIR, validators=None):
+        self.root = root
+        self._derived: dict = {}
+        self._validators = [check_feature_order, *(validators or [])]
+        self._listeners: list = []
+        self._reload_lock = threading.Lock()
+        self._failed_version: str | None = None
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+        self.last_error: Exception | None = None
+        version, path = read_version(root)
+        self._current = self._new_registry(version, path)
+
+    def _new_registry(self, version: str, path: str) -> ArtifactRegistry:
+        reg = ArtifactRegistry(path, version=version)
+        for name, builder in self._derived.items():
+            reg.register(name, builder)
+        return reg
+
+    # -- access --
+    def current(self) -> ArtifactRegistry:
+        return self._current
+
+    @property
+    def version(self) -> str | None:
+        return self._current.version
+
+    def get(self, name: str):
+        return self._current.get(name)
+
+    def register(self, name: str, builder) -> None:
+        """Register a derived artifact on the live registry and every future one."""
+        self._derived[name] = builder
+        self._current.register(name, builder)
+
+    def add_validator(self, check) -> None:
+        """check(registry) must raise to reject a new artifact set."""
+        self._validators.append(check)
+
+    def on_swap(self, callback) -> None:
+        """Call callback(new_registry) after each successful swap."""
+        self._listeners.append(callback)
+
+    def open(self, path: str, version: str | None = None) -> ArtifactRegistry:
+        """A registry for another artifact directory with this store's derived artifacts; not swapped in."""
+        return self._new_registry(version, path)
+
+    def warmup(self, names: list[str] | None = None) -> dict:
+        return self._current.warmup(names)
+
+    def stats(self) -> dict:
+        return self._current.stats()
+
+    # -- reloading --
+    def reload(self, force: bool = False) -> bool:
+        """Load, validate and swap in the on-disk version if it changed."""
+        with self._reload_lock:
+            version, path = read_version(self.root)
+            if not force and version in (self._current.version, self._failed_version):
+                return False
+            candidate = self._new_registry(version, path)
+            try:
+                candidate.warmup()
+                for check in self._validators:
+                    check(candidate)
+            except Exception as e:
+                self._failed_version = version
+                self.last_error = e
+                logger.warning("Rejected artifacts version %s: %s", version, e)
+                raise
+            self._current = candidate
+            self._failed_version = None
+            self.last_error = None
+            logger.info("Swapped in artifacts version %s", version)
+            for callback in self._listeners:
+                try:
+                    callback(candidate)
+                except Exception:
+                    logger.exception("Artifact swap listener failed")
+            return True
+
+    def start_watching(self, interval: float = 5.0) -> None:
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(
+            target=self._watch, args=(interval,), name="artifact-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except Exception:
+                # Already logged; keep serving the current version.
+                pass
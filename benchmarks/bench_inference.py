@@ -0,0 +1,290 @@
+# ml-old-car-price-prediction/benchmarks/bench_inference.py
+"""
+Benchmark suite for the inference path in prediction_helper.
+
+Cases: preprocess_user_input, each pipeline stage (feature_engineering,
+model_map_enc, hot_encoding, handle_scaling), model.predict (the sklearn
+wrapper on the feature frame), engine.predict (the booster's inplace_predict
+on the same frame, including its float32 conversion), end-to-end predict
+(pandas and fast path, cache off) and predict_batch, the same two with
+interval=True when a quantile model is present, and explain_fast and
+explain_batch (cache off) for the overhead of contributions over plain
+prediction. Each case is
+swept over batch sizes, concurrent caller threads and input distributions
+drawn from artifacts/model_target_mapping.csv:
+
+    uniform  every (brand, model) pair equally likely
+    skewed   Zipf-weighted pairs, so a few models dominate like real traffic
+    unknown  a fifth of the rows carry brands, models and colours the
+             artifacts have never seen
+
+Latency percentiles, rows/s and peak traced allocation per case are written
+to JSON. With --baseline the run is compared against a stored results file,
+and the script exits non-zero if any case is slower than --tolerance allows.
+
+Run from the repository root:
+    python benchmarks/bench_inference.py --output results.json
+    python benchmarks/bench_inference.py --baseline benchmarks/baseline.json
+    python benchmarks/bench_inference.py --output benchmarks/baseline.json   # refresh it
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prediction_helper as ph  # noqa: E402
+from bulk_score import peak_rss_bytes  # noqa: E402
+
+DISTRIBUTIONS = ["uniform", "skewed", "unknown"]
+COLORS = ["black", "blue", "red", "white", "silver", "grey"]
+TRANSMISSIONS = ["manual", "automatic", "semi-automatic"]
+FUELS = ["petrol", "diesel", "hybrid", "electric"]
+
+# Cases that loop over single inputs; batch sizes above --max-loop-rows are skipped.
+PER_ROW_CASES = {"preprocess_user_input", "predict", "predict_fast", "predict_fast_interval", "explain_fast"}
+
+
+# -----------------------
+# Inputs
+# -----------------------
+def sample_frame(n, distribution, seed=0):
+    rng = np.random.default_rng(seed)
+    pairs = ph.model_target_mapping[["brand", "model"]].to_numpy()
+    if distribution == "skewed":
+        weights = 1.0 / np.arange(1, len(pairs) + 1) ** 1.1
+        picked = pairs[rng.permutation(len(pairs))][rng.choice(len(pairs), n, p=weights / weights.sum())]
+    else:
+        picked = pairs[rng.integers(0, len(pairs), n)]
+    brand, model = picked[:, 0].copy(), picked[:, 1].copy()
+    color = rng.choice(COLORS, n)
+    if distribution == "unknown":
+        unseen = rng.random(n) < 0.2
+        brand[unseen] = "unseen-brand"
+        model[unseen] = "unseen-model"
+        color[unseen] = "chartreuse"
+
+    year = rng.integers(1995, 2023, n)
+    reg_year = np.minimum(year + rng.integers(0, 3, n), 2023)
+    fuel = rng.choice(FUELS, n)
+    return pd.DataFrame({
+        "brand": brand,
+        "model": model,
+        "color": color,
+        "registration_date": [f"{y}-{m:02d}-01" for y, m in zip(reg_year, rng.integers(1, 13, n))],
+        "year": year,
+        "power_hp": rng.integers(60, 400, n),
+        "transmission_type": rng.choice(TRANSMISSIONS, n),
+        "fuel_type": fuel,
+        "fuel_efficiency": np.where(fuel == "electric", 0.0, rng.uniform(8, 25, n).round(1)),
+        "mileage_in_km": rng.integers(0, 300_000, n),
+        "ev_range_km": np.where(fuel == "electric", rng.integers(150, 500, n),
+                                np.where(fuel == "hybrid", 50, 0)),
+        "currency": "EUR",
+    })
+
+
+def stage_inputs(raw, registry):
+    """The frame each pipeline stage receives, from one run of the pipeline."""
+    feature_engineering_in = ph.convert_units(raw.copy())
+    model_map_enc_in = ph.feature_engineering(feature_engineering_in.copy())
+    hot_encoding_in = ph.model_map_enc(model_map_enc_in.copy(), registry)
+    handle_scaling_in = ph.hot_encoding(hot_encoding_in.copy(), registry)
+    features = ph.handle_scaling(handle_scaling_in.copy(), registry)[registry.get("feature_order")]
+    return feature_engineering_in, model_map_enc_in, hot_encoding_in, handle_scaling_in, features
+
+
+def build_cases(raw, registry):
+    """name -> (fn, make_arg); make_arg runs untimed before every call."""
+    records = raw.to_dict("records")
+    fe_in, me_in, he_in, hs_in, features = stage_inputs(raw, registry)
+    model = registry.get("model")
+    engine = registry.get("engine")
+    cases = {
+        "preprocess_user_input": (lambda recs: [ph.preprocess_user_input(r, registry) for r in recs],
+                                  lambda: records),
+        "feature_engineering": (ph.feature_engineering, fe_in.copy),
+        "model_map_enc": (lambda df: ph.model_map_enc(df, registry), me_in.copy),
+        "hot_encoding": (lambda df: ph.hot_encoding(df, registry), he_in.copy),
+        "handle_scaling": (lambda df: ph.handle_scaling(df, registry), hs_in.copy),
+        "model.predict": (model.predict, lambda: features),
+        "engine.predict": (engine.predict, lambda: features),
+        "predict": (lambda recs: [ph.predict(r, use_cache=False) for r in recs], lambda: records),
+        "predict_fast": (lambda recs: [ph.predict(r, fast=True, use_cache=False) for r in recs],
+                         lambda: records),
+        "predict_batch": (ph.predict_batch, raw.copy),
+        "explain_fast": (lambda recs: [ph.explain(r, fast=True, use_cache=False) for r in recs], lambda: records),
+        "explain_batch": (lambda df: ph.explain_batch(df, use_cache=False), raw.copy),
+    }
+    if registry.get("quantile_engine") is not None:
+        cases["predict_fast_interval"] = (
+            lambda recs: [ph.predict(r, fast=True, use_cache=False, interval=True) for r in recs], lambda: records)
+        cases["predict_batch_interval"] = (lambda df: ph.predict_batch(df, interval=True), raw.copy)
+    return cases
+
+
+# -----------------------
+# Measurement
+# -----------------------
+def _timed_calls(fn, make_arg, min_time, max_calls):
+    latencies = []
+    deadline = time.perf_counter() + min_time
+    while len(latencies) < max_calls and (len(latencies) < 3 or time.perf_counter() < deadline):
+        arg = make_arg()
+        start = time.perf_counter()
+        fn(arg)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def peak_alloc_bytes(fn, make_arg):
+    """Peak Python/NumPy allocation of one call (native XGBoost memory is not traced)."""
+    arg = make_arg()
+    tracemalloc.start()
+    try:
+        fn(arg)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(fn, make_arg, rows, threads, min_time, max_calls):
+    fn(make_arg())  # warm up
+    with ThreadPoolExecutor(threads) as pool:
+        per_thread = list(pool.map(lambda _: _timed_calls(fn, make_arg, min_time, max_calls), range(threads)))
+    latencies = np.concatenate([np.asarray(lat) for lat in per_thread])
+    # Throughput counts timed calls only; the busiest thread bounds the wall time.
+    busy = max(sum(lat) for lat in per_thread)
+    ms = latencies * 1000
+    return {
+        "calls": int(len(latencies)),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "rows_per_s": float(rows * len(latencies) / busy),
+        "peak_alloc_bytes": int(peak_alloc_bytes(fn, make_arg)),
+    }
+
+
+def case_key(result):
+    return f"{result['case']}|{result['distribution']}|b{result['batch_size']}|t{result['threads']}"
+
+
+def run_suite(args):
+    registry = ph.artifacts.current()
+    registry.get("compiled_encoder")  # load every artifact before timing
+    results = []
+    for distribution in args.distributions:
+        for batch_size in args.batch_sizes:
+            raw = sample_frame(batch_size, distribution, seed=batch_size)
+            cases = build_cases(raw, registry)
+            for name in args.cases:
+                if name not in cases or (name in PER_ROW_CASES and batch_size > args.max_loop_rows):
+                    continue
+                fn, make_arg = cases[name]
+                for threads in args.threads:
+                    stats = measure(fn, make_arg, batch_size, threads, args.min_time, args.max_calls)
+                    result = {"case": name, "distribution": distribution, "batch_size": batch_size,
+                              "threads": threads, **stats}
+                    results.append(result)
+                    print(f"{case_key(result):<48} p50 {stats['p50_ms']:>9.3f} ms  p99 {stats['p99_ms']:>9.3f} ms  "
+                          f"{stats['rows_per_s']:>12,.0f} rows/s  {stats['peak_alloc_bytes'] / 2**20:>7.1f} MiB",
+                          flush=True)
+    return results
+
+
+def run_metadata():
+    import xgboost
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "artifacts_version": ph.artifacts.version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "xgboost": xgboost.__version__,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+# -----------------------
+# Baseline comparison
+# -----------------------
+def compare(results, baseline, tolerance):
+    """Print each case against the baseline; returns the keys that regressed."""
+    before = {case_key(r): r for r in baseline["results"]}
+    for field in ("cpu_count", "python", "xgboost", "artifacts_version"):
+        if baseline["meta"].get(field) != results["meta"].get(field):
+            print(f"note: baseline {field} {baseline['meta'].get(field)!r} != {results['meta'].get(field)!r}")
+
+    regressions = []
+    print(f"\n{'case':<48} {'base p50':>10} {'p50':>10} {'change':>8}  {'rows/s change':>13}")
+    for result in results["results"]:
+        key = case_key(result)
+        old = before.get(key)
+        if old is None:
+            continue
+        latency = result["p50_ms"] / old["p50_ms"] - 1
+        throughput = result["rows_per_s"] / old["rows_per_s"] - 1
+        regressed = latency > tolerance or throughput < -tolerance / (1 + tolerance)
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<48} {old['p50_ms']:>10.3f} {result['p50_ms']:>10.3f} {latency:>+7.0%}  {throughput:>+12.0%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    missing = sorted(set(before) - {case_key(r) for r in results["results"]})
+    if missing:
+        print(f"{len(missing)} baseline cases were not run")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cases", nargs="+", default=["preprocess_user_input", "feature_engineering",
+                        "model_map_enc", "hot_encoding", "handle_scaling", "model.predict", "engine.predict",
+                        "predict", "predict_fast", "predict_batch", "predict_fast_interval",
+                        "predict_batch_interval", "explain_fast", "explain_batch"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 100, 10_000])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=DISTRIBUTIONS)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds of calls per thread and case")
+    parser.add_argument("--max-calls", type=int, default=10_000)
+    parser.add_argument("--max-loop-rows", type=int, default=100,
+                        help="largest batch for cases that loop over single inputs")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed slowdown before a case counts as a regression (default 0.15)")
+    args = parser.parse_args()
+
+    rows = run_suite(args)
+    results = {"meta": run_metadata(), "results": rows}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"wrote {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
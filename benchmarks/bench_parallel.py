@@ -0,0 +1,76 @@
+# ml-old-car-price-prediction/benchmarks/bench_parallel.py
+"""
+Scaling curve for bulk_score.py --workers.
+
+Writes a synthetic inventory file, scores it with 1, 2, 4, ... workers up
+to the CPU count (or --max-workers), and prints rows/s, speedup and
+parallel efficiency for each.
+
+Run from the repository root:
+    python benchmarks/bench_parallel.py --rows 1000000 --chunk-size 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from artifact_registry import ARTIFACTS_DIR  # noqa: E402
+from bulk_score import score_file  # noqa: E402
+
+
+def make_inventory(path, n, seed=11):
+    rng = np.random.default_rng(seed)
+    mapping = pd.read_csv(os.path.join(ARTIFACTS_DIR, "model_target_mapping.csv"))
+    picked = mapping[["brand", "model"]].to_numpy()[rng.integers(0, len(mapping), n)]
+    year = rng.integers(1998, 2023, n)
+    reg_year = np.minimum(year + rng.integers(0, 3, n), 2023)
+    pd.DataFrame({
+        "listing_id": np.arange(n),
+        "brand": picked[:, 0],
+        "model": picked[:, 1],
+        "color": rng.choice(["black", "blue", "red", "white", "silver", "grey"], n),
+        "registration_date": pd.to_datetime({"year": reg_year, "month": rng.integers(1, 13, n), "day": 1})
+                               .dt.strftime("%Y-%m-%d"),
+        "year": year,
+        "power_hp": rng.integers(60, 400, n),
+        "transmission_type": rng.choice(["manual", "automatic", "semi-automatic"], n),
+        "fuel_type": rng.choice(["petrol", "diesel", "hybrid"], n),
+        "fuel_efficiency": rng.uniform(8, 25, n).round(1),
+        "mileage_in_km": rng.integers(0, 300_000, n),
+        "ev_range_km": 0,
+        "currency": "EUR",
+    }).to_csv(path, index=False)
+
+
+def worker_counts(limit):
+    counts, n = [], 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    return counts + [limit]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "inventory.csv")
+        make_inventory(source, args.rows)
+        print(f"{args.rows:,} rows, chunk size {args.chunk_size:,}, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'rows/s':>12} {'speedup':>9} {'efficiency':>11}")
+        baseline = None
+        for workers in worker_counts(args.max_workers):
+            stats = score_file(source, os.path.join(tmp, f"scored_{workers}.csv"), args.chunk_size,
+                               keep_columns=["listing_id"], workers=workers, log=lambda _: None)
+            rate = stats["rows_per_second"]
+            baseline = baseline or rate
+            print(f"{workers:>8} {rate:>12,.0f} {rate / baseline:>8.2f}x {rate / baseline / workers:>10.0%}")
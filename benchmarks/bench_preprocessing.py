@@ -0,0 +1,111 @@
+# ml-old-car-price-prediction/benchmarks/bench_preprocessing.py
+"""
+Micro-benchmark for the column-wise feature_engineering / model_map_enc.
+
+Compares the current implementations against the previous row-wise
+DataFrame.apply versions (kept below for reference) and prints the
+per-row cost for batches of 1, 1k and 100k rows.
+
+Run from the repository root:
+    python benchmarks/bench_preprocessing.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prediction_helper as ph  # noqa: E402
+
+BATCH_SIZES = [1, 1_000, 100_000]
+
+
+# -----------------------
+# Previous row-wise implementations
+# -----------------------
+def feature_engineering_apply(df, data_collection_year=2023):
+    df["vehicle_manufacturing_age"] = data_collection_year - df["year"].astype(int)
+    df["registration_date"] = pd.to_datetime(df["registration_date"])
+    df["registration_month"] = df["registration_date"].dt.month
+    df["registration_year"] = df["registration_date"].dt.year
+    df["vehicle_registration_age"] = data_collection_year - df["registration_year"]
+
+    df["reg_month_sin"] = np.sin(2 * np.pi * df["registration_month"] / 12)
+    df["reg_month_cos"] = np.cos(2 * np.pi * df["registration_month"] / 12)
+
+    df["mileage_per_year"] = df.apply(
+        lambda row: row["mileage_in_km"] / row["vehicle_registration_age"]
+        if row["vehicle_registration_age"] > 0 else row["mileage_in_km"], axis=1
+    ).round(2)
+
+    df = df.drop(columns=["registration_date", "registration_month", "registration_year", "year"])
+    return df
+
+
+def model_map_enc_apply(df):
+    mapping = ph.model_target_mapping
+    global_mean = mapping['model_target_enc'].mean()
+    mapping_dict = mapping.set_index(['brand', 'model'])['model_target_enc'].to_dict()
+    df['model_target_enc'] = df.apply(
+        lambda row: mapping_dict.get((row['brand'], row['model']), global_mean), axis=1
+    )
+    df = df.drop(columns=['model'], axis=1)
+    return df
+
+
+# -----------------------
+# Helpers
+# -----------------------
+def make_frame(n, seed=42):
+    rng = np.random.default_rng(seed)
+    pairs = ph.model_target_mapping[["brand", "model"]].to_numpy()
+    picked = pairs[rng.integers(0, len(pairs), n)]
+    year = rng.integers(1995, 2023, n)
+    reg_year = np.minimum(year + rng.integers(0, 3, n), 2023)
+    reg_month = rng.integers(1, 13, n)
+    return pd.DataFrame({
+        "brand": picked[:, 0],
+        "model": picked[:, 1],
+        "year": year,
+        "registration_date": [f"{y}-{m:02d}-01" for y, m in zip(reg_year, reg_month)],
+        "mileage_in_km": rng.integers(0, 300_000, n),
+    })
+
+
+def per_row_us(fn, df, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        frame = df.copy()
+        start = time.perf_counter()
+        fn(frame)
+        best = min(best, time.perf_counter() - start)
+    return best / len(df) * 1e6
+
+
+def run_stage(name, before, after, prepare):
+    print(f"\n{name}")
+    print(f"{'rows':>8} {'before µs/row':>15} {'after µs/row':>14} {'speedup':>9}")
+    for n in BATCH_SIZES:
+        df = prepare(make_frame(n))
+        repeats = 20 if n == 1 else 5 if n <= 1_000 else 1
+        t_before = per_row_us(before, df, repeats)
+        t_after = per_row_us(after, df, repeats)
+        print(f"{n:>8} {t_before:>15.2f} {t_after:>14.2f} {t_before / t_after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    run_stage(
+        "feature_engineering",
+        feature_engineering_apply,
+        ph.feature_engineering,
+        prepare=lambda df: df,
+    )
+    run_stage(
+        "model_map_enc",
+        model_map_enc_apply,
+        ph.model_map_enc,
+        prepare=lambda df: df[["brand", "model"]],
+    )
@@ -0,0 +1,144 @@
+# ml-old-car-price-prediction/benchmarks/bench_service.py
+"""
+Load generator for prediction_service.py.
+
+Starts the service twice, once unbatched (--max-batch-size 1, the
+single-request path) and once with micro-batching. Each run is driven by
+keep-alive clients on a pool of concurrent connections, and the script
+reports throughput and p50/p99 latency for both.
+
+Run from the repository root:
+    python benchmarks/bench_service.py --requests 5000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_payloads(n, seed=7):
+    import pandas as pd
+
+    from artifact_registry import ARTIFACTS_DIR
+
+    mapping = pd.read_csv(os.path.join(ARTIFACTS_DIR, "model_target_mapping.csv"))
+    pairs = list(zip(mapping["brand"], mapping["model"]))
+    rnd = random.Random(seed)
+    payloads = []
+    for _ in range(n):
+        brand, model = rnd.choice(pairs)
+        year = rnd.randint(1998, 2022)
+        payloads.append({
+            "brand": brand, "model": model,
+            "color": rnd.choice(["black", "blue", "red", "white", "silver", "grey"]),
+            "registration_date": f"{year}-{rnd.randint(1, 12):02d}-01",
+            "year": year, "power_hp": rnd.randint(60, 400),
+            "transmission_type": rnd.choice(["manual", "automatic"]),
+            "fuel_type": rnd.choice(["petrol", "diesel"]),
+            "fuel_efficiency": round(rnd.uniform(8, 25), 1),
+            "mileage_in_km": rnd.randint(0, 300_000), "ev_range_km": 0,
+            "currency": "EUR",
+        })
+    return payloads
+
+
+async def _client(host, port, queue, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            try:
+                body = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            writer.write(
+                f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            await reader.readline()
+            length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b""):
+                    break
+                key, _, value = header.decode().partition(":")
+                if key.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def drive(host, port, payloads, concurrency):
+    queue = asyncio.Queue()
+    for p in payloads:
+        queue.put_nowait(json.dumps(p).encode())
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, queue, latencies) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+    }
+
+
+def wait_ready(host, port, timeout=120.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1.0).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("service did not start")
+
+
+def run_config(label, args, payloads, max_batch_size):
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "prediction_service.py"), "--host", args.host,
+         "--port", str(args.port), "--max-batch-size", str(max_batch_size),
+         "--max-wait-ms", str(args.max_wait_ms)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(args.host, args.port)
+        asyncio.run(drive(args.host, args.port, payloads[:200], args.concurrency))  # warm up
+        result = asyncio.run(drive(args.host, args.port, payloads, args.concurrency))
+    finally:
+        proc.terminate()
+        proc.wait()
+    print(f"{label:<22} {result['throughput_rps']:>10.0f} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.requests)
+    print(f"{args.requests} requests, {args.concurrency} concurrent clients")
+    print(f"{'mode':<22} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    run_config("single-request", args, payloads, max_batch_size=1)
+    run_config(f"micro-batch (<= {args.max_batch_size})", args, payloads, args.max_batch_size)
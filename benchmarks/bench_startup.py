@@ -0,0 +1,146 @@
+# ml-old-car-price-prediction/benchmarks/bench_startup.py
+"""
+Cold-start and rerun guard for the Streamlit app.
+
+1. Import profile: runs main.py's top-level imports under
+   `python -X importtime`, prints the slowest modules and fails if a heavy
+   package (pandas, xgboost, ...) is on the first-render path or the
+   imports exceed --max-import-ms.
+2. Render time: drives main.py with streamlit's AppTest in a fresh process
+   and reports the first run and the mean of --reruns reruns. Wikimedia is
+   replaced by a local stub that returns no images.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py --max-import-ms 600
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+
+# Loaded by the warmup thread or on first use, never before the first render.
+HEAVY = ("pandas", "numpy", "xgboost", "sklearn", "joblib", "requests", "pyarrow")
+
+
+def main_imports() -> str:
+    """main.py's top-level import statements, as source."""
+    with open(MAIN, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def import_profile(code: str, repeat: int):
+    """Best wall time of running code in a fresh interpreter, plus its importtime table."""
+    best, table = None, {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                              capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best, table = elapsed, {}
+            for line in proc.stderr.splitlines():
+                if not line.startswith("import time:") or "self [us]" in line:
+                    continue
+                # "import time: self | cumulative | <indent>name"; nesting is two spaces per level.
+                self_us, cumulative_us, name = line[len("import time:"):].split("|")
+                table[name[1:].rstrip()] = (int(self_us), int(cumulative_us))
+    return best, table
+
+
+class _EmptyWiki(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = json.dumps({"query": {"pages": {}}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def render_times(reruns: int) -> dict:
+    """Child process: first AppTest run and reruns of main.py."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(MAIN, default_timeout=120)
+    start = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - start)
+    return {"first_run_s": first, "rerun_mean_s": statistics.mean(times), "rerun_max_s": max(times)}
+
+
+def run_render_child(reruns: int) -> dict:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EmptyWiki)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub = f"http://127.0.0.1:{server.server_address[1]}/w/api.php"
+    env = {**os.environ, "WIKI_API_URL": stub, "COMMONS_API_URL": stub,
+           "IMAGE_CACHE_PATH": "", "INSIGHT_CACHE_PATH": ""}
+    try:
+        proc = subprocess.run([sys.executable, __file__, "--child", "--reruns", str(reruns)], cwd=ROOT,
+                              env=env, capture_output=True, text=True)
+    finally:
+        server.shutdown()
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "render failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="import runs; the fastest is kept")
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="fail if main.py's imports take longer than this")
+    parser.add_argument("--skip-render", action="store_true")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, ROOT)
+        print(json.dumps(render_times(args.reruns)))
+        sys.exit(0)
+
+    code = main_imports()
+    baseline, _ = import_profile("pass", args.repeat)
+    wall, table = import_profile(code, args.repeat)
+    print(f"main.py imports: {wall * 1000:,.0f} ms wall ({(wall - baseline) * 1000:,.0f} ms over a bare interpreter)")
+    print(f"{'module':<40} {'cumulative ms':>14}")
+    top_level = {name: cum for name, (_, cum) in table.items() if not name.startswith((" ", "_"))}
+    for name, cum in sorted(top_level.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{name:<40} {cum / 1000:>14,.1f}")
+
+    failures = []
+    heavy = sorted(name for name in table if name.strip() in HEAVY)
+    if heavy:
+        failures.append(f"heavy modules on the first-render path: {', '.join(n.strip() for n in heavy)}")
+    if args.max_import_ms is not None and wall * 1000 > args.max_import_ms:
+        failures.append(f"imports took {wall * 1000:,.0f} ms (budget {args.max_import_ms:,.0f} ms)")
+
+    if not args.skip_render:
+        render = run_render_child(args.reruns)
+        print(f"first render: {render['first_run_s'] * 1000:,.0f} ms, "
+              f"rerun: mean {render['rerun_mean_s'] * 1000:,.0f} ms / max {render['rerun_max_s'] * 1000:,.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,135 @@
+# ml-old-car-price-prediction/benchmarks/bench_tree_compiler.py
+"""
+Compiled NumPy trees (tree_compiler) against the XGBoost booster path.
+
+1. Cold load: a fresh interpreter imports each path, loads the model and
+   makes one prediction. Reports the wall time and the process's peak RSS
+   (VmHWM, which unlike ru_maxrss is not inherited from the parent).
+2. Latency: p50/p99 per call and rows/s at each batch size, plus peak
+   traced allocation per call, on rows generated around the model's split
+   thresholds. Both engines are checked against each other on the same rows.
+
+The artifacts are compiled first if artifacts/compiled_trees is missing or
+stale. Run from the repository root:
+    python benchmarks/bench_tree_compiler.py --batch-sizes 1 100 10000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import tree_compiler  # noqa: E402
+from artifact_registry import ARTIFACTS_DIR, read_version  # noqa: E402
+from inference_engine import BoosterEngine  # noqa: E402
+
+COLD_LOAD = {
+    "booster": """
+import joblib, numpy as np
+from inference_engine import BoosterEngine
+model = joblib.load(os.path.join(root, "model.joblib"))
+engine = BoosterEngine(model, range(model.n_features_in_))
+""",
+    "compiled": """
+import numpy as np
+from tree_compiler import CompiledTrees, TREES_DIR
+engine = CompiledTrees.load(os.path.join(root, TREES_DIR))
+""",
+}
+
+CHILD = """
+import json, os, sys, time
+start = time.perf_counter()
+root = {root!r}
+{body}
+engine.predict(np.zeros((1, {n_features}), dtype=np.float32))
+elapsed = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    hwm_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+print(json.dumps({{"seconds": elapsed, "peak_rss_bytes": hwm_kb * 1024, "xgboost_loaded": "xgboost" in sys.modules}}))
+"""
+
+
+def cold_load(name, root, n_features, repeat):
+    code = CHILD.format(root=root, body=COLD_LOAD[name], n_features=n_features)
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                              check=True, env={**os.environ, "PYTHONPATH": ROOT})
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return min(runs, key=lambda r: r["seconds"])
+
+
+def latency(fn, x, min_time):
+    fn(x)
+    times = []
+    deadline = time.perf_counter() + min_time
+    while len(times) < 5 or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn(x)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    ms = np.asarray(times) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)),
+            "rows_per_s": float(len(x) * len(times) / sum(times)), "peak_alloc_bytes": peak}
+
+
+if __name__ == "__main__":
+    import joblib
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--root", default=None, help="artifact directory (default: the live one)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 100, 10_000])
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds of calls per case")
+    parser.add_argument("--repeat", type=int, default=3, help="cold-load runs; the fastest is kept")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    root = args.root or read_version(ARTIFACTS_DIR)[1]
+    model = joblib.load(os.path.join(root, tree_compiler.MODEL_FILE))
+    trees_dir = os.path.join(root, tree_compiler.TREES_DIR)
+    if not os.path.exists(os.path.join(trees_dir, "meta.json")) or (
+        tree_compiler.CompiledTrees.load(trees_dir).meta.get("model_sha1")
+        != tree_compiler.file_sha1(os.path.join(root, tree_compiler.MODEL_FILE))
+    ):
+        print(f"compiling {root}")
+        tree_compiler.export(root, model)
+    trees = tree_compiler.CompiledTrees.load(trees_dir)
+    booster = BoosterEngine(model, range(trees.n_features))
+    print(f"{trees.meta['num_trees']} trees, {trees.meta['num_nodes']:,} nodes, max depth {trees.max_depth}, "
+          f"{trees.nbytes / 1024:,.0f} KiB of node arrays")
+
+    results = {"cold_load": {}, "latency": []}
+    print(f"\n{'cold load':<12} {'seconds':>9} {'peak RSS MiB':>13}  xgboost imported")
+    for name in COLD_LOAD:
+        r = results["cold_load"][name] = cold_load(name, root, trees.n_features, args.repeat)
+        print(f"{name:<12} {r['seconds']:>9.3f} {r['peak_rss_bytes'] / 2**20:>13.1f}  {r['xgboost_loaded']}")
+
+    print(f"\n{'engine':<10} {'batch':>7} {'p50 ms':>9} {'p99 ms':>9} {'rows/s':>12} {'alloc KiB':>10}")
+    for batch_size in args.batch_sizes:
+        x = tree_compiler.sample_features(trees, batch_size, seed=batch_size)
+        diff = float(np.abs(trees.predict(x).astype(np.float64) - booster.predict(x)).max())
+        for name, engine in (("booster", booster), ("compiled", trees)):
+            r = {"engine": name, "batch_size": batch_size, "max_abs_diff": diff,
+                 **latency(engine.predict, x, args.min_time)}
+            results["latency"].append(r)
+            print(f"{name:<10} {batch_size:>7} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['rows_per_s']:>12,.0f} "
+                  f"{r['peak_alloc_bytes'] / 1024:>10,.0f}")
+        print(f"{'':<10} {batch_size:>7} max |diff| {diff:.3g}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"wrote {args.output}")
@@ -0,0 +1,294 @@
+# ml-old-car-price-prediction/bulk_score.py
+"""
+Score large CSV/Parquet inventory files offline.
+
+Rows are read in chunks, preprocessed and scored with
+prediction_helper.predict_batch, and appended to the output as each chunk
+finishes, so memory stays bounded by the chunk size. A checkpoint next to
+the output records how far the run got; --resume continues from it.
+
+    python bulk_score.py inventory.csv scored.csv --chunk-size 50000
+    python bulk_score.py inventory.parquet scored.parquet --resume
+    python bulk_score.py inventory.csv scored.csv --workers 16
+
+CSV output is a single file. Parquet output is a directory of part files.
+With --workers N, chunks are scored in a pool of N processes that each load
+the artifacts once and read the booster from a native XGBoost model file.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+CHECKPOINT_SUFFIX = ".ckpt.json"
+
+
+# -------------------- input --------------------
+def _is_parquet(path: str) -> bool:
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def iter_chunks(path: str, chunk_size: int, skip_rows: int = 0):
+    """Yield DataFrames of at most chunk_size rows, skipping the first skip_rows."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            if skip_rows:
+                batch = batch.slice(skip_rows)
+                skip_rows = 0
+            yield batch.to_pandas()
+    else:
+        skip = range(1, skip_rows + 1) if skip_rows else None
+        yield from pd.read_csv(path, chunksize=chunk_size, skiprows=skip)
+
+
+# -------------------- output --------------------
+class CsvSink:
+    def __init__(self, path: str, resume_state: dict | None):
+        self.path = path
+        if resume_state:
+            self._file = open(path, "r+b")
+            self._file.truncate(resume_state["output_bytes"])  # drop a half-written chunk
+            self._file.seek(0, os.SEEK_END)
+            self._header = False
+        else:
+            self._file = open(path, "wb")
+            self._header = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        self._file.write(df.to_csv(index=False, header=self._header).encode())
+        self._header = False
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def state(self) -> dict:
+        return {"output_bytes": self._file.tell()}
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink:
+    def __init__(self, path: str, resume_state: dict | None):
+        self.path = path
+        self._parts = resume_state["parts"] if resume_state else 0
+        os.makedirs(path, exist_ok=True)
+        if not resume_state:
+            for name in os.listdir(path):
+                if name.startswith("part-") and name.endswith(".parquet"):
+                    os.remove(os.path.join(path, name))
+
+    def write(self, df: pd.DataFrame) -> None:
+        part = os.path.join(self.path, f"part-{self._parts:05d}.parquet")
+        df.to_parquet(part + ".tmp", index=False)
+        os.replace(part + ".tmp", part)
+        self._parts += 1
+
+    def state(self) -> dict:
+        return {"parts": self._parts}
+
+    def close(self) -> None:
+        pass
+
+
+# -------------------- checkpointing --------------------
+def _checkpoint_path(output_path: str) -> str:
+    return output_path.rstrip("/\\") + CHECKPOINT_SUFFIX
+
+
+def _load_checkpoint(output_path: str, input_path: str) -> dict | None:
+    path = _checkpoint_path(output_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("input") != os.path.abspath(input_path):
+        raise ValueError(f"checkpoint {path} belongs to a different input: {state.get('input')}")
+    return state
+
+
+def _save_checkpoint(output_path: str, state: dict) -> None:
+    path = _checkpoint_path(output_path)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def peak_rss_bytes(who: int = resource.RUSAGE_SELF) -> int:
+    """
+    Peak RSS of this process, or with RUSAGE_CHILDREN of the largest
+    child process that has been joined (so only after the pool shuts down).
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# -------------------- scoring --------------------
+def _predict_chunk(chunk: pd.DataFrame):
+    from prediction_helper import predict_batch
+
+    return predict_batch(chunk)
+
+
+def _with_predictions(chunk, converted, eur, keep_columns=None) -> pd.DataFrame:
+    out = chunk[keep_columns] if keep_columns else chunk
+    out = out.reset_index(drop=True).copy()
+    out["price"] = converted
+    out["price_eur"] = eur
+    return out
+
+
+def score_chunk(chunk: pd.DataFrame, keep_columns: list[str] | None = None) -> pd.DataFrame:
+    converted, eur = _predict_chunk(chunk)
+    return _with_predictions(chunk, converted, eur, keep_columns)
+
+
+def _score_serial(chunks):
+    for chunk in chunks:
+        yield (chunk, *_predict_chunk(chunk))
+
+
+# -------------------- process pool --------------------
+def _init_worker(native_model_path: str) -> None:
+    """Load every artifact once per worker; the model comes from the native file."""
+    from xgboost import XGBRegressor
+
+    from prediction_helper import artifacts
+
+    def load_native(_reg):
+        model = XGBRegressor()
+        model.load_model(native_model_path)
+        # One thread per worker: the pool supplies the parallelism.
+        model.get_booster().set_param({"nthread": 1})
+        return model
+
+    artifacts.register("model", load_native)
+    artifacts.warmup()
+
+
+def _native_model_file(tmp_dir: str) -> str:
+    """Path of a native model file for the live artifacts, exporting one if needed."""
+    from artifact_registry import NATIVE_MODEL_FILE
+    from prediction_helper import artifacts
+
+    root = artifacts.current().root
+    native = os.path.join(root, NATIVE_MODEL_FILE)
+    if os.path.exists(native):
+        return native
+    # Export outside the artifacts directory so the hot-reload watcher
+    # does not see a new version.
+    import joblib
+
+    path = os.path.join(tmp_dir, NATIVE_MODEL_FILE)
+    joblib.load(os.path.join(root, "model.joblib")).save_model(path)
+    return path
+
+
+def _score_parallel(chunks, workers: int):
+    """
+    Score chunks in a process pool and yield results in input order.
+
+    Up to 2 * workers chunks are in flight, so one worker can be
+    preprocessing while another runs the booster, and the parent reads
+    the next chunks in the meantime.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="bulk_score_")
+    try:
+        native = _native_model_file(tmp_dir)
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(native,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk, pool.submit(_predict_chunk, chunk)))
+                while len(pending) >= 2 * workers or (pending and pending[0][1].done()):
+                    head, fut = pending.popleft()
+                    yield (head, *fut.result())
+            while pending:
+                head, fut = pending.popleft()
+                yield (head, *fut.result())
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def score_file(input_path: str, output_path: str, chunk_size: int = 50_000, resume: bool = False,
+               keep_columns: list[str] | None = None, workers: int = 1, log=print) -> dict:
+    """Score input_path into output_path chunk by chunk; returns run stats."""
+    state = _load_checkpoint(output_path, input_path) if resume else None
+    rows_done = state["rows_done"] if state else 0
+    if state:
+        log(f"Resuming after {rows_done:,} rows")
+
+    sink_cls = ParquetSink if _is_parquet(output_path) else CsvSink
+    sink = sink_cls(output_path, state)
+    start = time.perf_counter()
+    rows_scored = 0
+    chunks = iter_chunks(input_path, chunk_size, skip_rows=rows_done)
+    scored = _score_parallel(chunks, workers) if workers > 1 else _score_serial(chunks)
+    try:
+        for chunk, converted, eur in scored:
+            sink.write(_with_predictions(chunk, converted, eur, keep_columns))
+            rows_done += len(chunk)
+            rows_scored += len(chunk)
+            _save_checkpoint(output_path, {
+                "input": os.path.abspath(input_path), "rows_done": rows_done, **sink.state(),
+            })
+            elapsed = time.perf_counter() - start
+            log(f"{rows_done:,} rows ({rows_scored / elapsed:,.0f} rows/s)")
+    finally:
+        scored.close()
+        sink.close()
+
+    if os.path.exists(_checkpoint_path(output_path)):
+        os.remove(_checkpoint_path(output_path))
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": rows_done,
+        "rows_scored": rows_scored,
+        "seconds": elapsed,
+        "rows_per_second": rows_scored / elapsed if elapsed > 0 else 0.0,
+        "peak_rss_bytes": peak_rss_bytes(),
+        # The pool has been joined by now (scored is closed above).
+        "peak_worker_rss_bytes": peak_rss_bytes(resource.RUSAGE_CHILDREN) if workers > 1 else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet inventory file in chunks.")
+    parser.add_argument("input", help="input .csv or .parquet file")
+    parser.add_argument("output", help="output .csv file or .parquet directory")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="rows per chunk (default 50000)")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="scoring processes (default 1; 0 = one per CPU)")
+    parser.add_argument("--keep-columns", help="comma-separated input columns to copy to the output "
+                                               "(default: all)")
+    args = parser.parse_args(argv)
+
+    keep = [c.strip() for c in args.keep_columns.split(",")] if args.keep_columns else None
+    workers = args.workers or os.cpu_count() or 1
+    stats = score_file(args.input, args.output, args.chunk_size, args.resume, keep, workers)
+    peak = f"peak RSS {stats['peak_rss_bytes'] / 2**20:,.0f} MiB"
+    if stats["peak_worker_rss_bytes"] is not None:
+        peak += f" (largest worker {stats['peak_worker_rss_bytes'] / 2**20:,.0f} MiB)"
+    print(f"Scored {stats['rows_scored']:,} rows in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_second']:,.0f} rows/s), {peak}")
+
+
+if __name__ == "__main__":
+    main()
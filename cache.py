@@ -0,0 +1,192 @@
+# ml-old-car-price-prediction/cache.py
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """
+    Thread-safe in-memory cache with least-recently-used eviction and an
+    optional time-to-live per entry. Keeps hit/miss/eviction counters.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = self._clock() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+class SQLiteCache:
+    """
+    Persistent key/value cache in a SQLite file, shared by every process on
+    the host. Keys are strings, values anything JSON-serialisable; entries
+    expire after ttl seconds (None keeps them forever).
+    """
+
+    def __init__(self, path: str, ttl: float | None = None, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= self._clock()):
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        expires_at = self._clock() + self.ttl if self.ttl else None
+        data = json.dumps(value)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, data, expires_at),
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (self._clock(),)
+            ).rowcount
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "size": size, "ttl": self.ttl}
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional SQLiteCache (string keys)."""
+
+    def __init__(self, memory: LRUTTLCache, disk: SQLiteCache | None = None):
+        self.memory = memory
+        self.disk = disk
+
+    @classmethod
+    def open(cls, path: str | None, maxsize: int = 256, ttl: float | None = None) -> "TieredCache":
+        """Build a tiered cache; falls back to memory only if the file cannot be opened."""
+        disk = None
+        if path:
+            try:
+                disk = SQLiteCache(path, ttl=ttl)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Disk cache %s unavailable, using memory only: %s", path, e)
+        return cls(LRUTTLCache(maxsize=maxsize, ttl=ttl), disk)
+
+    def get(self, key: str, default=None):
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key, _MISSING)
+            except sqlite3.Error as e:
+                logger.warning("Disk cache read failed: %s", e)
+                return default
+            if value is not _MISSING:
+                self.memory.set(key, value)
+                return value
+        return default
+
+    def set(self, key: str, value) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except sqlite3.Error as e:
+                logger.warning("Disk cache write failed: %s", e)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
@@ -0,0 +1,35 @@
+# ml-old-car-price-prediction/catalog.py
+"""
+Static vehicle catalog shared by the app and the insight pre-warmer.
+
+The brand → model mapping and the brand logo URLs live in data/catalog.json
+(CATALOG_PATH overrides it). The file is read once per process; Streamlit
+reruns reuse the imported module, so they never rebuild the tables.
+"""
+from __future__ import annotations
+
+import json
+import os
+from functools import lru_cache
+
+CATALOG_PATH = os.getenv(
+    "CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "catalog.json")
+)
+
+
+@lru_cache(maxsize=None)
+def load_catalog(path: str = CATALOG_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def brands() -> list[str]:
+    return sorted(load_catalog()["brand_model_mapping"])
+
+
+def __getattr__(name):
+    # brand_model_mapping / brand_images read like the module-level dicts they used to be.
+    if name in ("brand_model_mapping", "brand_images"):
+        return load_catalog()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,259 @@
+# ml-old-car-price-prediction/data_cleaning.py
+"""
+Cleaning of the raw listings (gcar_data.csv), extracted from
+Notebooks/data cleaning.ipynb.
+
+clean_raw() runs the notebook's steps in order: names are normalized,
+unparseable years and prices dropped, prices capped at the 99.5th
+percentile, and missing or implausible values imputed from the mean (or,
+for categories, the mode) of ever coarser groups of similar cars. EV range
+is split out of the fuel consumption column, where the source lists it as
+"Reichweite". The result has one row per listing and the columns
+train_pipeline.py feeds to the shared feature engineering.
+
+The group imputations are vectorized (groupby/transform instead of a
+Python function per group). Rows whose group keys are missing keep their
+own value, where the notebook's transform blanked it.
+"""
+from __future__ import annotations
+
+import re
+
+import numpy as np
+import pandas as pd
+
+DEDUP_COLS = ["brand", "model", "year", "power_kw", "transmission_type", "fuel_type", "price_in_euro"]
+
+BRANDS = [
+    'ford', 'hyundai', 'audi', 'honda', 'kia', 'dacia', 'bmw',
+    'citroen', 'alfa_romeo', 'land-rover', 'jaguar', 'dodge', 'fiat',
+    'lamborghini', 'mazda', 'isuzu', 'jeep', 'ferrari', 'bentley',
+    'maserati', 'daihatsu', 'chevrolet', 'aston-martin', 'cadillac',
+    'daewoo', 'chrysler', 'lancia', 'lada', 'infiniti'
+]
+
+# model names (brand prefix removed) -> canonical name; None drops the row.
+MODEL_CORRECTIONS = {
+    # Land Rover
+    "land_rover_range_rover_sport": "range_rover_sport",
+    "land_rover_range_rover_evoque": "range_rover_evoque",
+    "land_rover_range_rover_velar": "range_rover_velar",
+    "land_rover_range_rover": "range_rover",
+    "land_rover_discovery_sport": "discovery_sport",
+    "land_rover_discovery": "discovery",
+    "land_rover_defender": "defender",
+    "land_rover_freelander": "freelander",
+    # Kia
+    "ceed_": "ceed",
+    "ceed_sw_": "ceed_sw",
+    "proceed_": "proceed",
+    # Ford
+    "f_150": "f150",
+    "f_250": "f250",
+    "f_350": "f350",
+    # BMW
+    "bmw": None,
+    "1er_m_coupé": "1m_coupe",
+    # Audi
+    "rs_q8": "rsq8",
+    "rs_q3": "rsq3",
+    "tt_rs": "ttrs",
+    "audi": None,
+    # Hyundai
+    "h-1": "h1",
+    "h_350": "h350",
+    "ioniq_5": "ioniq5",
+    "ioniq_6": "ioniq6",
+    "kona_elektro": "kona_electric",
+    # Aston Martin
+    "aston_martin_db7": "db7",
+    "aston_martin_db9": "db9",
+    "aston_martin_db11": "db11",
+    "aston_martin_dbs": "dbs",
+    "aston_martin_dbx": "dbx",
+    "aston_martin_v8": "v8",
+    "aston_martin_vantage": "vantage",
+    "aston_martin_vanquish": "vanquish",
+    "aston_martin_rapide": "rapide",
+    "aston_martin_virage": "virage",
+    # Other
+    "mustang_mach-e": "mustang_mach_e",
+    "grand_c4_picasso": "c4_grand_picasso",
+    "grand_c4_spacetourer": "c4_grand_spacetourer",
+    "grand_tourneo": "tourneo_grand",
+}
+
+VALID_FUELS = ["petrol", "diesel", "electric", "hybrid", "diesel_hybrid", "lpg", "cng", "hydrogen", "ethanol"]
+EV_FUELS = ["electric", "hybrid"]
+
+PRICE_CAP_QUANTILE = 0.995
+EXTREME_QUANTILE = 0.9998
+MIN_POWER_KW = 30
+MIN_MILEAGE_KM = 500
+
+DROP_COLS = ["Unnamed: 0", "offer_description", "power_ps", "fuel_consumption_l_100km"]
+
+
+# -------------------- value cleaners --------------------
+def clean_brand_name(name):
+    return name.lower().strip()
+
+
+def clean_model_name(name):
+    name = name.lower().strip()
+    name = name.split("/")[0]
+    return re.sub(r"\s+", "_", name)
+
+
+def remove_brand(model):
+    """Cut a leading "<brand>_" off a model name."""
+    for brand in BRANDS:
+        prefix = brand + "_"
+        if model.startswith(prefix):
+            return model[len(prefix):]
+    return model
+
+
+def clean_year(value):
+    """A year in 1950-2025 from a number or a string containing one, else NaN."""
+    val = str(value).strip()
+    if val.isdigit() and 1950 <= int(val) <= 2025:
+        return int(val)
+    match = re.search(r"(\d{4})", val)
+    if match and 1950 <= int(match.group(1)) <= 2025:
+        return int(match.group(1))
+    return np.nan
+
+
+def clean_number(value):
+    """The first number in a value like "5,7 l/100 km (comb.)", else NaN."""
+    if pd.isna(value):
+        return np.nan
+    num = re.findall(r"[\d,.]+", str(value).lower().strip())
+    if num:
+        try:
+            return float(num[0].replace(",", "."))
+        except ValueError:
+            return np.nan
+    return np.nan
+
+
+# -------------------- group imputation --------------------
+def _group_mode(df, keys, col):
+    """Most frequent col per keys group (ties: smallest value), aligned with df."""
+    counts = df.dropna(subset=[col]).groupby(keys + [col]).size().reset_index(name="n")
+    counts = counts.sort_values(keys + ["n", col], ascending=[True] * len(keys) + [False, True])
+    modes = counts.drop_duplicates(keys)[keys + [col]]
+    return df[keys].merge(modes, on=keys, how="left")[col].to_numpy()
+
+
+def fill_by_group(df, col, keys, stat="mean"):
+    """Fill missing col from the mean (or mode) of its keys group."""
+    missing = df[col].isna().to_numpy()
+    if missing.any():
+        fill = df.groupby(keys)[col].transform("mean").to_numpy() if stat == "mean" else _group_mode(df, keys, col)
+        df.loc[missing, col] = fill[missing]
+    return df
+
+
+def _group_mean_below(df, col, keys, cap):
+    """Mean of col per keys group over rows with col <= cap, aligned with df."""
+    means = df[df[col] <= cap].groupby(keys)[col].mean().rename("_mean").reset_index()
+    return df[keys].merge(means, on=keys, how="left")["_mean"].to_numpy()
+
+
+# -------------------- steps --------------------
+def clean_names(df):
+    df["brand"] = df["brand"].astype(str).map(clean_brand_name)
+    model_only = df["model"].astype(str).map(clean_model_name).map(remove_brand)
+    model_only = model_only.map(lambda m: MODEL_CORRECTIONS.get(m, m))
+    df = df[model_only.notna()].copy()
+    df["model"] = df["brand"] + "_" + model_only[model_only.notna()].str.replace("_", "-", regex=False)
+    return df
+
+
+def clean_price(df):
+    df["year"] = df["year"].map(clean_year)
+    df["price_in_euro"] = pd.to_numeric(df["price_in_euro"], errors="coerce")
+    df = df.dropna(subset=["year", "price_in_euro"])
+    df = df[df["price_in_euro"] <= df["price_in_euro"].quantile(PRICE_CAP_QUANTILE)].copy()
+    df["year"] = df["year"].astype(int)
+    return df
+
+
+def clean_transmission_and_fuel(df):
+    df["transmission_type"] = df["transmission_type"].str.lower().replace("unknown", np.nan)
+    fill_by_group(df, "transmission_type", ["model", "year"], stat="mode")
+    fill_by_group(df, "transmission_type", ["year"], stat="mode")
+
+    fuel = df["fuel_type"].str.lower().str.strip().str.replace(" ", "_", regex=True)
+    df["fuel_type"] = fuel.where(fuel.isin(VALID_FUELS))
+    fill_by_group(df, "fuel_type", ["year"], stat="mode")
+    return df
+
+
+def clean_consumption_and_range(df):
+    """Split EV range out of fuel_consumption_g_km, parse both and impute."""
+    raw = df["fuel_consumption_g_km"].astype(str).str.lower()
+    reichweite = raw.str.contains("reichweite", na=False)
+    ev_mask = reichweite & df["fuel_type"].isin(EV_FUELS)
+
+    df["ev_range_km"] = raw.str.extract(r"(\d+)", expand=False).astype(float).where(ev_mask)
+    consumption = df["fuel_consumption_g_km"].where(~(reichweite & df["fuel_type"].isin(["petrol", "diesel"])))
+    consumption = consumption.where(~ev_mask)
+    df["fuel_consumption_g_km"] = pd.to_numeric(consumption.map(clean_number), errors="coerce")
+    df.loc[~df["fuel_type"].isin(EV_FUELS), "ev_range_km"] = 0
+
+    # 0 g/km means unknown, except for electric cars (set back to 0 below).
+    df.loc[df["fuel_consumption_g_km"] == 0, "fuel_consumption_g_km"] = np.nan
+    cap = df["fuel_consumption_g_km"].quantile(EXTREME_QUANTILE)
+    extreme = (df["fuel_consumption_g_km"] > cap).to_numpy()
+    if extreme.any():
+        model_mean = _group_mean_below(df, "fuel_consumption_g_km", ["model"], cap)
+        df.loc[extreme, "fuel_consumption_g_km"] = model_mean[extreme]
+        df = df[~(extreme & np.isnan(model_mean))].copy()
+
+    for keys in (["brand", "model", "year", "fuel_type"], ["brand", "model", "fuel_type"],
+                 ["brand", "fuel_type"], ["fuel_type"]):
+        fill_by_group(df, "fuel_consumption_g_km", keys)
+    df.loc[(df["fuel_type"] == "electric") & df["fuel_consumption_g_km"].isna(), "fuel_consumption_g_km"] = 0
+
+    for keys in (["brand", "model", "year", "fuel_type"], ["brand", "year", "fuel_type"],
+                 ["year", "fuel_type"], ["fuel_type"]):
+        fill_by_group(df, "ev_range_km", keys)
+    return df
+
+
+def clean_power(df):
+    df["power_kw"] = pd.to_numeric(df["power_kw"], errors="coerce")
+    df.loc[df["power_kw"] < MIN_POWER_KW, "power_kw"] = np.nan
+    for keys in (["brand", "model", "year", "fuel_type"], ["brand", "model", "fuel_type"], ["fuel_type"]):
+        fill_by_group(df, "power_kw", keys)
+    return df
+
+
+def clean_mileage(df):
+    df["mileage_in_km"] = pd.to_numeric(df["mileage_in_km"], errors="coerce")
+    cap = df["mileage_in_km"].quantile(EXTREME_QUANTILE)
+    extreme = (df["mileage_in_km"] > cap).to_numpy()
+    if extreme.any():
+        df.loc[extreme, "mileage_in_km"] = _group_mean_below(df, "mileage_in_km", ["model", "year"], cap)[extreme]
+    df.loc[df["mileage_in_km"] < MIN_MILEAGE_KM, "mileage_in_km"] = np.nan
+    fill_by_group(df, "mileage_in_km", ["model", "year"])
+    fill_by_group(df, "mileage_in_km", ["year"])
+    return df
+
+
+def clean_raw(df):
+    """The notebook's cleaning, start to finish; returns a new frame with a fresh index."""
+    df = df.drop(columns=["Unnamed: 0"], errors="ignore")
+    df = df.drop_duplicates(subset=DEDUP_COLS)
+    df = clean_names(df)
+    df = clean_price(df)
+    df = clean_transmission_and_fuel(df.reset_index(drop=True))
+    df = clean_consumption_and_range(df)
+    fill_by_group(df, "color", ["brand", "model", "year"], stat="mode")
+    df["registration_date"] = pd.to_datetime(df["registration_date"], format="%m/%Y", errors="coerce")
+    df = clean_power(df)
+    df = clean_mileage(df)
+    return df.drop(columns=DROP_COLS, errors="ignore").reset_index(drop=True)
@@ -0,0 +1,180 @@
+# ml-old-car-price-prediction/http_client.py
+"""
+Process-wide pooled HTTP client shared by image_agent and vehical_agent.
+
+One urllib3 connection pool (behind a single requests HTTPAdapter) is
+shared by every thread, so connections stay alive between calls. Each
+thread gets its own requests.Session mounted on that adapter, because a
+Session's own state (cookies, headers) is not thread-safe.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+# requests is imported on first use so that importing the agents (and so
+# the Streamlit page) does not pay for it before the first network call.
+if TYPE_CHECKING:
+    import requests
+    from requests.adapters import Retry
+
+# Wikimedia asks for a UA that identifies your app or email/domain
+USER_AGENT = "VehiclePriceApp/1.0 (contact: your-email@example.com)"
+
+
+def _default_retry() -> Retry:
+    from requests.adapters import Retry
+
+    # Same policy image_agent used per session: idempotent requests are
+    # retried on throttling and 5xx with exponential backoff.
+    return Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+
+
+class HostMetrics:
+    """Counters for one host; latencies keep the most recent samples."""
+
+    def __init__(self, window: int = 1024):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latencies: deque = deque(maxlen=window)
+
+    def snapshot(self) -> dict:
+        recent = sorted(self.latencies)
+
+        def pct(p):
+            return recent[min(int(p * len(recent)), len(recent) - 1)] if recent else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "latency_avg": self.latency_total / self.requests if self.requests else None,
+            "latency_p50": pct(0.50),
+            "latency_p99": pct(0.99),
+            "latency_max": self.latency_max,
+        }
+
+
+class HttpClient:
+    def __init__(self, pool_maxsize: int = 32, host_concurrency: int = 8,
+                 timeout: tuple[float, float] = (5.0, 30.0), retry: Retry | None = None,
+                 headers: dict | None = None):
+        self.timeout = timeout
+        self.host_concurrency = host_concurrency
+        self.headers = {"User-Agent": USER_AGENT, **(headers or {})}
+        from requests.adapters import HTTPAdapter
+
+        self._adapter = HTTPAdapter(
+            pool_connections=16, pool_maxsize=pool_maxsize, max_retries=retry or _default_retry()
+        )
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._host_limits: dict[str, threading.BoundedSemaphore] = {}
+        self._host_overrides: dict[str, int] = {}
+        self._metrics: dict[str, HostMetrics] = defaultdict(HostMetrics)
+
+    # -- plumbing --
+    def _session(self) -> requests.Session:
+        s = getattr(self._local, "session", None)
+        if s is None:
+            import requests
+
+            s = requests.Session()
+            s.headers.update(self.headers)
+            s.mount("https://", self._adapter)
+            s.mount("http://", self._adapter)
+            self._local.session = s
+        return s
+
+    def set_host_limit(self, host: str, limit: int) -> None:
+        """Cap concurrent in-flight requests to one host (before first use)."""
+        with self._lock:
+            self._host_overrides[host] = limit
+            self._host_limits.pop(host, None)
+
+    @contextmanager
+    def _host_slot(self, host: str):
+        with self._lock:
+            sem = self._host_limits.get(host)
+            if sem is None:
+                sem = self._host_limits[host] = threading.BoundedSemaphore(
+                    self._host_overrides.get(host, self.host_concurrency)
+                )
+        with sem:
+            yield
+
+    def _record(self, host: str, elapsed: float, response: requests.Response | None, stream: bool) -> None:
+        retries = 0
+        size = 0
+        if response is not None:
+            history = getattr(getattr(response.raw, "retries", None), "history", None)
+            retries = len(history) if history else 0
+            if stream:
+                size = int(response.headers.get("Content-Length") or 0)
+            else:
+                size = len(response.content)
+        with self._lock:
+            m = self._metrics[host]
+            m.requests += 1
+            m.errors += response is None or response.status_code >= 400
+            m.retries += retries
+            m.bytes += size
+            m.latency_total += elapsed
+            m.latency_max = max(m.latency_max, elapsed)
+            m.latencies.append(elapsed)
+
+    # -- public API --
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        stream = kwargs.get("stream", False)
+        with self._host_slot(host):
+            start = time.perf_counter()
+            response = None
+            try:
+                response = self._session().request(method, url, **kwargs)
+                return response
+            finally:
+                self._record(host, time.perf_counter() - start, response, stream)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def metrics(self) -> dict:
+        """Per-host request counts, retries, bytes and latency (seconds)."""
+        with self._lock:
+            return {host: m.snapshot() for host, m in self._metrics.items()}
+
+
+_client: HttpClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """The process-wide client, configured from the environment on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient(
+                    pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", "32")),
+                    host_concurrency=int(os.getenv("HTTP_HOST_CONCURRENCY", "8")),
+                    timeout=(
+                        float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+                        float(os.getenv("HTTP_READ_TIMEOUT", "30")),
+                    ),
+                )
+    return _client
@@ -1,22 +1,39 @@
 # image_agent.py
 from __future__ import annotations
+import json
+import logging
+import os
 import re
-import requests
-from requests.adapters import HTTPAdapter, Retry
-
-WIKI_API = "https://en.wikipedia.org/w/api.php"
-COMMONS_API = "https://commons.wikimedia.org/w/api.php"
-
-# -------- shared http session with retries + user-agent ----------
-def _session() -> requests.Session:
-    s = requests.Session()
-    s.headers.update({
-        # Wikimedia asks for a UA that identifies your app or email/domain
-        "User-Agent": "VehiclePriceApp/1.0 (contact: your-email@example.com)"
-    })
-    retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
-    s.mount("https://", HTTPAdapter(max_retries=retries))
-    return s
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import profiling
+from cache import TieredCache
+from http_client import HttpClient, get_client
+
+logger = logging.getLogger(__name__)
+
+# Overridable so a local stub server can stand in for Wikimedia.
+WIKI_API = os.getenv("WIKI_API_URL", "https://en.wikipedia.org/w/api.php")
+COMMONS_API = os.getenv("COMMONS_API_URL", "https://commons.wikimedia.org/w/api.php")
+
+# -------- gallery cache: in-memory LRU + SQLite, keyed on the request ----------
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", os.path.join(".cache", "image_gallery.sqlite3"))
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+
+_gallery_cache: TieredCache | None = None
+_gallery_cache_lock = threading.Lock()
+
+def gallery_cache() -> TieredCache:
+    """The gallery cache, opened (and its SQLite file created) on first use."""
+    global _gallery_cache
+    if _gallery_cache is None:
+        with _gallery_cache_lock:
+            if _gallery_cache is None:
+                _gallery_cache = TieredCache.open(IMAGE_CACHE_PATH, maxsize=256, ttl=IMAGE_CACHE_TTL or None)
+    return _gallery_cache
+
+# Independent queries within a fallback stage run on this pool.
+_query_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="image-query")
 
 # -------------------- helpers --------------------
 def _year_score(title: str, year: int | None) -> int:
@@ -34,7 +51,7 @@ def _norm(s: str) -> str:
     return s.replace("_", " ").strip()
 
 # -------------------- wikipedia search paths --------------------
-def _wikipedia_thumbnails(session: requests.Session, query: str, limit: int) -> list[dict]:
+def _wikipedia_thumbnails(session: HttpClient, query: str, limit: int) -> list[dict]:
     """Use pageimages thumbnails from search results."""
     params = {
         "action": "query",
@@ -63,7 +80,7 @@ def _wikipedia_thumbnails(session: requests.Session, query: str, limit: int) ->
             })
     return out
 
-def _wikipedia_page_images(session: requests.Session, title: str, limit: int) -> list[dict]:
+def _wikipedia_page_images(session: HttpClient, title: str, limit: int) -> list[dict]:
     """
     Fetch images listed on a specific page (prop=images -> imageinfo).
     """
@@ -104,7 +121,7 @@ def _wikipedia_page_images(session: requests.Session, title: str, limit: int) ->
     return out[:limit]
 
 # -------------------- commons search paths --------------------
-def _commons_search(session: requests.Session, query: str, limit: int) -> list[dict]:
+def _commons_search(session: HttpClient, query: str, limit: int) -> list[dict]:
     params = {
         "action": "query", "format": "json", "origin": "*",
         "generator": "search", "gsrnamespace": 6,  # files
@@ -126,7 +143,7 @@ def _commons_search(session: requests.Session, query: str, limit: int) -> list[d
             out.append({"thumb": thumb, "url": url, "title": p.get("title", "")})
     return out[:limit]
 
-def _commons_category_members(session: requests.Session, category: str, limit: int) -> list[dict]:
+def _commons_category_members(session: HttpClient, category: str, limit: int) -> list[dict]:
     """
     Try a category like 'Category:Toyota Corolla (E210)'.
     """
@@ -160,77 +177,103 @@ def _commons_category_members(session: requests.Session, category: str, limit: i
     return out[:limit]
 
 # -------------------- main entry --------------------
+def _merge(results: list[dict], seen: set, items: list[dict]) -> None:
+    """Append items not seen yet (dedup by thumb), keeping their order."""
+    for item in items:
+        k = item["thumb"]
+        if k not in seen:
+            seen.add(k)
+            results.append(item)
+
+def _run_stage(session: HttpClient, fetch, queries: list[str], results: list[dict],
+               seen: set, limit: int, shrinking: bool = True) -> None:
+    """
+    Run one fallback stage's queries concurrently, then merge them in query
+    order the way the sequential loop did: stop after the query that fills
+    the gallery and, for shrinking stages, let each query contribute only
+    the slots still open when its turn comes. A query that fails counts
+    as having found nothing, so the others in the stage still contribute.
+    """
+    ask = limit - len(results) if shrinking else limit
+    futures = [_query_pool.submit(fetch, session, q, ask) for q in queries]
+    try:
+        for q, fut in zip(queries, futures):
+            try:
+                items = fut.result()
+            except Exception as e:
+                logger.warning("Image query %r failed: %s", q, e)
+                items = []
+            if shrinking:
+                items = items[: limit - len(results)]
+            _merge(results, seen, items)
+            if len(results) >= limit:
+                break
+    finally:
+        for fut in futures:
+            fut.cancel()
+
+def _cache_key(brand: str, model: str, year: int | None, limit: int) -> str:
+    return json.dumps(["gallery", brand, model, int(year) if year else None, int(limit)])
+
+@profiling.instrument("gallery.fetch")
 def fetch_model_images(brand: str, model: str, year: int | None = None, limit: int = 12) -> list[dict]:
     """
     Returns a list of {thumb, url, title}. Always tries multiple sources.
     Year is used for ranking (not filtering) so you still get results.
+    Results are cached (memory + disk) per (brand, model, year, limit).
     """
     if not brand or not model:
         return []
 
+    key = _cache_key(brand, model, year, limit)
+    cached = gallery_cache().get(key)
+    if cached is not None:
+        return [dict(item) for item in cached]
+
+    results = _fetch_model_images(brand, model, year, limit)
+    if results:  # an empty gallery is usually a transient failure; retry next time
+        gallery_cache().set(key, [dict(item) for item in results])
+    return results
+
+@profiling.instrument("gallery.search")
+def _fetch_model_images(brand: str, model: str, year: int | None, limit: int) -> list[dict]:
     brand = _norm(brand)
     model = _norm(model)
     base = f"{brand} {model}"
 
-    s = _session()
+    s = get_client()
     seen = set()
     results: list[dict] = []
 
     # 1) Wikipedia thumbnails (fast)
-    for q in [
+    _run_stage(s, _wikipedia_thumbnails, [
         f'{base} car {year or ""}'.strip(),
         f"{base} (car)",
         f"{base} exterior",
         base,
-    ]:
-        for item in _wikipedia_thumbnails(s, q, limit):
-            k = item["thumb"]
-            if k not in seen:
-                seen.add(k)
-                results.append(item)
-        if len(results) >= limit:
-            break
+    ], results, seen, limit, shrinking=False)
 
     # 2) Wikipedia page images (from the best matching page title)
     if len(results) < limit:
         # try the main article title (best hit); fallback to base
         page_title = results[0]["title"] if results else base
-        for item in _wikipedia_page_images(s, page_title, limit=(limit - len(results))):
-            k = item["thumb"]
-            if k not in seen:
-                seen.add(k)
-                results.append(item)
+        _merge(results, seen, _wikipedia_page_images(s, page_title, limit=(limit - len(results))))
 
     # 3) Commons search
     if len(results) < limit:
-        for q in [
+        _run_stage(s, _commons_search, [
             f'{base} {year or ""} front OR side',
             f"{base} car",
             base,
-        ]:
-            for item in _commons_search(s, q, limit=(limit - len(results))):
-                k = item["thumb"]
-                if k not in seen:
-                    seen.add(k)
-                    results.append(item)
-            if len(results) >= limit:
-                break
+        ], results, seen, limit)
 
     # 4) Commons category guesses (helps for well-organized models)
     if len(results) < limit:
-        guesses = [
+        _run_stage(s, _commons_category_members, [
             f"Category:{base}",
             f"Category:{brand} {model} (car)",
             f"Category:{brand} {model} (automobile)",
-        ]
-        for cat in guesses:
-            for item in _commons_category_members(s, cat, limit=(limit - len(results))):
-                k = item["thumb"]
-                if k not in seen:
-                    seen.add(k)
-                    results.append(item)
-            if len(results) >= limit:
-                break
+        ], results, seen, limit)
 
     # Rank by year proximity (do not filter)
     if year:
@@ -0,0 +1,111 @@
+# ml-old-car-price-prediction/inference_engine.py
+"""
+Direct booster inference for prediction_helper.
+
+XGBRegressor.predict re-checks feature names and converts the DataFrame it
+is given on every call. BoosterEngine keeps the underlying Booster and
+calls inplace_predict on a C-contiguous float32 array already laid out in
+feature_order, with feature validation off: instead, the engine checks
+feature_order against the model's feature names once, when it is built.
+
+Configured from the environment:
+    INFERENCE_ENGINE           booster (default) | compiled: use the NumPy tree
+                               evaluator from tree_compiler when
+                               artifacts/compiled_trees matches the model
+    INFERENCE_NTHREAD          threads per predict call (default: leave the booster's setting)
+    INFERENCE_ITERATION_RANGE  "start:end" boosting rounds to use (default: the
+                               wrapper's choice, i.e. best_iteration when the
+                               model was trained with early stopping, else all)
+
+With the default iteration range the outputs are identical to
+model.predict: XGBoost stores features as float32 either way, and
+float64 → float32 rounding is the same in NumPy and in XGBoost. Setting
+INFERENCE_ITERATION_RANGE deliberately changes the predictions.
+"""
+from __future__ import annotations
+
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_iteration_range(value: str | None) -> tuple[int, int] | None:
+    if not value:
+        return None
+    start, _, end = value.partition(":")
+    return int(start or 0), int(end or 0)
+
+
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "booster")
+INFERENCE_NTHREAD = int(os.getenv("INFERENCE_NTHREAD", "0")) or None
+INFERENCE_ITERATION_RANGE = _parse_iteration_range(os.getenv("INFERENCE_ITERATION_RANGE"))
+
+
+def as_features(features) -> np.ndarray:
+    """A C-contiguous float32 (rows, n_features) view or copy of features."""
+    if hasattr(features, "to_numpy"):
+        features = features.to_numpy(dtype=np.float32)
+    return np.ascontiguousarray(features, dtype=np.float32)
+
+
+class BoosterEngine:
+    """
+    Wraps an XGBRegressor's Booster for inplace_predict.
+
+    Built once per artifact version and warmed with a dummy prediction so
+    the first request does not pay for the predictor's lazy setup. Raises
+    ValueError if the model was trained on other features than
+    feature_order.
+    Predictions are thread-safe (gbtree / dart boosters).
+    """
+
+    def __init__(self, model, feature_order, nthread: int | None = INFERENCE_NTHREAD,
+                 iteration_range: tuple[int, int] | None = INFERENCE_ITERATION_RANGE):
+        self.booster = model.get_booster()
+        if self.booster.feature_names and list(self.booster.feature_names) != list(feature_order):
+            raise ValueError("model feature names do not match feature_order")
+        self.n_features = len(feature_order)
+        self.missing = getattr(model, "missing", np.nan)
+        if hasattr(model, "_get_iteration_range"):
+            self.iteration_range = model._get_iteration_range(iteration_range)
+        else:
+            self.iteration_range = iteration_range or (0, 0)
+        if nthread:
+            self.booster.set_param({"nthread": nthread})
+        self.predict(np.zeros((1, self.n_features), dtype=np.float32))
+
+    def predict(self, features) -> np.ndarray:
+        """float32 predictions for a (rows, n_features) array or frame in feature_order."""
+        return self.booster.inplace_predict(
+            as_features(features),
+            iteration_range=self.iteration_range,
+            missing=self.missing,
+            validate_features=False,
+        )
+
+    def contributions(self, features) -> np.ndarray:
+        """
+        Per-feature contributions (TreeSHAP, pred_contribs) as a float32
+        (rows, n_features + 1) array; the last column is the bias. Each row
+        sums to its prediction up to float32 rounding.
+        """
+        from xgboost import DMatrix
+
+        data = DMatrix(as_features(features), missing=self.missing)
+        return self.booster.predict(data, pred_contribs=True, iteration_range=self.iteration_range,
+                                    validate_features=False)
+
+
+def build_engine(registry):
+    """The engine for a registry: compiled trees if selected and current, else the booster engine."""
+    if INFERENCE_ENGINE == "compiled":
+        from tree_compiler import load_for
+
+        trees = load_for(registry.root, registry.get("feature_order"))
+        if trees is not None:
+            return trees
+        logger.warning("No compiled trees for the model in %s; using the booster", registry.root)
+    return registry.get("booster_engine")
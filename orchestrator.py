@@ -0,0 +1,163 @@
+# ml-old-car-price-prediction/orchestrator.py
+"""
+Background tasks for one page render.
+
+main.py shows the price as soon as predict() returns and hands the slow,
+independent work (the insight report and the model gallery) to a shared
+thread pool. The page then polls TaskGroup.events() and fills each section
+in as its results arrive.
+
+A TaskGroup belongs to one set of inputs. When the inputs change,
+TaskGroup.for_inputs cancels the old group: queued tasks never start and
+streams stop at their next chunk. A plain task that is already running
+(the gallery fetch) finishes in the background, and its result lands in
+the gallery cache. A stream that is cancelled or times out is closed and
+caches nothing, so that insight report is requested again next time.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator, MutableMapping
+from concurrent.futures import Future, ThreadPoolExecutor
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PAGE_TASK_WORKERS", "16")), thread_name_prefix="page-task"
+)
+
+
+class Task:
+    """A function call in the pool with a deadline."""
+
+    def __init__(self, fn: Callable, args: tuple, timeout: float):
+        self.deadline = time.monotonic() + timeout
+        self.future: Future = _executor.submit(fn, *args)
+
+    def reusable(self) -> bool:
+        if self.future.cancelled():
+            return False
+        if self.future.done():
+            return self.future.exception() is None
+        return time.monotonic() < self.deadline
+
+    def poll(self, cursor: int) -> tuple[list, int, bool]:
+        """(events, cursor, finished); events are (kind, value) pairs."""
+        if self.future.done():
+            error = None if self.future.cancelled() else self.future.exception()
+            return [("error", error) if error else ("result", self.future.result())], cursor, True
+        if time.monotonic() >= self.deadline:
+            self.cancel()
+            return [("timeout", None)], cursor, True
+        return [], cursor, False
+
+    def cancel(self) -> None:
+        self.future.cancel()
+
+
+class StreamTask:
+    """
+    Drains a generator in the pool. Chunks are kept, so every poller (for
+    example a rerun with the same inputs) can replay them from the start.
+    """
+
+    def __init__(self, make_stream: Callable[[], Iterator[str]], timeout: float):
+        self.deadline = time.monotonic() + timeout
+        self.chunks: list[str] = []
+        self.error: BaseException | None = None
+        self.done = False
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self.future: Future = _executor.submit(self._run, make_stream)
+
+    def _run(self, make_stream) -> None:
+        stream = None
+        try:
+            stream = make_stream()
+            for chunk in stream:
+                if self._cancelled.is_set():
+                    break
+                with self._lock:
+                    self.chunks.append(chunk)
+        except Exception as e:
+            self.error = e
+        finally:
+            if stream is not None:
+                stream.close()
+            with self._lock:
+                self.done = True
+
+    def reusable(self) -> bool:
+        if self._cancelled.is_set() or self.error is not None:
+            return False
+        return self.done or time.monotonic() < self.deadline
+
+    def poll(self, cursor: int) -> tuple[list, int, bool]:
+        with self._lock:
+            events = [("chunk", chunk) for chunk in self.chunks[cursor:]]
+            cursor = len(self.chunks)
+            done = self.done
+        if done:
+            events.append(("error", self.error) if self.error else ("done", None))
+            return events, cursor, True
+        if time.monotonic() >= self.deadline:
+            self.cancel()
+            events.append(("timeout", None))
+            return events, cursor, True
+        return events, cursor, False
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self.future.cancel()
+
+
+class TaskGroup:
+    """Named tasks started for one input signature."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.tasks: dict[str, Task | StreamTask] = {}
+
+    @classmethod
+    def for_inputs(cls, state: MutableMapping, key: str, slot: str = "page_tasks") -> "TaskGroup":
+        """The group stored in state for key, cancelling one left from other inputs."""
+        group = state.get(slot)
+        if group is None or group.key != key:
+            if group is not None:
+                group.cancel()
+            group = state[slot] = cls(key)
+        return group
+
+    def submit(self, name: str, fn: Callable, *args, timeout: float) -> Task:
+        """Run fn(*args) in the pool, reusing a running or successful task of the same name."""
+        task = self.tasks.get(name)
+        if task is None or not task.reusable():
+            task = self.tasks[name] = Task(fn, args, timeout)
+        return task
+
+    def stream(self, name: str, make_stream: Callable[[], Iterator[str]], timeout: float) -> StreamTask:
+        """Drain make_stream() in the pool, reusing a live or finished stream of the same name."""
+        task = self.tasks.get(name)
+        if task is None or not task.reusable():
+            task = self.tasks[name] = StreamTask(make_stream, timeout)
+        return task
+
+    def events(self, names: list[str], poll_interval: float = 0.05) -> Iterator[tuple[str, str, object]]:
+        """
+        Yield (name, kind, value) as the named tasks progress, until all are
+        finished. kind is "chunk", "done", "result", "error" or "timeout".
+        """
+        cursors = dict.fromkeys(names, 0)
+        while cursors:
+            for name in list(cursors):
+                events, cursors[name], finished = self.tasks[name].poll(cursors[name])
+                for kind, value in events:
+                    yield name, kind, value
+                if finished:
+                    del cursors[name]
+            if cursors:
+                time.sleep(poll_interval)
+
+    def cancel(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
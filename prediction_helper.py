@@ -1,137 +1,742 @@
-# ml-old-car-price-prediction/prediction_helper.py
-import pandas as pd
-import numpy as np
-import joblib
-
-# -----------------------
-# Load trained artifacts
-# -----------------------
-model = joblib.load("artifacts/model.joblib")
-log_scaler = joblib.load("artifacts/log_scaler.joblib")
-direct_scaler = joblib.load("artifacts/direct_scaler.joblib")
-log_transformer = joblib.load("artifacts/log_transformer.joblib")
-model_target_mapping = pd.read_csv("artifacts/model_target_mapping.csv")
-
-try:
-    feature_order = joblib.load("artifacts/feature_order.joblib")
-except:
-    feature_order = model.get_booster().feature_names
-
-# -----------------------
-# Reference Tables
-# -----------------------
-currency_rates = {
-    "EUR": 1.0, "USD": 1.07, "GBP": 0.86,
-    "LKR": 355.0, "INR": 89.0, "JPY": 158.0
-}
-
-fuel_co2 = {
-    "petrol": 2392, "diesel": 2640, "lpg": 1660,
-    "ethanol": 1510, "hybrid": 2000,
-    "electric": 0, "hydrogen": 0
-}
-
-# -----------------------
-# Preprocessing Functions
-# -----------------------
-def feature_engineering(df, data_collection_year=2023):
-    df["vehicle_manufacturing_age"] = data_collection_year - df["year"].astype(int)
-    df["registration_date"] = pd.to_datetime(df["registration_date"])
-    df["registration_month"] = df["registration_date"].dt.month
-    df["registration_year"] = df["registration_date"].dt.year
-    df["vehicle_registration_age"] = data_collection_year - df["registration_year"]
-
-    df["reg_month_sin"] = np.sin(2 * np.pi * df["registration_month"] / 12)
-    df["reg_month_cos"] = np.cos(2 * np.pi * df["registration_month"] / 12)
-
-    df["mileage_per_year"] = df.apply(
-        lambda row: row["mileage_in_km"] / row["vehicle_registration_age"]
-        if row["vehicle_registration_age"] > 0 else row["mileage_in_km"], axis=1
-    ).round(2)
-
-    df = df.drop(columns=["registration_date", "registration_month", "registration_year", "year"])
-    return df
-
-
-def model_map_enc(df):
-    global_mean = model_target_mapping['model_target_enc'].mean()
-    mapping_dict = model_target_mapping.set_index(['brand', 'model'])['model_target_enc'].to_dict()
-    df['model_target_enc'] = df.apply(
-        lambda row: mapping_dict.get((row['brand'], row['model']), global_mean), axis=1
-    )
-    df = df.drop(columns=['model'], axis=1)
-    return df
-
-
-def hot_encoding(df):
-    # (same code as your current version)
-    required_columns = [
-        'brand_aston-martin', 'brand_audi', 'brand_bentley',
-        'brand_bmw', 'brand_cadillac', 'brand_chevrolet', 'brand_chrysler',
-        'brand_citroen', 'brand_dacia', 'brand_daewoo', 'brand_daihatsu',
-        'brand_dodge', 'brand_ferrari', 'brand_fiat', 'brand_ford',
-        'brand_honda', 'brand_hyundai', 'brand_infiniti', 'brand_isuzu',
-        'brand_jaguar', 'brand_jeep', 'brand_kia', 'brand_lada',
-        'brand_lamborghini', 'brand_lancia', 'brand_land-rover',
-        'brand_maserati', 'brand_mazda', 'color_black', 'color_blue',
-        'color_bronze', 'color_brown', 'color_gold', 'color_green',
-        'color_grey', 'color_orange', 'color_red', 'color_silver',
-        'color_violet', 'color_white', 'color_yellow',
-        'transmission_type_manual', 'transmission_type_semi-automatic',
-        'fuel_type_diesel', 'fuel_type_diesel_hybrid', 'fuel_type_electric',
-        'fuel_type_ethanol', 'fuel_type_hybrid', 'fuel_type_hydrogen',
-        'fuel_type_lpg', 'fuel_type_petrol'
-    ]
-
-    for col in required_columns:
-        if col not in df.columns:
-            df[col] = 0
-
-    # one-hot assignments...
-    # (reuse your existing implementation here)
-    return df
-
-
-def handle_scaling(df):
-    log_scale_cols = ["power_kw", "fuel_consumption_g_km", "mileage_in_km"]
-    direct_scale_cols = ["ev_range_km", "vehicle_manufacturing_age", "vehicle_registration_age"]
-
-    df[log_scale_cols] = log_scaler.transform(
-        log_transformer.transform(df[log_scale_cols])
-    )
-    df[direct_scale_cols] = direct_scaler.transform(df[direct_scale_cols])
-    return df
-
-
-def preprocess_user_input(input_dict):
-    df = pd.DataFrame([input_dict])
-
-    # --- HP → kW ---
-    df["power_kw"] = df["power_hp"] * 0.7355
-    df.drop("power_hp", axis=1, inplace=True)
-
-    # --- km/L → g/km ---
-    fuel_type = df.loc[0, "fuel_type"].lower()
-    if "fuel_efficiency" in df.columns:
-        eff = df.loc[0, "fuel_efficiency"]
-        g_per_liter = fuel_co2.get(fuel_type, 0)
-        df["fuel_consumption_g_km"] = g_per_liter / eff if eff > 0 else 0
-        df.drop("fuel_efficiency", axis=1, inplace=True)
-
-    df = feature_engineering(df)
-    df = model_map_enc(df)
-    df = hot_encoding(df)
-    df = handle_scaling(df)
-
-    return df
-
-
-def predict(input_dict):
-    currency = input_dict.get("currency", "EUR")
-    processed_df = preprocess_user_input(input_dict)
-    processed_df = processed_df[feature_order]
-
-    prediction_eur = model.predict(processed_df)[0]
-    rate = currency_rates.get(currency, 1.0)
-    converted_price = prediction_eur * rate
-    return float(converted_price), float(prediction_eur)
\ No newline at end of file
+# ml-old-car-price-prediction/prediction_helper.py
+import datetime
+import os
+import threading
+from collections import Counter
+
+import pandas as pd
+import numpy as np
+
+import profiling
+from artifact_registry import ArtifactStore
+from cache import LRUTTLCache
+import price_table as _price_table
+import quantile_model as _quantile_model
+from inference_engine import BoosterEngine, as_features, build_engine
+
+# -----------------------
+# Reference Tables
+# -----------------------
+currency_rates = {
+    "EUR": 1.0, "USD": 1.07, "GBP": 0.86,
+    "LKR": 355.0, "INR": 89.0, "JPY": 158.0
+}
+
+LOG_SCALE_COLS = ["power_kw", "fuel_consumption_g_km", "mileage_in_km"]
+DIRECT_SCALE_COLS = ["ev_range_km", "vehicle_manufacturing_age", "vehicle_registration_age"]
+DATA_COLLECTION_YEAR = 2023
+
+fuel_co2 = {
+    "petrol": 2392, "diesel": 2640, "lpg": 1660,
+    "ethanol": 1510, "hybrid": 2000,
+    "electric": 0, "hydrogen": 0
+}
+
+ONEHOT_FIELDS = ["brand", "color", "transmission_type", "fuel_type"]
+
+# Numeric inputs price_sweep() can vary, and the feature columns each one feeds.
+SWEEP_FIELDS = {
+    "mileage_in_km": {"mileage_in_km", "mileage_per_year"},
+    "power_hp": {"power_kw"},
+    "fuel_efficiency": {"fuel_consumption_g_km"},
+    "ev_range_km": {"ev_range_km"},
+    "year": {"vehicle_manufacturing_age"},
+    "registration_date": {"vehicle_registration_age", "reg_month_sin", "reg_month_cos", "mileage_per_year"},
+}
+
+# Feature columns behind each numeric input, for grouping explain() output.
+# mileage_per_year also depends on the registration date; it is credited to
+# mileage, the input it measures. The one-hot flags of ONEHOT_FIELDS are
+# grouped under their field, and the model target encoding under "model".
+EXPLAIN_GROUPS = {
+    "model": {"model_target_enc"},
+    "mileage_in_km": {"mileage_in_km", "mileage_per_year"},
+    "power_hp": {"power_kw"},
+    "fuel_efficiency": {"fuel_consumption_g_km"},
+    "ev_range_km": {"ev_range_km"},
+    "year": {"vehicle_manufacturing_age"},
+    "registration_date": {"vehicle_registration_age", "reg_month_sin", "reg_month_cos"},
+}
+
+ONEHOT_COLUMNS = [
+    'brand_aston-martin', 'brand_audi', 'brand_bentley',
+    'brand_bmw', 'brand_cadillac', 'brand_chevrolet', 'brand_chrysler',
+    'brand_citroen', 'brand_dacia', 'brand_daewoo', 'brand_daihatsu',
+    'brand_dodge', 'brand_ferrari', 'brand_fiat', 'brand_ford',
+    'brand_honda', 'brand_hyundai', 'brand_infiniti', 'brand_isuzu',
+    'brand_jaguar', 'brand_jeep', 'brand_kia', 'brand_lada',
+    'brand_lamborghini', 'brand_lancia', 'brand_land-rover',
+    'brand_maserati', 'brand_mazda', 'color_black', 'color_blue',
+    'color_bronze', 'color_brown', 'color_gold', 'color_green',
+    'color_grey', 'color_orange', 'color_red', 'color_silver',
+    'color_violet', 'color_white', 'color_yellow',
+    'transmission_type_manual', 'transmission_type_semi-automatic',
+    'fuel_type_diesel', 'fuel_type_diesel_hybrid', 'fuel_type_electric',
+    'fuel_type_ethanol', 'fuel_type_hybrid', 'fuel_type_hydrogen',
+    'fuel_type_lpg', 'fuel_type_petrol'
+]
+
+# Categories dropped as the drop_first baseline during training: valid
+# inputs that are encoded as all flags zero.
+ONEHOT_REFERENCE = {
+    "brand": {"alfa-romeo"},
+    "color": {"beige"},
+    "transmission_type": {"automatic"},
+    "fuel_type": {"cng"},
+}
+
+
+# data_cleaning.clean_names writes "-" between the words of a model name,
+# while data/catalog.json (and so the app) uses "_"; the target encoding
+# treats the two alike.
+def model_key(model):
+    return str(model).replace("_", "-")
+
+
+def _model_keys(models):
+    return models.astype(str).str.replace("_", "-", regex=False)
+
+
+def _build_onehot_index(columns, feature_order):
+    """Map {field: {value: position in onehot_columns}} for columns the model uses."""
+    known = set(feature_order)
+    used = [c for c in columns if c in known]
+    index = {field: {} for field in ONEHOT_FIELDS}
+    for pos, col in enumerate(used):
+        field = max((f for f in ONEHOT_FIELDS if col.startswith(f + "_")), key=len)
+        index[field][col[len(field) + 1:]] = pos
+    return used, index
+
+
+def _build_explain_groups(feature_order, onehot_index):
+    """
+    (names, matrix) mapping pred_contribs columns (features, then the bias)
+    onto inputs: contributions @ matrix sums each input's features. The
+    bias becomes "base"; features no input accounts for become "other".
+    """
+    owner = {col: group for group, cols in EXPLAIN_GROUPS.items() for col in cols}
+    for field in ONEHOT_FIELDS:
+        for value in onehot_index[field]:
+            owner[f"{field}_{value}"] = field
+    groups = [owner.get(col, "other") for col in feature_order]
+    names = [f for f in ONEHOT_FIELDS + list(EXPLAIN_GROUPS) + ["other"] if f in groups] + ["base"]
+    matrix = np.zeros((len(groups) + 1, len(names)))
+    matrix[np.arange(len(groups)), [names.index(g) for g in groups]] = 1.0
+    matrix[-1, -1] = 1.0
+    return names, matrix
+
+
+unknown_category_counts = Counter()
+_unknown_lock = threading.Lock()
+
+# -----------------------
+# Trained artifacts (loaded lazily on first use, hot-swappable)
+# -----------------------
+artifacts = ArtifactStore()
+
+# Brand/model target encoding, indexed once so lookups are a single
+# vectorized get_indexer call instead of a per-row dict lookup. Model names
+# are keyed through model_key on both sides.
+artifacts.register("model_target_index", lambda a: (
+    a.get("model_target_mapping").assign(model=lambda m: _model_keys(m["model"]))
+    .set_index(["brand", "model"])["model_target_enc"]
+))
+artifacts.register("model_target_global_mean", lambda a: (
+    a.get("model_target_mapping")["model_target_enc"].mean()
+))
+artifacts.register("onehot_columns", lambda a: _build_onehot_index(ONEHOT_COLUMNS, a.get("feature_order"))[0])
+artifacts.register("onehot_index", lambda a: _build_onehot_index(ONEHOT_COLUMNS, a.get("feature_order"))[1])
+artifacts.register("compiled_encoder", lambda a: CompiledEncoder(
+    a.get("feature_order"), a.get("log_transformer"), a.get("log_scaler"), a.get("direct_scaler"),
+    a.get("model_target_index"), a.get("model_target_global_mean"),
+    a.get("onehot_columns"), a.get("onehot_index"),
+))
+# Called with float32 rows in feature_order: the booster's inplace_predict,
+# or the compiled NumPy trees with INFERENCE_ENGINE=compiled.
+artifacts.register("booster_engine", lambda a: BoosterEngine(a.get("model"), a.get("feature_order")))
+artifacts.register("engine", build_engine)
+artifacts.register("explain_groups", lambda a: _build_explain_groups(a.get("feature_order"), a.get("onehot_index")))
+# Optional multi-quantile model (quantile_model.py) for prediction intervals.
+artifacts.register("quantile_model", lambda a: _quantile_model.load(a.root))
+artifacts.register("quantile_engine", lambda a: (
+    BoosterEngine(a.get("quantile_model"), a.get("feature_order")) if a.get("quantile_model") is not None else None
+))
+# Precomputed catalog prices (price_table.py); None until the table is built.
+artifacts.register("price_table", lambda a: _price_table.load_for(a.root))
+
+# Names that used to be module globals, resolved through the registry.
+_ARTIFACT_ATTRS = {
+    "model", "log_scaler", "direct_scaler", "log_transformer", "model_target_mapping",
+    "feature_order", "model_target_index", "model_target_global_mean",
+    "onehot_columns", "onehot_index", "compiled_encoder", "engine", "price_table",
+    "quantile_model", "quantile_engine", "booster_engine", "explain_groups",
+}
+
+
+def __getattr__(name):
+    if name in _ARTIFACT_ATTRS:
+        return artifacts.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# -----------------------
+# Preprocessing Functions
+# -----------------------
+@profiling.instrument("feature_engineering")
+def feature_engineering(df, data_collection_year=DATA_COLLECTION_YEAR):
+    df["vehicle_manufacturing_age"] = data_collection_year - df["year"].astype(int)
+    df["registration_date"] = pd.to_datetime(df["registration_date"])
+    df["registration_month"] = df["registration_date"].dt.month
+    df["registration_year"] = df["registration_date"].dt.year
+    df["vehicle_registration_age"] = data_collection_year - df["registration_year"]
+
+    df["reg_month_sin"] = np.sin(2 * np.pi * df["registration_month"] / 12)
+    df["reg_month_cos"] = np.cos(2 * np.pi * df["registration_month"] / 12)
+
+    mileage = df["mileage_in_km"]
+    reg_age = df["vehicle_registration_age"]
+    df["mileage_per_year"] = (mileage / reg_age).where(reg_age > 0, mileage).round(2)
+
+    df = df.drop(columns=["registration_date", "registration_month", "registration_year", "year"])
+    return df
+
+
+@profiling.instrument("model_map_enc")
+def model_map_enc(df, registry=None):
+    registry = registry or artifacts.current()
+    model_target_index = registry.get("model_target_index")
+    model_target_global_mean = registry.get("model_target_global_mean")
+    keys = pd.MultiIndex.from_arrays([df["brand"], _model_keys(df["model"])])
+    positions = model_target_index.index.get_indexer(keys)
+    known = model_target_index.to_numpy()[positions]
+    df["model_target_enc"] = np.where(positions >= 0, known, model_target_global_mean)
+    df = df.drop(columns=["model"])
+    return df
+
+
+def _record_unknown_categories(field, values):
+    with _unknown_lock:
+        unknown_category_counts.update((field, v) for v in values)
+
+
+@profiling.instrument("hot_encoding")
+def hot_encoding(df, registry=None):
+    """
+    Set the one-hot flags for brand, color, transmission and fuel.
+
+    Values are looked up in onehot_index and written into the flag block in
+    one fancy-indexing assignment per field. Reference categories leave all
+    flags at zero; any other unmatched value does too, but is counted in
+    unknown_category_counts.
+    """
+    registry = registry or artifacts.current()
+    onehot_columns = registry.get("onehot_columns")
+    onehot_index = registry.get("onehot_index")
+    block = np.zeros((len(df), len(onehot_columns)), dtype=np.int8)
+    for field, positions in onehot_index.items():
+        if field not in df.columns:
+            continue
+        values = df[field].astype(str).str.lower().to_numpy()
+        codes = pd.Series(values).map(positions).to_numpy()
+        matched = ~pd.isna(codes)
+        block[np.flatnonzero(matched), codes[matched].astype(np.intp)] = 1
+
+        unknown = ~matched & ~np.isin(values, list(ONEHOT_REFERENCE.get(field, ())))
+        if unknown.any():
+            _record_unknown_categories(field, values[unknown])
+
+    flags = pd.DataFrame(block, columns=onehot_columns, index=df.index)
+    return pd.concat([df.drop(columns=onehot_columns, errors="ignore"), flags], axis=1)
+
+
+@profiling.instrument("handle_scaling")
+def handle_scaling(df, registry=None):
+    registry = registry or artifacts.current()
+    df[LOG_SCALE_COLS] = registry.get("log_scaler").transform(
+        registry.get("log_transformer").transform(df[LOG_SCALE_COLS])
+    )
+    df[DIRECT_SCALE_COLS] = registry.get("direct_scaler").transform(df[DIRECT_SCALE_COLS])
+    return df
+
+
+@profiling.instrument("convert_units")
+def convert_units(df):
+    # --- HP → kW ---
+    df["power_kw"] = df["power_hp"] * 0.7355
+    df = df.drop(columns=["power_hp"])
+
+    # --- km/L → g/km ---
+    if "fuel_efficiency" in df.columns:
+        eff = df["fuel_efficiency"]
+        g_per_liter = df["fuel_type"].str.lower().map(fuel_co2).fillna(0)
+        df["fuel_consumption_g_km"] = (g_per_liter / eff).where(eff > 0, 0)
+        df = df.drop(columns=["fuel_efficiency"])
+    return df
+
+
+@profiling.instrument("preprocess_frame")
+def preprocess_frame(df, registry=None):
+    """
+    Run the full preprocessing pipeline over a frame of raw inputs.
+    All stages use the same artifact registry (default: the live one).
+    """
+    registry = registry or artifacts.current()
+    df = convert_units(df)
+    df = feature_engineering(df)
+    df = model_map_enc(df, registry)
+    df = hot_encoding(df, registry)
+    df = handle_scaling(df, registry)
+
+    return df
+
+
+def preprocess_user_input(input_dict, registry=None):
+    return preprocess_frame(pd.DataFrame([input_dict]), registry)
+
+
+# -----------------------
+# Compiled single-row encoder
+# -----------------------
+def _scaler_coefficients(scaler, n):
+    mean = getattr(scaler, "mean_", None) if getattr(scaler, "with_mean", True) else None
+    scale = getattr(scaler, "scale_", None) if getattr(scaler, "with_std", True) else None
+    mean = np.zeros(n) if mean is None else np.asarray(mean, dtype=np.float64)
+    scale = np.ones(n) if scale is None else np.asarray(scale, dtype=np.float64)
+    return mean, scale
+
+
+def _parse_registration_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return pd.Timestamp(value)
+
+
+class CompiledEncoder:
+    """
+    Pandas-free encoder for single-request inference.
+
+    Built once from feature_order, the scalers and the target-encoding
+    table; encode() writes one input_dict straight into a preallocated
+    float32 row laid out in feature_order, applying the same arithmetic as
+    preprocess_user_input.
+    """
+
+    def __init__(self, feature_order, log_transformer, log_scaler, direct_scaler,
+                 target_index, global_mean, onehot_columns, onehot_index,
+                 data_collection_year=DATA_COLLECTION_YEAR):
+        self.feature_order = list(feature_order)
+        self.slots = {name: i for i, name in enumerate(self.feature_order)}
+        self.data_collection_year = data_collection_year
+
+        self.log_func = getattr(log_transformer, "func", None) or np.log1p
+        self.log_slots = np.array([self.slots[c] for c in LOG_SCALE_COLS])
+        self.log_mean, self.log_scale = _scaler_coefficients(log_scaler, len(LOG_SCALE_COLS))
+        self.direct_slots = np.array([self.slots[c] for c in DIRECT_SCALE_COLS])
+        self.direct_mean, self.direct_scale = _scaler_coefficients(direct_scaler, len(DIRECT_SCALE_COLS))
+
+        self.target_enc = dict(zip(target_index.index, target_index.to_numpy()))
+        self.global_mean = float(global_mean)
+        self.onehot = {
+            field: {value: self.slots[onehot_columns[pos]] for value, pos in positions.items()}
+            for field, positions in onehot_index.items()
+        }
+
+        self._local = threading.local()
+
+    def _row(self):
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = self._local.row = np.zeros((1, len(self.feature_order)), dtype=np.float32)
+        else:
+            row.fill(0)
+        return row
+
+    @profiling.instrument("compiled_encoder.encode")
+    def encode(self, input_dict):
+        """Return a (1, n_features) float32 row; reused per thread, copy to keep it."""
+        row = self._row()
+        slots = self.slots
+        year = self.data_collection_year
+
+        fuel_type = str(input_dict["fuel_type"]).lower()
+        eff = input_dict["fuel_efficiency"]
+        g_per_liter = fuel_co2.get(fuel_type, 0)
+        fuel_consumption = g_per_liter / eff if eff > 0 else 0
+
+        power_kw = input_dict["power_hp"] * 0.7355
+        mileage = input_dict["mileage_in_km"]
+        reg_date = _parse_registration_date(input_dict["registration_date"])
+        manufacturing_age = year - int(input_dict["year"])
+        registration_age = year - reg_date.year
+
+        log_values = self.log_func(np.array([power_kw, fuel_consumption, mileage], dtype=np.float64))
+        row[0, self.log_slots] = (log_values - self.log_mean) / self.log_scale
+        direct_values = np.array([input_dict["ev_range_km"], manufacturing_age, registration_age], dtype=np.float64)
+        row[0, self.direct_slots] = (direct_values - self.direct_mean) / self.direct_scale
+
+        row[0, slots["reg_month_sin"]] = np.sin(2 * np.pi * reg_date.month / 12)
+        row[0, slots["reg_month_cos"]] = np.cos(2 * np.pi * reg_date.month / 12)
+        mileage_per_year = mileage / registration_age if registration_age > 0 else mileage
+        row[0, slots["mileage_per_year"]] = np.round(np.float64(mileage_per_year), 2)
+
+        row[0, slots["model_target_enc"]] = self.target_enc.get(
+            (input_dict["brand"], model_key(input_dict["model"])), self.global_mean
+        )
+
+        for field, positions in self.onehot.items():
+            if field not in input_dict:
+                continue
+            value = str(input_dict[field]).lower()
+            slot = positions.get(value)
+            if slot is not None:
+                row[0, slot] = 1
+            elif value not in ONEHOT_REFERENCE.get(field, ()):
+                _record_unknown_categories(field, [value])
+        return row
+
+    @profiling.instrument("compiled_encoder.encode_sweep", rows=lambda args: len(next(iter(args[2].values()))))
+    def encode_sweep(self, input_dict, columns):
+        """
+        Rows for input_dict with some SWEEP_FIELDS replaced by equal-length
+        sequences of values. The base row is encoded once and copied; only
+        the feature columns the varied fields feed are recomputed.
+        """
+        n = len(next(iter(columns.values())))
+        rows = np.repeat(self.encode(input_dict), n, axis=0)
+        affected = set().union(*(SWEEP_FIELDS[field] for field in columns))
+        year = self.data_collection_year
+
+        def value(field):
+            if field in columns:
+                return np.asarray(columns[field], dtype=np.float64)
+            return np.float64(input_dict[field])
+
+        if "registration_date" in columns:
+            dates = [_parse_registration_date(v) for v in columns["registration_date"]]
+            reg_year = np.array([d.year for d in dates], dtype=np.float64)
+            reg_month = [d.month for d in dates]
+        else:
+            date = _parse_registration_date(input_dict["registration_date"])
+            reg_year, reg_month = np.float64(date.year), [date.month]
+        registration_age = year - reg_year
+        mileage = value("mileage_in_km")
+
+        raw = {
+            "power_kw": lambda: value("power_hp") * 0.7355,
+            "fuel_consumption_g_km": lambda: _fuel_consumption(
+                fuel_co2.get(str(input_dict["fuel_type"]).lower(), 0), value("fuel_efficiency")),
+            "mileage_in_km": lambda: mileage,
+            "ev_range_km": lambda: value("ev_range_km"),
+            "vehicle_manufacturing_age": lambda: year - np.trunc(value("year")),
+            "vehicle_registration_age": lambda: registration_age,
+        }
+        for i, col in enumerate(LOG_SCALE_COLS):
+            if col in affected:
+                rows[:, self.slots[col]] = (self.log_func(raw[col]()) - self.log_mean[i]) / self.log_scale[i]
+        for i, col in enumerate(DIRECT_SCALE_COLS):
+            if col in affected:
+                rows[:, self.slots[col]] = (raw[col]() - self.direct_mean[i]) / self.direct_scale[i]
+
+        if "reg_month_sin" in affected:
+            # Scalar np.sin/np.cos per month, exactly as encode() computes them.
+            rows[:, self.slots["reg_month_sin"]] = [np.sin(2 * np.pi * m / 12) for m in reg_month]
+            rows[:, self.slots["reg_month_cos"]] = [np.cos(2 * np.pi * m / 12) for m in reg_month]
+        if "mileage_per_year" in affected:
+            mileage, registration_age = np.broadcast_arrays(mileage, registration_age)
+            per_year = np.divide(mileage, registration_age, out=mileage.copy(), where=registration_age > 0)
+            rows[:, self.slots["mileage_per_year"]] = np.round(per_year, 2)
+        return rows
+
+
+def _fuel_consumption(g_per_liter, efficiency):
+    """g/km from km/L; 0 where the efficiency is not positive."""
+    efficiency = np.asarray(efficiency, dtype=np.float64)
+    return np.divide(g_per_liter, efficiency, out=np.zeros_like(efficiency), where=efficiency > 0)
+
+
+def _to_frame(data):
+    """Accept a DataFrame or a list of input dicts and return a fresh frame."""
+    if isinstance(data, pd.DataFrame):
+        return data.reset_index(drop=True).copy()
+    return pd.DataFrame(list(data))
+
+
+# -----------------------
+# Prediction cache
+# -----------------------
+# EUR results keyed on (artifacts version, normalized input, kind): kind is
+# False/True for predict(interval=...) or "explain" for explain()'s (price,
+# grouped contributions). Currency conversion happens after the lookup so it is not
+# part of the key.
+prediction_cache = LRUTTLCache(
+    maxsize=int(os.getenv("PREDICTION_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("PREDICTION_CACHE_TTL", "3600")) or None,
+)
+# Entries of an old version are unreachable after a swap; drop them.
+artifacts.on_swap(lambda _registry: prediction_cache.clear())
+
+# Interpolate price_table prices between mileage grid points (approximate).
+PRICE_TABLE_INTERPOLATE = os.getenv("PRICE_TABLE_INTERPOLATE", "0") == "1"
+
+
+def normalize_input(input_dict):
+    """
+    Hashable, currency-independent form of input_dict. Numbers become
+    floats and registration_date is reduced to the year and month, the
+    only parts the features use.
+    """
+    items = []
+    for key in sorted(input_dict):
+        value = input_dict[key]
+        if key == "currency":
+            continue
+        if key == "registration_date":
+            date = _parse_registration_date(value)
+            value = (date.year, date.month)
+        elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            value = float(value)
+        items.append((key, value))
+    return tuple(items)
+
+
+def _quantile_engine(registry):
+    engine = registry.get("quantile_engine")
+    if engine is None:
+        raise FileNotFoundError(
+            f"interval=True needs {_quantile_model.QUANTILE_MODEL_FILE} in {registry.root}; "
+            "train it with quantile_model.py"
+        )
+    return engine
+
+
+def _predict_bands(registry, features):
+    """(rows, 3) EUR low/median/high from the quantile model."""
+    engine = _quantile_engine(registry)
+    with profiling.span("quantile_model.predict", rows=len(features)):
+        return _quantile_model.as_bands(engine.predict(features))
+
+
+@profiling.instrument("predict")
+def predict(input_dict, fast=False, use_cache=True, interval=False):
+    """
+    Predict one car's price. Returns (converted_price, prediction_eur).
+    Inputs on the price_table grid are looked up instead of scored.
+    fast=True encodes through compiled_encoder instead of pandas;
+    use_cache=False bypasses prediction_cache.
+
+    interval=True also scores the quantile model on the same encoded row
+    and returns (converted_price, prediction_eur, (low, median, high)),
+    with the band in the input's currency.
+    """
+    currency = input_dict.get("currency", "EUR")
+    registry = artifacts.current()
+    rate = currency_rates.get(currency, 1.0)
+
+    key = None
+    cached = None
+    if use_cache:
+        key = (registry.version, normalize_input(input_dict), interval)
+        cached = prediction_cache.get(key)
+
+    if cached is None and not interval:
+        table = registry.get("price_table")
+        if table is not None:
+            with profiling.span("price_table.lookup"):
+                cached = table.lookup(input_dict, PRICE_TABLE_INTERPOLATE)
+
+    if cached is None:
+        if fast:
+            features = registry.get("compiled_encoder").encode(input_dict)
+        else:
+            features = as_features(preprocess_user_input(input_dict, registry)[registry.get("feature_order")])
+        with profiling.span("model.predict"):
+            cached = float(registry.get("engine").predict(features)[0])
+        if interval:
+            cached = (cached, tuple(float(v) for v in _predict_bands(registry, features)[0]))
+        if key is not None:
+            prediction_cache.set(key, cached)
+
+    if interval:
+        prediction_eur, bands = cached
+        return float(prediction_eur * rate), prediction_eur, tuple(v * rate for v in bands)
+    return float(cached * rate), cached
+
+
+@profiling.instrument("predict_batch")
+def predict_batch(data, interval=False):
+    """
+    Vectorized counterpart of predict() for many cars at once.
+
+    `data` is a DataFrame or a list of input dicts shaped like predict()'s
+    input. Preprocessing runs once over the whole frame and the model is
+    called once. Returns (converted_prices, predictions_eur) as float64
+    arrays, using each row's "currency" (EUR when missing).
+
+    interval=True adds a third (rows, 3) array of converted low, median
+    and high prices from the quantile model, scored on the same features.
+    """
+    df = _to_frame(data)
+    if df.empty:
+        empty = np.empty(0, dtype=np.float64)
+        if interval:
+            return empty, empty.copy(), np.empty((0, len(_quantile_model.QUANTILES)))
+        return empty, empty.copy()
+
+    if "currency" in df.columns:
+        currencies = df["currency"].fillna("EUR")
+    else:
+        currencies = pd.Series("EUR", index=df.index)
+    rates = currencies.map(currency_rates).fillna(1.0).to_numpy(dtype=np.float64)
+
+    registry = artifacts.current()
+    processed_df = preprocess_frame(df, registry)[registry.get("feature_order")]
+    features = as_features(processed_df)
+    with profiling.span("model.predict", rows=len(features)):
+        prediction_eur = registry.get("engine").predict(features).astype(np.float64)
+    if interval:
+        bands = _predict_bands(registry, features)
+        return prediction_eur * rates, prediction_eur, bands * rates[:, None]
+    return prediction_eur * rates, prediction_eur
+
+
+@profiling.instrument("price_sweep")
+def price_sweep(input_dict, grid):
+    """
+    Price one car over a grid of values for one or two numeric fields, e.g.
+
+        price_sweep(input_dict, {"mileage_in_km": range(0, 300_001, 5000)})
+        price_sweep(input_dict, {"mileage_in_km": [...], "registration_date": [...]})
+
+    Fields come from SWEEP_FIELDS; registration_date values are dates or
+    ISO strings. With two fields every combination is priced. The fixed
+    attributes are encoded once, the grid is scored in one model call, and
+    each point matches predict() for the same inputs.
+
+    Returns a DataFrame with a column per swept field plus "price" (in
+    input_dict's currency) and "price_eur". For two fields, pivot it into
+    a surface with df.pivot(index=field_1, columns=field_2, values="price").
+    """
+    if not 1 <= len(grid) <= 2:
+        raise ValueError("price_sweep varies one or two fields")
+    unknown = set(grid) - set(SWEEP_FIELDS)
+    if unknown:
+        raise ValueError(f"cannot sweep {sorted(unknown)}; choose from {sorted(SWEEP_FIELDS)}")
+
+    fields = list(grid)
+    axes = [list(grid[field]) for field in fields]
+    positions = np.meshgrid(*[np.arange(len(axis)) for axis in axes], indexing="ij")
+    columns = {field: [axis[i] for i in pos.ravel()] for field, axis, pos in zip(fields, axes, positions)}
+    result = pd.DataFrame(columns)
+    if result.empty:
+        return result.assign(price=np.empty(0), price_eur=np.empty(0))
+
+    registry = artifacts.current()
+    features = registry.get("compiled_encoder").encode_sweep(input_dict, columns)
+    with profiling.span("model.predict", rows=len(features)):
+        prediction_eur = registry.get("engine").predict(features).astype(np.float64)
+    rate = currency_rates.get(input_dict.get("currency", "EUR"), 1.0)
+    result["price"] = prediction_eur * rate
+    result["price_eur"] = prediction_eur
+    return result
+
+
+# -----------------------
+# Explanations
+# -----------------------
+def _explain_features(registry, features):
+    """
+    (EUR predictions, per-input EUR contributions of shape (rows,
+    len(explain_groups names))) for features; the prediction is the
+    engine's, as in predict(), and the contributions break it down.
+    """
+    with profiling.span("model.predict", rows=len(features)):
+        prediction_eur = registry.get("engine").predict(features).astype(np.float64)
+    with profiling.span("model.contributions", rows=len(features)):
+        contributions = registry.get("booster_engine").contributions(features)
+    return prediction_eur, contributions.astype(np.float64) @ registry.get("explain_groups")[1]
+
+
+@profiling.instrument("explain")
+def explain(input_dict, fast=False, use_cache=True):
+    """
+    Why predict() gives input_dict its price: the booster's per-feature
+    contributions (pred_contribs), summed per input. Returns
+
+        {"price": ..., "price_eur": ..., "base": ...,
+         "contributions": {"brand": ..., "model": ..., "mileage_in_km": ..., ...}}
+
+    in the input's currency, contributions ordered by size. price is the
+    engine's, as predict() gives it; base plus the contributions equals it
+    up to float32 rounding. The explanation is cached in prediction_cache
+    under its own key (predict()'s entries are never written here).
+    fast/use_cache as for predict().
+    """
+    registry = artifacts.current()
+    rate = currency_rates.get(input_dict.get("currency", "EUR"), 1.0)
+
+    key = cached = None
+    if use_cache:
+        key = (registry.version, normalize_input(input_dict), "explain")
+        cached = prediction_cache.get(key)
+
+    if cached is None:
+        if fast:
+            features = registry.get("compiled_encoder").encode(input_dict)
+        else:
+            features = as_features(preprocess_user_input(input_dict, registry)[registry.get("feature_order")])
+        prediction_eur, grouped = _explain_features(registry, features)
+        cached = (float(prediction_eur[0]), tuple(grouped[0].tolist()))
+        if key is not None:
+            prediction_cache.set(key, cached)
+
+    prediction_eur, grouped = cached
+    names = registry.get("explain_groups")[0]
+    contributions = {name: value * rate for name, value in zip(names[:-1], grouped[:-1])}
+    return {
+        "price": prediction_eur * rate,
+        "price_eur": prediction_eur,
+        "base": grouped[-1] * rate,
+        "contributions": dict(sorted(contributions.items(), key=lambda item: -abs(item[1]))),
+    }
+
+
+@profiling.instrument("explain_batch")
+def explain_batch(data, use_cache=True):
+    """
+    explain() for many cars: a DataFrame with one row per input, a column
+    per input group plus "base" (in each row's currency), "price" and
+    "price_eur". Rows found in prediction_cache are reused; the rest are
+    preprocessed together and scored in one call.
+    """
+    df = _to_frame(data)
+    registry = artifacts.current()
+    names = registry.get("explain_groups")[0]
+
+    keys = [None] * len(df)
+    rows = [None] * len(df)
+    if use_cache:
+        keys = [(registry.version, normalize_input(record), "explain") for record in df.to_dict("records")]
+        rows = [prediction_cache.get(key) for key in keys]
+    missing = [i for i, row in enumerate(rows) if row is None]
+    if missing:
+        subset = df.iloc[missing].reset_index(drop=True)
+        features = as_features(preprocess_frame(subset, registry)[registry.get("feature_order")])
+        prediction_eur, grouped = _explain_features(registry, features)
+        for i, price, values in zip(missing, prediction_eur.tolist(), grouped.tolist()):
+            rows[i] = (price, tuple(values))
+            if keys[i] is not None:
+                prediction_cache.set(keys[i], rows[i])
+
+    if "currency" in df.columns:
+        currencies = df["currency"].fillna("EUR")
+    else:
+        currencies = pd.Series("EUR", index=df.index)
+    rates = currencies.map(currency_rates).fillna(1.0).to_numpy(dtype=np.float64)
+    prediction_eur = np.array([row[0] for row in rows], dtype=np.float64)
+    grouped = np.array([row[1] for row in rows], dtype=np.float64).reshape(len(rows), len(names))
+    result = pd.DataFrame(grouped * rates[:, None], columns=names)
+    result["price"] = prediction_eur * rates
+    result["price_eur"] = prediction_eur
+    return result
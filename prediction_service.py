@@ -0,0 +1,311 @@
+# ml-old-car-price-prediction/prediction_service.py
+"""
+Headless HTTP/JSON prediction service with micro-batching.
+
+Concurrent requests are queued and scored together through
+prediction_helper.predict_batch, so one model call serves many callers.
+
+    python prediction_service.py --port 8000 --max-batch-size 64 --max-wait-ms 5
+
+Endpoints:
+    POST /predict   one input object, or a list of them
+    GET  /health    status, artifact version and batching counters
+    GET  /metrics   per-stage profiling metrics, Prometheus text format (PROFILE_MODE)
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import MISSING, asdict, dataclass, fields
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------- request schema --------------------
+def _coerce(name: str, type_name: str, value):
+    if type_name == "str":
+        if not isinstance(value, str):
+            raise TypeError
+        if name == "registration_date":
+            # Normalized to YYYY-MM-DD so a batch parses with one date format.
+            return datetime.date.fromisoformat(value[:10]).isoformat()
+        return value
+    if isinstance(value, bool) or not math.isfinite(float(value)):
+        raise ValueError
+    if type_name == "int":
+        # int() would truncate 2015.7; "2015.7" already fails in int().
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError
+        return int(value)
+    return float(value)
+
+
+@dataclass
+class PredictRequest:
+    """Mirrors the input_dict built in main.py."""
+    brand: str
+    model: str
+    color: str
+    registration_date: str
+    year: int
+    power_hp: float
+    transmission_type: str
+    fuel_type: str
+    mileage_in_km: float
+    fuel_efficiency: float = 0.0
+    ev_range_km: float = 0.0
+    currency: str = "EUR"
+
+    @classmethod
+    def from_json(cls, data) -> "PredictRequest":
+        """
+        Validate one request object. Text fields must be strings; numbers
+        must be finite and not booleans, and integers (year) whole;
+        registration_date must be an ISO date (YYYY-MM-DD).
+        """
+        if not isinstance(data, dict):
+            raise ValueError("each request must be a JSON object")
+        kwargs = {}
+        for f in fields(cls):
+            if f.name not in data:
+                if f.default is MISSING:
+                    raise ValueError(f"missing field: {f.name}")
+                continue
+            value = data[f.name]
+            try:
+                kwargs[f.name] = _coerce(f.name, f.type, value)
+            except (TypeError, ValueError, OverflowError):
+                raise ValueError(f"invalid value for {f.name}: {value!r}") from None
+        unknown = set(data) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+        return cls(**kwargs)
+
+
+# -------------------- micro-batching --------------------
+class MicroBatcher:
+    """
+    Groups concurrently submitted items into batches of at most
+    max_batch_size, waiting at most max_wait_ms after the first item, and
+    scores each batch with one call to predict_fn on a worker thread.
+    """
+
+    def __init__(self, predict_fn, max_batch_size: int = 64, max_wait_ms: float = 5.0,
+                 executor: ThreadPoolExecutor | None = None):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="predict")
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.batches = 0
+        self.items = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, item):
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            batch = [(item, fut) for item, fut in batch if not fut.cancelled()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self.predict_fn, items)
+            except Exception as e:
+                if len(batch) > 1:
+                    # Isolate the failing input instead of failing every caller.
+                    results = [await self._score_one(loop, item) for item in items]
+                else:
+                    results = [e]
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), result in zip(batch, results):
+                if fut.done():
+                    continue
+                if isinstance(result, Exception):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+    async def _score_one(self, loop, item):
+        try:
+            return (await loop.run_in_executor(self._executor, self.predict_fn, [item]))[0]
+        except Exception as e:
+            return e
+
+
+def score_requests(requests: list[PredictRequest]) -> list[dict]:
+    from prediction_helper import predict_batch
+
+    converted, eur = predict_batch([asdict(r) for r in requests])
+    return [
+        {"price": float(c), "currency": r.currency, "price_eur": float(e)}
+        for r, c, e in zip(requests, converted, eur)
+    ]
+
+
+# -------------------- http server --------------------
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            500: "Internal Server Error"}
+
+
+class PredictionServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8000,
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0, predict_fn=score_requests):
+        self.host = host
+        self.port = port
+        self.batcher = MicroBatcher(predict_fn, max_batch_size, max_wait_ms)
+        self._server: asyncio.base_events.Server | None = None
+
+    async def start(self) -> None:
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Serving predictions on http://%s:%s", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple[int, object]:
+        if path == "/health":
+            from prediction_helper import artifacts
+
+            return 200, {
+                "status": "ok",
+                "artifacts_version": artifacts.version,
+                "batches": self.batcher.batches,
+                "items": self.batcher.items,
+            }
+        if path == "/metrics":
+            import profiling
+
+            return 200, profiling.render_prometheus()
+        if path != "/predict":
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        try:
+            payload = json.loads(body or b"null")
+            many = isinstance(payload, list)
+            requests = [PredictRequest.from_json(p) for p in (payload if many else [payload])]
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        try:
+            results = await asyncio.gather(*(self.batcher.submit(r) for r in requests))
+        except Exception as e:
+            logger.exception("Prediction failed")
+            return 500, {"error": str(e)}
+        return 200, results if many else results[0]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, version = line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = header.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self._route(method, path.split("?", 1)[0], body)
+                if isinstance(payload, str):
+                    data, content_type = payload.encode(), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(payload).encode(), "application/json"
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve price predictions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--no-warmup", action="store_true", help="load artifacts on first request")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.no_warmup:
+        from prediction_helper import artifacts
+
+        artifacts.warmup()
+    server = PredictionServer(args.host, args.port, args.max_batch_size, args.max_wait_ms)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# ml-old-car-price-prediction/price_table.py
+"""
+Precomputed EUR prices for every catalog brand/model at common
+configurations, so predict() can answer them without running the model.
+
+`python price_table.py` scores a grid for every (brand, model) pair in
+data/catalog.json and model_target_mapping.csv and writes
+artifacts/price_table/:
+
+    pairs.npy    sorted "brand<US>model" keys (the row index, searched
+                 with np.searchsorted)
+    values.npy   float32 prices, shape (pairs, years, mileages, fuels,
+                 transmissions, colors)
+    meta.json    the grid axes, the fixed inputs, a digest of the artifact
+                 files the prices come from (PRICE_INPUTS), and the
+                 measured error of mileage interpolation
+
+The other inputs are fixed at the app's defaults. power_hp is 120. The
+car is registered in January of its manufacturing year. Fuel efficiency
+and EV range follow FIXED_BY_FUEL. An input is a hit when every field
+is on the grid, and the stored price is then exactly what the model
+returns. With interpolate=True, a mileage between two grid points is
+linearly interpolated. Everything else is a miss, and the caller falls
+back to the model.
+
+Both arrays are memory-mapped, so only the pages that lookups touch are
+read, and worker processes share them.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import datetime
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from tree_compiler import file_sha1
+
+TABLE_DIR = "price_table"
+# Bumped when inference changes the prices of an unchanged artifact set
+# (2: "_" and "-" in model names match the same target encoding).
+TABLE_FORMAT = 2
+KEY_SEP = "\x1f"
+
+YEARS = list(range(2000, 2024))
+MILEAGES = list(range(0, 300_001, 25_000))
+FUELS = ["petrol", "diesel", "electric", "hybrid", "lpg", "ethanol", "hydrogen"]
+TRANSMISSIONS = ["manual", "automatic", "semi-automatic"]
+COLORS = ["black", "blue", "red", "white", "silver", "grey", "other"]
+POWER_HP = 120
+REGISTRATION_MONTH = 1
+# (fuel_efficiency, ev_range_km) the app starts each fuel type with.
+FIXED_BY_FUEL = {fuel: (20.0, 0) for fuel in FUELS}
+FIXED_BY_FUEL.update(electric=(0, 50), hybrid=(20.0, 50))
+
+
+# The artifact files the prices come from; anything else in root (the
+# quantile model, compiled trees, notes) does not invalidate the table.
+PRICE_INPUTS = ["model.joblib", "model.ubj", "feature_order.joblib", "log_scaler.joblib",
+                "direct_scaler.joblib", "log_transformer.joblib", "model_target_mapping.csv"]
+
+
+def artifacts_digest(root: str) -> str:
+    """SHA-1 over the PRICE_INPUTS present in root."""
+    digest = hashlib.sha1()
+    for name in PRICE_INPUTS:
+        path = os.path.join(root, name)
+        if os.path.isfile(path):
+            digest.update(f"{name}:{file_sha1(path)};".encode())
+    return digest.hexdigest()
+
+
+def _key(brand, model) -> str:
+    return f"{brand}{KEY_SEP}{model}"
+
+
+# -------------------- lookup --------------------
+class PriceTable:
+    def __init__(self, pairs: np.ndarray, values: np.ndarray, meta: dict):
+        self.pairs = pairs
+        self.values = values
+        self.meta = meta
+        self.years = {y: i for i, y in enumerate(meta["years"])}
+        self.mileages = meta["mileages"]
+        self.mileage_index = {m: i for i, m in enumerate(self.mileages)}
+        self.fuels = {f: i for i, f in enumerate(meta["fuels"])}
+        self.transmissions = {t: i for i, t in enumerate(meta["transmissions"])}
+        self.colors = {c: i for i, c in enumerate(meta["colors"])}
+        self.fixed_by_fuel = {f: tuple(v) for f, v in meta["fixed_by_fuel"].items()}
+
+    @classmethod
+    def load(cls, directory: str) -> "PriceTable":
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(np.load(os.path.join(directory, "pairs.npy"), mmap_mode="r"),
+                   np.load(os.path.join(directory, "values.npy"), mmap_mode="r"), meta)
+
+    def _pair(self, brand, model) -> int | None:
+        key = _key(brand, model)
+        i = int(np.searchsorted(self.pairs, key))
+        return i if i < len(self.pairs) and self.pairs[i] == key else None
+
+    def lookup(self, input_dict, interpolate: bool = False) -> float | None:
+        """The EUR price for input_dict, or None when it is not on the grid."""
+        fuel = str(input_dict["fuel_type"]).lower()
+        year = input_dict["year"]
+        if (fuel not in self.fuels or year not in self.years
+                or input_dict["power_hp"] != self.meta["power_hp"]
+                or (input_dict.get("fuel_efficiency", 0), input_dict.get("ev_range_km", 0))
+                != self.fixed_by_fuel[fuel]):
+            return None
+        date = input_dict["registration_date"]
+        if not isinstance(date, datetime.date):
+            try:
+                date = datetime.date.fromisoformat(str(date)[:10])
+            except ValueError:
+                return None
+        if (date.year, date.month) != (year, self.meta["registration_month"]):
+            return None
+        transmission = self.transmissions.get(str(input_dict["transmission_type"]).lower())
+        color = self.colors.get(str(input_dict.get("color", "")).lower())
+        pair = self._pair(input_dict["brand"], input_dict["model"])
+        if transmission is None or color is None or pair is None:
+            return None
+
+        cell = (pair, self.years[year])
+        rest = (self.fuels[fuel], transmission, color)
+        mileage = input_dict["mileage_in_km"]
+        m = self.mileage_index.get(mileage)
+        if m is not None:
+            return float(self.values[(*cell, m, *rest)])
+        if not interpolate or not self.mileages[0] < mileage < self.mileages[-1]:
+            return None
+        hi = bisect.bisect_right(self.mileages, mileage)
+        lo_m, hi_m = self.mileages[hi - 1], self.mileages[hi]
+        lo_p = float(self.values[(*cell, hi - 1, *rest)])
+        hi_p = float(self.values[(*cell, hi, *rest)])
+        return lo_p + (hi_p - lo_p) * (mileage - lo_m) / (hi_m - lo_m)
+
+
+def load_for(root: str) -> PriceTable | None:
+    """The table for the artifacts in root, or None if it is missing, was built from other files or is an old format."""
+    directory = os.path.join(root, TABLE_DIR)
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        return None
+    table = PriceTable.load(directory)
+    if (table.meta.get("artifacts_digest") != artifacts_digest(root)
+            or table.meta.get("format") != TABLE_FORMAT):
+        return None
+    return table
+
+
+# -------------------- building --------------------
+def catalog_pairs(registry) -> list[tuple[str, str]]:
+    from catalog import brand_model_mapping
+
+    pairs = {(b, m) for b, models in brand_model_mapping.items() for m in models}
+    mapping = registry.get("model_target_mapping")
+    pairs.update(zip(mapping["brand"], mapping["model"]))
+    return sorted(pairs, key=lambda p: _key(*p))
+
+
+def _grid_frame(pairs, meta):
+    """All grid inputs for pairs, in values.npy's C order."""
+    import pandas as pd
+
+    axes = [np.arange(len(pairs)), meta["years"], meta["mileages"], meta["fuels"],
+            meta["transmissions"], meta["colors"]]
+    mesh = np.meshgrid(*[np.arange(len(a)) for a in axes], indexing="ij")
+    pair, year, mileage, fuel, transmission, color = (m.ravel() for m in mesh)
+    years = np.asarray(meta["years"])[year]
+    fuels = np.asarray(meta["fuels"])[fuel]
+    fixed = np.array([meta["fixed_by_fuel"][f] for f in meta["fuels"]], dtype=np.float64)[fuel]
+    return pd.DataFrame({
+        "brand": [pairs[i][0] for i in pair],
+        "model": [pairs[i][1] for i in pair],
+        "color": np.asarray(meta["colors"])[color],
+        "registration_date": [f"{y}-{meta['registration_month']:02d}-01" for y in years],
+        "year": years,
+        "power_hp": meta["power_hp"],
+        "transmission_type": np.asarray(meta["transmissions"])[transmission],
+        "fuel_type": fuels,
+        "fuel_efficiency": fixed[:, 0],
+        "mileage_in_km": np.asarray(meta["mileages"])[mileage],
+        "ev_range_km": fixed[:, 1],
+    })
+
+
+def interpolation_error(table: PriceTable, pairs, samples: int, seed: int = 0) -> dict:
+    """Relative error of mileage interpolation against the model at random off-grid mileages."""
+    from prediction_helper import predict_batch
+
+    rng = np.random.default_rng(seed)
+    inputs = []
+    for _ in range(samples):
+        brand, model = pairs[rng.integers(len(pairs))]
+        fuel = FUELS[rng.integers(len(FUELS))]
+        year = int(rng.choice(table.meta["years"]))
+        fuel_efficiency, ev_range_km = table.fixed_by_fuel[fuel]
+        inputs.append({
+            "brand": brand, "model": model, "color": COLORS[rng.integers(len(COLORS))],
+            "registration_date": f"{year}-{table.meta['registration_month']:02d}-01", "year": year,
+            "power_hp": table.meta["power_hp"], "transmission_type": TRANSMISSIONS[rng.integers(len(TRANSMISSIONS))],
+            "fuel_type": fuel, "fuel_efficiency": fuel_efficiency, "ev_range_km": ev_range_km,
+            "mileage_in_km": int(rng.integers(table.mileages[0] + 1, table.mileages[-1])),
+        })
+    _, exact = predict_batch(inputs)
+    approx = np.array([table.lookup(i, interpolate=True) for i in inputs])
+    rel = np.abs(approx - exact) / np.maximum(np.abs(exact), 1.0)
+    return {"samples": samples, "mean_rel": float(rel.mean()), "p99_rel": float(np.percentile(rel, 99)),
+            "max_rel": float(rel.max())}
+
+
+def build(root: str, years=YEARS, mileages=MILEAGES, pairs_per_chunk: int = 16, error_samples: int = 2000,
+          log=print) -> str:
+    """Score the grid for every catalog pair into root/price_table/; returns that directory."""
+    from prediction_helper import artifacts, predict_batch
+
+    registry = artifacts.current()
+    pairs = catalog_pairs(registry)
+    meta = {
+        "years": list(years), "mileages": list(mileages), "fuels": FUELS, "transmissions": TRANSMISSIONS,
+        "colors": COLORS, "power_hp": POWER_HP, "registration_month": REGISTRATION_MONTH,
+        "fixed_by_fuel": FIXED_BY_FUEL, "format": TABLE_FORMAT, "artifacts_version": registry.version,
+        "artifacts_digest": artifacts_digest(root),
+    }
+    shape = (len(pairs), len(meta["years"]), len(meta["mileages"]), len(FUELS), len(TRANSMISSIONS), len(COLORS))
+    directory = os.path.join(root, TABLE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    # A stale meta.json would make a half-written table look valid.
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        os.remove(os.path.join(directory, "meta.json"))
+    np.save(os.path.join(directory, "pairs.npy"), np.array([_key(*p) for p in pairs]))
+    values = np.lib.format.open_memmap(os.path.join(directory, "values.npy"), mode="w+", dtype=np.float32,
+                                       shape=shape)
+
+    start = time.perf_counter()
+    for lo in range(0, len(pairs), pairs_per_chunk):
+        chunk = pairs[lo:lo + pairs_per_chunk]
+        _, eur = predict_batch(_grid_frame(chunk, meta))
+        values[lo:lo + len(chunk)] = eur.reshape((len(chunk), *shape[1:]))
+        log(f"\r{lo + len(chunk)}/{len(pairs)} pairs, {time.perf_counter() - start:,.0f} s", end="")
+    log("")
+    values.flush()
+    del values
+
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    if error_samples:
+        meta["interpolation_error"] = interpolation_error(PriceTable.load(directory), pairs, error_samples)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+    return directory
+
+
+def _parse_range(value: str) -> list[int]:
+    """"start:stop:step" (stop inclusive) or a comma-separated list."""
+    if ":" in value:
+        start, stop, step = (int(v) for v in value.split(":"))
+        return list(range(start, stop + 1, step))
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    from artifact_registry import ARTIFACTS_DIR, read_version
+
+    parser = argparse.ArgumentParser(description="Precompute catalog prices into artifacts/price_table.")
+    parser.add_argument("--years", type=_parse_range, default=YEARS, help="e.g. 2000:2023:1")
+    parser.add_argument("--mileages", type=_parse_range, default=MILEAGES, help="e.g. 0:300000:25000")
+    parser.add_argument("--pairs-per-chunk", type=int, default=16)
+    parser.add_argument("--error-samples", type=int, default=2000,
+                        help="off-grid mileages used to measure interpolation error")
+    args = parser.parse_args()
+
+    root = read_version(ARTIFACTS_DIR)[1]
+    directory = build(root, args.years, args.mileages, args.pairs_per_chunk, args.error_samples)
+    table = PriceTable.load(directory)
+    print(f"wrote {directory}: {table.values.shape} = {table.values.size:,} prices, "
+          f"{table.values.nbytes / 2**20:,.1f} MiB")
+    if "interpolation_error" in table.meta:
+        err = table.meta["interpolation_error"]
+        print(f"mileage interpolation error: mean {err['mean_rel']:.2%}, p99 {err['p99_rel']:.2%}, "
+              f"max {err['max_rel']:.2%}")
+
+    brand, model = table.pairs[len(table.pairs) // 2].split(KEY_SEP)
+    probe = {"brand": brand, "model": model, "color": "black", "year": table.meta["years"][-1],
+             "registration_date": datetime.date(table.meta["years"][-1], REGISTRATION_MONTH, 1),
+             "power_hp": POWER_HP, "transmission_type": "manual", "fuel_type": "petrol",
+             "fuel_efficiency": FIXED_BY_FUEL["petrol"][0], "ev_range_km": FIXED_BY_FUEL["petrol"][1],
+             "mileage_in_km": table.mileages[1]}
+    n = 10_000
+    start = time.perf_counter()
+    for _ in range(n):
+        table.lookup(probe)
+    print(f"lookup: {(time.perf_counter() - start) / n * 1e6:.1f} µs")
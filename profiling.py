@@ -0,0 +1,315 @@
+# ml-old-car-price-prediction/profiling.py
+"""
+Optional per-stage profiling for prediction_helper and the two agents.
+
+Instrumented code records wall-clock time, rows processed and (optionally)
+allocations per stage. The results are exported in Prometheus text format
+(render_prometheus, serve_metrics, or GET /metrics on prediction_service)
+and/or logged as one JSON line per stage.
+
+Configured from the environment, or at runtime with configure():
+    PROFILE_MODE          off (default) | on | sample
+    PROFILE_SAMPLE_RATE   fraction of top-level calls recorded in sample mode (default 0.01)
+    PROFILE_ALLOCATIONS   1 = also record allocated bytes (starts tracemalloc; costly)
+    PROFILE_LOG           1 = log each recorded stage as JSON on the "profiling" logger
+    PROFILE_METRICS_PORT  port for serve_metrics() when the app starts it
+
+When disabled an instrumented call costs one flag check. In sample mode the
+outermost instrumented call decides whether to record, and the stages it
+runs follow that decision, so a sampled request always has its full
+breakdown. Counts in sample mode cover sampled calls only; the
+car_price_profile_sample_rate gauge lets dashboards scale them back up.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("profiling")
+
+# Latency histogram bounds in seconds (Prometheus "le" labels).
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+_sample_rate = 1.0
+_track_allocations = False
+_log = False
+
+# Sampling decision of the enclosing instrumented call (None = outermost).
+_recording: ContextVar[bool | None] = ContextVar("profiling_recording", default=None)
+
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.alloc_bytes = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+_stats: dict[str, StageStats] = {}
+_lock = threading.Lock()
+
+
+def configure(mode: str | None = None, sample_rate: float | None = None,
+              allocations: bool | None = None, log: bool | None = None) -> None:
+    """Change settings at runtime; arguments left as None keep their value."""
+    global _enabled, _sample_rate, _track_allocations, _log
+    if mode is not None:
+        if mode not in ("off", "on", "sample"):
+            raise ValueError(f"PROFILE_MODE must be off, on or sample, not {mode!r}")
+        _enabled = mode != "off"
+        if mode != "sample":
+            _sample_rate = 1.0
+        elif sample_rate is None:
+            sample_rate = 0.01
+    if sample_rate is not None:
+        _sample_rate = min(max(sample_rate, 0.0), 1.0)
+    if allocations is not None:
+        _track_allocations = allocations
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+    if log is not None:
+        _log = log
+
+
+def configure_from_env() -> None:
+    mode = os.getenv("PROFILE_MODE", "off").lower()
+    configure(
+        mode=mode,
+        sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.01")) if mode == "sample" else None,
+        allocations=os.getenv("PROFILE_ALLOCATIONS", "0") == "1",
+        log=os.getenv("PROFILE_LOG", "0") == "1",
+    )
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+# -------------------- recording --------------------
+def _record(name: str, seconds: float, rows: int, alloc_bytes: int, error: bool) -> None:
+    with _lock:
+        s = _stats.get(name)
+        if s is None:
+            s = _stats[name] = StageStats()
+        s.count += 1
+        s.errors += error
+        s.seconds += seconds
+        s.rows += rows
+        s.alloc_bytes += alloc_bytes
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                s.buckets[i] += 1
+                break
+    if _log:
+        logger.info(json.dumps({"stage": name, "seconds": round(seconds, 6), "rows": rows,
+                                "alloc_bytes": alloc_bytes, "error": error}))
+
+
+def _should_record() -> bool:
+    decided = _recording.get()
+    if decided is not None:
+        return decided
+    return _sample_rate >= 1.0 or random.random() < _sample_rate
+
+
+class _NullSpan:
+    __slots__ = ()
+    rows = 0
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _RecordedSpan:
+    __slots__ = ("name", "rows", "_token", "_alloc_start", "_start")
+
+    def __init__(self, name: str, rows: int):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self._token = _recording.set(True)
+        self._alloc_start = tracemalloc.get_traced_memory()[0] if _track_allocations else 0
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        alloc = tracemalloc.get_traced_memory()[0] - self._alloc_start if _track_allocations else 0
+        _recording.reset(self._token)
+        _record(self.name, seconds, self.rows, max(alloc, 0), exc_type is not None)
+        return False
+
+
+class _SkippedSpan:
+    """Marks the calls nested under an unsampled one as unsampled too."""
+
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._token = _recording.set(False)
+        return _NULL_SPAN
+
+    def __exit__(self, *exc):
+        _recording.reset(self._token)
+        return False
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return _NULL_SPAN
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+def span(name: str, rows: int = 1):
+    """
+    Context manager timing a block as stage `name`:
+
+        with profiling.span("model.predict", rows=len(features)):
+            ...
+    """
+    if not _enabled:
+        return _NULL_CONTEXT
+    if _should_record():
+        return _RecordedSpan(name, rows)
+    return _SkippedSpan()
+
+
+def _default_rows(args) -> int:
+    if args:
+        first = args[0]
+        if hasattr(first, "shape"):
+            return int(first.shape[0])
+        if isinstance(first, list):
+            return len(first)
+    return 1
+
+
+def instrument(name: str, rows=_default_rows):
+    """
+    Decorator recording every call of the function as stage `name`.
+    rows(args) gives the row count; by default len() of a frame/array/list
+    first argument, otherwise 1.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with span(name, rows(args)):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def observe(*samples: tuple[str, float], rows: int = 1) -> None:
+    """
+    Record (stage, seconds) durations measured elsewhere, such as a stream's
+    time to first chunk. One sampling decision covers all of them.
+    """
+    if _enabled and _should_record():
+        for name, seconds in samples:
+            _record(name, seconds, rows, 0, False)
+
+
+def snapshot() -> dict:
+    """Per-stage totals: calls, errors, seconds, rows, alloc_bytes and mean_ms."""
+    with _lock:
+        return {
+            name: {
+                "calls": s.count,
+                "errors": s.errors,
+                "seconds": s.seconds,
+                "rows": s.rows,
+                "alloc_bytes": s.alloc_bytes,
+                "mean_ms": s.seconds / s.count * 1000 if s.count else None,
+            }
+            for name, s in _stats.items()
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
+
+
+# -------------------- export --------------------
+def render_prometheus() -> str:
+    """All stage metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP car_price_profile_sample_rate Fraction of top-level calls that are recorded.",
+        "# TYPE car_price_profile_sample_rate gauge",
+        f"car_price_profile_sample_rate {_sample_rate if _enabled else 0}",
+        "# HELP car_price_stage_seconds Wall-clock time per instrumented stage.",
+        "# TYPE car_price_stage_seconds histogram",
+    ]
+    with _lock:
+        stats = sorted(_stats.items())
+        for name, s in stats:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, s.buckets):
+                cumulative += count
+                lines.append(f'car_price_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'car_price_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {s.count}')
+            lines.append(f'car_price_stage_seconds_sum{{stage="{name}"}} {s.seconds:.9f}')
+            lines.append(f'car_price_stage_seconds_count{{stage="{name}"}} {s.count}')
+        for metric, attr, help_text in (
+            ("car_price_stage_rows_total", "rows", "Rows processed per stage."),
+            ("car_price_stage_alloc_bytes_total", "alloc_bytes", "Net bytes allocated per stage (PROFILE_ALLOCATIONS=1)."),
+            ("car_price_stage_errors_total", "errors", "Calls per stage that raised."),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, s in stats:
+                lines.append(f'{metric}{{stage="{name}"}} {getattr(s, attr)}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve GET /metrics from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="profiling-metrics", daemon=True).start()
+    return server
+
+
+configure_from_env()
@@ -0,0 +1,119 @@
+# ml-old-car-price-prediction/quantile_model.py
+"""
+Quantile companion model for prediction intervals.
+
+One multi-quantile XGBoost model predicts the 10th, 50th and 90th
+percentile of the price in a single call. It is trained on the same
+features as model.joblib, with that model's tuned hyperparameters (from
+Notebooks/Model_training.ipynb). XGBoost grows one tree per quantile per
+round, so the number of rounds is divided by the number of quantiles, with
+the learning rate scaled up to match. That gives the model the same tree
+budget as the main one, and scoring it costs about the same.
+prediction_helper scores it on the rows already encoded for the point
+prediction.
+
+    python quantile_model.py Notebooks/train_final.csv --test Notebooks/test_final.csv
+
+writes artifacts/quantile_model.ubj and reports the test-set coverage of
+the 10-90% band.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+
+import numpy as np
+
+QUANTILES = (0.1, 0.5, 0.9)
+QUANTILE_MODEL_FILE = "quantile_model.ubj"
+TARGET_COL = "price_in_euro"
+
+# XGBoost's defaults, used when the main model leaves them unset.
+DEFAULT_ESTIMATORS = 100
+DEFAULT_LEARNING_RATE = 0.3
+
+# Hyperparameters of the main model that do not carry over to the quantile objective.
+_NOT_INHERITED = {"objective", "eval_metric", "base_score", "early_stopping_rounds", "callbacks",
+                  "multi_strategy", "tree_method", "missing"}
+
+
+def quantile_params(model=None, quantiles=QUANTILES) -> dict:
+    """XGBRegressor parameters: model's tuned ones with the quantile objective and its tree budget."""
+    params = {}
+    if model is not None:
+        params = {k: v for k, v in model.get_params().items() if v is not None and k not in _NOT_INHERITED}
+    rounds = params.get("n_estimators") or DEFAULT_ESTIMATORS
+    learning_rate = params.get("learning_rate") or DEFAULT_LEARNING_RATE
+    params.update(
+        objective="reg:quantileerror",
+        quantile_alpha=np.asarray(quantiles),
+        tree_method="hist",
+        n_estimators=max(rounds // len(quantiles), 1),
+        learning_rate=min(learning_rate * len(quantiles), 1.0),
+    )
+    return params
+
+
+def fit(X, y, params: dict):
+    from xgboost import XGBRegressor
+
+    model = XGBRegressor(**params)
+    model.fit(X, y)
+    return model
+
+
+def load(root: str):
+    """The quantile model in root, or None if it has not been trained."""
+    path = os.path.join(root, QUANTILE_MODEL_FILE)
+    if not os.path.exists(path):
+        return None
+    from xgboost import XGBRegressor
+
+    model = XGBRegressor()
+    model.load_model(path)
+    return model
+
+
+def as_bands(predictions) -> np.ndarray:
+    """(rows, 3) float64 low/median/high, sorted per row so quantiles never cross."""
+    return np.sort(np.asarray(predictions, dtype=np.float64).reshape(-1, len(QUANTILES)), axis=1)
+
+
+def coverage(model, X, y) -> dict:
+    """Share of y inside the low-high band, mean band width and median absolute error."""
+    bands = as_bands(model.predict(X))
+    y = np.asarray(y, dtype=np.float64)
+    return {
+        "coverage": float(np.mean((y >= bands[:, 0]) & (y <= bands[:, 2]))),
+        "expected_coverage": QUANTILES[-1] - QUANTILES[0],
+        "mean_width": float(np.mean(bands[:, 2] - bands[:, 0])),
+        "median_mae": float(np.mean(np.abs(y - bands[:, 1]))),
+    }
+
+
+if __name__ == "__main__":
+    import joblib
+    import pandas as pd
+
+    from artifact_registry import ARTIFACTS_DIR, read_version
+
+    parser = argparse.ArgumentParser(description="Train the quantile model for prediction intervals.")
+    parser.add_argument("train", help="training CSV with feature_order columns and price_in_euro")
+    parser.add_argument("--test", help="held-out CSV to report band coverage on")
+    parser.add_argument("--root", default=None, help="artifact directory (default: the live one)")
+    args = parser.parse_args()
+
+    root = args.root or read_version(ARTIFACTS_DIR)[1]
+    feature_order = list(joblib.load(os.path.join(root, "feature_order.joblib")))
+    main_model = joblib.load(os.path.join(root, "model.joblib"))
+    train = pd.read_csv(args.train)
+    model = fit(train[feature_order], train[TARGET_COL], quantile_params(main_model))
+    path = os.path.join(root, QUANTILE_MODEL_FILE)
+    model.save_model(path)
+    print(f"wrote {path}")
+    if args.test:
+        test = pd.read_csv(args.test)
+        stats = coverage(model, test[feature_order], test[TARGET_COL])
+        print(f"test coverage of the {QUANTILES[0]:.0%}-{QUANTILES[-1]:.0%} band: {stats['coverage']:.1%} "
+              f"(expected {stats['expected_coverage']:.0%}), mean width {stats['mean_width']:,.0f} EUR, "
+              f"median MAE {stats['median_mae']:,.0f} EUR")
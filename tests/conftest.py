@@ -0,0 +1,108 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The shipped preprocessing artifacts; the repo does not ship model.joblib.
+PREPROCESSING_FILES = ["feature_order.joblib", "log_scaler.joblib", "direct_scaler.joblib",
+                       "log_transformer.joblib", "model_target_mapping.csv"]
+
+COLORS = ["black", "Blue", "red", "white", "silver", "grey", "beige", "other"]
+TRANSMISSIONS = ["manual", "automatic", "semi-automatic", "cvt"]
+FUELS = ["petrol", "diesel", "electric", "hybrid", "lpg", "ethanol", "hydrogen", "cng", "steam"]
+
+
+def make_inputs(n, seed=0):
+    """
+    Input dicts shaped like main.py's, over the whole catalog and beyond it:
+    catalog spellings ("_" in model names), unseen brands, models and
+    categories, reference categories, electric cars and cars registered in
+    their manufacturing year.
+    """
+    import pandas as pd
+
+    from catalog import brand_model_mapping
+
+    rng = np.random.default_rng(seed)
+    mapping = pd.read_csv(os.path.join(ROOT, "artifacts", "model_target_mapping.csv"))
+    pairs = list(zip(mapping["brand"], mapping["model"]))
+    pairs += [(b, m) for b, models in brand_model_mapping.items() for m in models]
+    pairs += [("unseen-brand", "unseen-model"), ("audi", "unseen-model"), ("alfa-romeo", "156")]
+
+    inputs = []
+    for _ in range(n):
+        brand, model = pairs[rng.integers(len(pairs))]
+        fuel = FUELS[rng.integers(len(FUELS))]
+        year = int(rng.integers(1985, 2024))
+        reg_year = year + int(rng.integers(0, 4))
+        inputs.append({
+            "brand": brand,
+            "model": model,
+            "color": COLORS[rng.integers(len(COLORS))],
+            "registration_date": f"{reg_year}-{int(rng.integers(1, 13)):02d}-01",
+            "year": year,
+            "power_hp": int(rng.integers(30, 900)),
+            "transmission_type": TRANSMISSIONS[rng.integers(len(TRANSMISSIONS))],
+            "fuel_type": fuel,
+            "fuel_efficiency": 0 if fuel == "electric" else round(float(rng.uniform(1, 50)), 1),
+            "mileage_in_km": int(rng.integers(0, 400_000)),
+            "ev_range_km": int(rng.choice([0, 50, 300])) if fuel in ("electric", "hybrid") else 0,
+            "currency": "EUR",
+        })
+    return inputs
+
+
+@pytest.fixture(scope="session")
+def trained_artifacts(tmp_path_factory):
+    """
+    An artifact directory with the shipped preprocessing files and a small
+    XGBRegressor fitted on features built by prediction_helper itself, so
+    its splits fall where real inputs land.
+    """
+    import joblib
+    import pandas as pd
+    from xgboost import XGBRegressor
+
+    import prediction_helper as ph
+
+    root = str(tmp_path_factory.mktemp("artifacts"))
+    for name in PREPROCESSING_FILES:
+        shutil.copy(os.path.join(ROOT, "artifacts", name), root)
+    registry = ph.artifacts.open(root, "test")
+    features = ph.preprocess_frame(pd.DataFrame(make_inputs(4000, seed=1)), registry)
+    features = features[registry.get("feature_order")]
+
+    rng = np.random.default_rng(1)
+    # Some mapping rows have no encoding; the model sees those as missing.
+    price = (features["model_target_enc"].fillna(20_000) * np.exp(0.3 * np.tanh(features["power_kw"])
+                                                                   - 0.4 * np.tanh(features["vehicle_manufacturing_age"])
+                                                                   - 0.2 * np.tanh(features["mileage_in_km"]))
+             + 4000 * features["brand_audi"] + 2500 * features["fuel_type_diesel"]
+             - 1500 * features["transmission_type_manual"] + 800 * features["color_black"]
+             + rng.normal(0, 500, len(features)))
+    model = XGBRegressor(n_estimators=60, max_depth=6, learning_rate=0.2, random_state=0)
+    model.fit(features, price)
+    joblib.dump(model, os.path.join(root, "model.joblib"))
+    return root
+
+
+@pytest.fixture
+def registry(trained_artifacts, monkeypatch):
+    """prediction_helper serving trained_artifacts for the length of a test."""
+    import prediction_helper as ph
+
+    reg = ph.artifacts.open(trained_artifacts, "test")
+    monkeypatch.setattr(ph.artifacts, "_current", reg)
+    ph.prediction_cache.clear()
+    yield reg
+    ph.prediction_cache.clear()
+
+
+@pytest.fixture(scope="session")
+def car_inputs():
+    return make_inputs(3000, seed=7)
@@ -0,0 +1,132 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import image_agent
+from cache import TieredCache
+
+SHARED_THUMB = "https://img.test/shared.jpg"
+
+
+def _slug(text):
+    return text.replace(" ", "_")
+
+
+class StubWikimedia(BaseHTTPRequestHandler):
+    """
+    Wikipedia under /wiki, Commons under /commons. Every Wikipedia search
+    returns the shared thumbnail plus one of its own, every Commons search
+    one of its own; page images and categories are empty. Queries listed
+    in server.fail get a body that is not JSON.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        q = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        self.server.calls.append((parts.path, q))
+        search = q.get("gsrsearch")
+        if search in self.server.fail:
+            return self._send(b"<html>upstream error</html>")
+        pages = {}
+        if parts.path == "/wiki" and search is not None:
+            for i, thumb in enumerate([SHARED_THUMB, f"https://img.test/w/{_slug(search)}.jpg"]):
+                pages[str(i)] = {"pageid": i, "title": f"W {search}", "thumbnail": {"source": thumb}}
+        elif parts.path == "/commons" and search is not None:
+            pages["0"] = {"title": f"C {search}", "imageinfo": [{
+                "thumburl": f"https://img.test/c/{_slug(search)}.jpg",
+                "descriptionurl": f"https://commons.test/{_slug(search)}",
+            }]}
+        self._send(json.dumps({"query": {"pages": pages, "categorymembers": []}}).encode())
+
+    def _send(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def wikimedia(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWikimedia)
+    server.calls = []
+    server.fail = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(image_agent, "WIKI_API", base + "/wiki")
+    monkeypatch.setattr(image_agent, "COMMONS_API", base + "/commons")
+    monkeypatch.setattr(image_agent, "_gallery_cache", TieredCache.open(str(tmp_path / "gallery.sqlite3")))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+WIKI_QUERIES = ["acme roadster car", "acme roadster (car)", "acme roadster exterior", "acme roadster"]
+COMMONS_QUERIES = ["acme roadster  front OR side", "acme roadster car", "acme roadster"]
+
+
+def _thumbs(results):
+    return [item["thumb"] for item in results]
+
+
+def test_stages_merge_in_order_without_duplicates(wikimedia):
+    results = image_agent.fetch_model_images("acme", "roadster", limit=12)
+
+    expected = (
+        [SHARED_THUMB]
+        + [f"https://img.test/w/{_slug(q)}.jpg" for q in WIKI_QUERIES]
+        + [f"https://img.test/c/{_slug(q)}.jpg" for q in COMMONS_QUERIES]
+    )
+    assert _thumbs(results) == expected
+
+
+def test_stage_stops_at_limit(wikimedia):
+    results = image_agent.fetch_model_images("acme", "roadster", limit=3)
+
+    assert _thumbs(results) == [SHARED_THUMB] + [f"https://img.test/w/{_slug(q)}.jpg" for q in WIKI_QUERIES[:2]]
+    assert not any(path == "/commons" for path, _ in wikimedia.calls)
+
+
+def test_second_call_is_served_from_cache(wikimedia):
+    first = image_agent.fetch_model_images("acme", "roadster", limit=12)
+    calls = len(wikimedia.calls)
+
+    assert image_agent.fetch_model_images("acme", "roadster", limit=12) == first
+    assert len(wikimedia.calls) == calls
+
+    # A fresh process starts with an empty memory tier and reads SQLite.
+    image_agent.gallery_cache().memory.clear()
+    assert image_agent.fetch_model_images("acme", "roadster", limit=12) == first
+    assert len(wikimedia.calls) == calls
+
+
+def test_gallery_cache_is_opened_on_first_use(monkeypatch, tmp_path):
+    path = tmp_path / "lazy" / "gallery.sqlite3"
+    monkeypatch.setattr(image_agent, "IMAGE_CACHE_PATH", str(path))
+    monkeypatch.setattr(image_agent, "_gallery_cache", None)
+    assert not path.exists()
+
+    cache = image_agent.gallery_cache()
+    assert path.exists()
+    assert image_agent.gallery_cache() is cache
+
+
+def test_failing_query_does_not_stop_its_stage(wikimedia, caplog):
+    wikimedia.fail.update({"acme roadster (car)", "acme roadster car"})
+
+    with caplog.at_level("WARNING", logger="image_agent"):
+        results = image_agent.fetch_model_images("acme", "roadster", limit=12)
+
+    expected = (
+        [SHARED_THUMB]
+        + [f"https://img.test/w/{_slug(q)}.jpg" for q in WIKI_QUERIES if q not in wikimedia.fail]
+        + [f"https://img.test/c/{_slug(q)}.jpg" for q in COMMONS_QUERIES if q not in wikimedia.fail]
+    )
+    assert _thumbs(results) == expected
+    assert sum("failed" in r.message for r in caplog.records) == 3
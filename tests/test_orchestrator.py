@@ -0,0 +1,34 @@
+import time
+
+from orchestrator import TaskGroup
+
+
+def _drain(task, timeout=5):
+    """Poll task until it finishes; returns every event."""
+    events, cursor = [], 0
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        new, cursor, finished = task.poll(cursor)
+        events += new
+        if finished:
+            return events
+        time.sleep(0.01)
+    raise AssertionError(f"task did not finish; events so far: {events}")
+
+
+def test_stream_replays_chunks_then_done():
+    task = TaskGroup("inputs").stream("insight", lambda: (c for c in ["a", "b"]), timeout=5)
+
+    assert _drain(task) == [("chunk", "a"), ("chunk", "b"), ("done", None)]
+
+
+def test_stream_that_fails_to_start_reports_the_error():
+    error = RuntimeError("no connection")
+
+    def make_stream():
+        raise error
+
+    task = TaskGroup("inputs").stream("insight", make_stream, timeout=5)
+
+    assert _drain(task) == [("error", error)]
+    assert not task.reusable()
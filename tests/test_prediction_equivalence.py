@@ -0,0 +1,156 @@
+"""
+The fast paths must give the prices model.predict gives on the pandas
+pipeline's features, for every kind of input including unknown ones.
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import artifact_registry
+import inference_engine
+import prediction_helper as ph
+import price_table
+import tree_compiler
+from conftest import make_inputs
+
+
+def _reference(registry, inputs):
+    """model.predict on preprocess_frame's features: the notebook's path."""
+    features = ph.preprocess_frame(pd.DataFrame(inputs), registry)[registry.get("feature_order")]
+    return features, registry.get("model").predict(features)
+
+
+# -------------------- compiled encoder (fast=True) --------------------
+def test_compiled_encoder_matches_preprocessing(registry, car_inputs):
+    features, _ = _reference(registry, car_inputs)
+    encoder = registry.get("compiled_encoder")
+    encoded = np.vstack([encoder.encode(x).copy() for x in car_inputs])
+
+    np.testing.assert_array_equal(encoded, features.to_numpy(dtype=np.float32))
+
+
+def test_fast_predict_matches_model(registry, car_inputs):
+    _, expected = _reference(registry, car_inputs)
+    fast = np.array([ph.predict(x, fast=True, use_cache=False)[1] for x in car_inputs])
+    # The pandas path costs ~20 ms a row; a sample is enough for it.
+    slow = np.array([ph.predict(x, use_cache=False)[1] for x in car_inputs[:200]])
+
+    np.testing.assert_array_equal(fast, expected)
+    np.testing.assert_array_equal(slow, expected[:200])
+
+
+# -------------------- booster engine and predict_batch --------------------
+def test_booster_engine_matches_model(registry, car_inputs):
+    features, expected = _reference(registry, car_inputs)
+    engine = registry.get("booster_engine")
+
+    np.testing.assert_array_equal(engine.predict(features), expected)
+    np.testing.assert_array_equal(engine.predict(features.to_numpy(dtype=np.float64)), expected)
+    np.testing.assert_array_equal(engine.predict(features.iloc[:1]), expected[:1])
+
+
+def test_model_trained_on_other_features_is_rejected(registry, trained_artifacts, tmp_path, monkeypatch):
+    import joblib
+    from xgboost import XGBRegressor
+
+    root = str(tmp_path / "artifacts")
+    shutil.copytree(trained_artifacts, root)
+    features = ph.preprocess_frame(pd.DataFrame(make_inputs(200)), registry)[registry.get("feature_order")]
+    permuted = features[list(reversed(features.columns))]
+    joblib.dump(XGBRegressor(n_estimators=2).fit(permuted, features["model_target_enc"].fillna(0)),
+                os.path.join(root, "model.joblib"))
+    monkeypatch.setattr(ph.artifacts, "_current", ph.artifacts.open(root, "permuted"))
+
+    with pytest.raises(ValueError, match="feature names do not match"):
+        ph.predict(make_inputs(1)[0], fast=True, use_cache=False)
+    with pytest.raises(ValueError, match="feature names do not match"):
+        ph.predict_batch(make_inputs(5))
+
+
+def test_predict_batch_matches_model(registry, car_inputs):
+    _, expected = _reference(registry, car_inputs)
+    converted, eur = ph.predict_batch(car_inputs)
+
+    np.testing.assert_array_equal(eur, expected)
+    np.testing.assert_array_equal(converted, expected)
+    # Chunks score the same as the whole batch.
+    np.testing.assert_array_equal(ph.predict_batch(car_inputs[:7])[1], expected[:7])
+
+
+
+# -------------------- explain --------------------
+def test_explain_gives_predicts_price_and_leaves_its_cache(registry, car_inputs):
+    _, expected = _reference(registry, car_inputs[:50])
+    explained = [ph.explain(x, fast=True)["price_eur"] for x in car_inputs[:50]]
+    batch = ph.explain_batch(car_inputs[:50])["price_eur"].to_numpy()
+    # Cached after explain(): predict() still scores the car itself.
+    predicted = np.array([ph.predict(x, fast=True)[1] for x in car_inputs[:50]])
+
+    np.testing.assert_array_equal(explained, expected)
+    np.testing.assert_array_equal(batch, expected)
+    np.testing.assert_array_equal(predicted, expected)
+
+
+# -------------------- compiled trees --------------------
+@pytest.fixture(params=["model.joblib", "model.ubj"])
+def compiled_registry(request, trained_artifacts, tmp_path, monkeypatch):
+    """
+    registry, with the trees exported next to the model and
+    INFERENCE_ENGINE=compiled; the root holds only the model file in params.
+    """
+    root = str(tmp_path / "artifacts")
+    shutil.copytree(trained_artifacts, root)
+    if request.param == "model.ubj":
+        artifact_registry.export_native_model(root)
+        os.remove(os.path.join(root, "model.joblib"))
+    tree_compiler.export(root)
+    monkeypatch.setattr(inference_engine, "INFERENCE_ENGINE", "compiled")
+    reg = ph.artifacts.open(root, "test-compiled")
+    monkeypatch.setattr(ph.artifacts, "_current", reg)
+    return reg
+
+
+def test_compiled_trees_match_model(compiled_registry, car_inputs):
+    features, expected = _reference(compiled_registry, car_inputs)
+    trees = compiled_registry.get("engine")
+    assert isinstance(trees, tree_compiler.CompiledTrees)
+    tolerance = float(np.abs(expected).max()) * 4 * np.finfo(np.float32).eps
+
+    np.testing.assert_allclose(trees.predict(features), expected, rtol=0, atol=tolerance)
+    # Generated rows around every threshold, some exactly on one and some NaN.
+    assert tree_compiler.validate(trees, compiled_registry.get("model"), rows=5000) <= tolerance
+
+
+def test_predict_paths_use_compiled_trees(compiled_registry, car_inputs):
+    _, expected = _reference(compiled_registry, car_inputs)
+    tolerance = float(np.abs(expected).max()) * 4 * np.finfo(np.float32).eps
+    fast = np.array([ph.predict(x, fast=True, use_cache=False)[1] for x in car_inputs])
+
+    np.testing.assert_allclose(ph.predict_batch(car_inputs)[1], expected, rtol=0, atol=tolerance)
+    np.testing.assert_allclose(fast, expected, rtol=0, atol=tolerance)
+
+
+# -------------------- price table --------------------
+def test_price_table_survives_unrelated_files(trained_artifacts, tmp_path, monkeypatch):
+    root = str(tmp_path / "artifacts")
+    shutil.copytree(trained_artifacts, root)
+    registry = ph.artifacts.open(root, "test-table")
+    monkeypatch.setattr(ph.artifacts, "_current", registry)
+    price_table.build(root, years=[2015], mileages=[0, 50_000], error_samples=0, log=lambda *a, **k: None)
+
+    car = {"brand": "audi", "model": "a4", "color": "black", "registration_date": "2015-01-01", "year": 2015,
+           "power_hp": price_table.POWER_HP, "transmission_type": "manual", "fuel_type": "diesel",
+           "fuel_efficiency": 20.0, "ev_range_km": 0, "mileage_in_km": 50_000}
+    expected = _reference(registry, [car])[1][0]
+    for name in ["quantile_model.ubj", "notes.txt"]:
+        with open(os.path.join(root, name), "w") as f:
+            f.write("not a price input")
+    table = price_table.load_for(root)
+    assert table is not None and table.lookup(car) == expected
+
+    with open(os.path.join(root, "model_target_mapping.csv"), "a") as f:
+        f.write("audi,new-model,30000\n")
+    assert price_table.load_for(root) is None
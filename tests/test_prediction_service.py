@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+from prediction_service import PredictionServer, PredictRequest
+
+CAR = {
+    "brand": "audi", "model": "a4", "color": "black", "registration_date": "2015-01-01",
+    "year": 2015, "power_hp": 120, "transmission_type": "manual", "fuel_type": "petrol",
+    "mileage_in_km": 40000,
+}
+
+
+def test_from_json_coerces_and_normalizes_the_date():
+    request = PredictRequest.from_json({**CAR, "year": "2015", "registration_date": "2015-03-02T10:00:00"})
+
+    assert request.year == 2015
+    assert request.power_hp == 120.0
+    assert request.registration_date == "2015-03-02"
+    assert request.currency == "EUR"
+
+
+@pytest.mark.parametrize("field, value", [
+    ("registration_date", "2015-13-01"),
+    ("registration_date", "03/2015"),
+    ("registration_date", None),
+    ("year", True),
+    ("fuel_efficiency", False),
+    ("power_hp", float("nan")),
+    ("mileage_in_km", float("inf")),
+    ("mileage_in_km", "-inf"),
+    ("mileage_in_km", 10 ** 400),
+    ("power_hp", [120]),
+    ("brand", 123),
+    ("model", None),
+    ("registration_date", 20150301),
+    ("year", 2015.7),
+    ("year", "2015.7"),
+])
+def test_from_json_rejects_invalid_values(field, value):
+    with pytest.raises(ValueError, match=f"invalid value for {field}"):
+        PredictRequest.from_json({**CAR, field: value})
+
+
+def test_from_json_rejects_missing_and_unknown_fields():
+    with pytest.raises(ValueError, match="missing field: brand"):
+        PredictRequest.from_json({k: v for k, v in CAR.items() if k != "brand"})
+    with pytest.raises(ValueError, match="unknown fields: doors"):
+        PredictRequest.from_json({**CAR, "doors": 4})
+
+
+@pytest.mark.parametrize("body", [
+    json.dumps({**CAR, "registration_date": "not a date"}),
+    '{"brand": "audi", "year": NaN}',
+    json.dumps([CAR, {**CAR, "year": True}]),
+])
+def test_invalid_request_is_a_400(body):
+    def fail(items):
+        raise AssertionError("invalid requests must not be scored")
+
+    server = PredictionServer(predict_fn=fail)
+    status, payload = asyncio.run(server._route("POST", "/predict", body.encode()))
+
+    assert status == 400
+    assert "invalid value" in payload["error"] or "missing field" in payload["error"]
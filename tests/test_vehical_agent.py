@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import vehical_agent as va
+from cache import LRUTTLCache, SQLiteCache, TieredCache
+
+
+class FakeOpenRouter(BaseHTTPRequestHandler):
+    """
+    Chat completions endpoint. Plain requests get "report <n>" once
+    server.gate is set; streaming requests get server.events, each
+    written as its own HTTP chunk (a threading.Event in the list pauses
+    the stream until it is set).
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.calls.append(body)
+        if not body.get("stream"):
+            self.server.gate.wait(10)
+            data = json.dumps({"choices": [{"message": {"content": f"report {len(self.server.calls)}"}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(self.server.stream_status)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for event in self.server.events:
+                if isinstance(event, threading.Event):
+                    event.wait(10)
+                    continue
+                data = (event + "\n\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass  # the client hung up
+
+
+def sse(content=None, **event):
+    if content is not None:
+        event = {"choices": [{"delta": {"content": content}}]}
+    return "data: " + json.dumps(event)
+
+
+@pytest.fixture
+def openrouter(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenRouter)
+    server.daemon_threads = True
+    server.calls = []
+    server.gate = threading.Event()
+    server.gate.set()
+    server.events = []
+    server.stream_status = 200
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(va, "OPENROUTER_URL", f"http://127.0.0.1:{server.server_port}/chat")
+    monkeypatch.setattr(va, "_get_api_key", lambda: "test-key")
+    monkeypatch.setattr(va, "_insight_cache", TieredCache.open(str(tmp_path / "insights.sqlite3")))
+    yield server
+    server.gate.set()
+    server.shutdown()
+    server.server_close()
+
+
+# -------------------- cached reports --------------------
+def test_insight_cache_is_opened_on_first_use(monkeypatch, tmp_path):
+    path = tmp_path / "lazy" / "insights.sqlite3"
+    monkeypatch.setattr(va, "INSIGHT_CACHE_PATH", str(path))
+    monkeypatch.setattr(va, "_insight_cache", None)
+    assert not path.exists()
+
+    cache = va.insight_cache()
+    assert path.exists()
+    assert va.insight_cache() is cache
+
+
+def test_concurrent_callers_share_one_request(openrouter):
+    openrouter.gate.clear()
+    prices = [18_800 + 100 * (i % 6) for i in range(8)]
+    assert len({va.price_bucket(p)[0] for p in prices}) == 1
+    results = []
+
+    def call(price):
+        results.append(va._cached_insight("toyota", "corolla", price))
+
+    threads = [threading.Thread(target=call, args=(p,)) for p in prices]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    openrouter.gate.set()
+    for t in threads:
+        t.join(10)
+
+    assert len(openrouter.calls) == 1
+    assert results == ["report 1"] * 8
+    assert not va._inflight
+
+
+def test_expired_report_is_fetched_again(openrouter, monkeypatch, tmp_path):
+    now = [1000.0]
+    clock = lambda: now[0]  # noqa: E731
+    monkeypatch.setattr(va, "_insight_cache", TieredCache(
+        LRUTTLCache(ttl=60, clock=clock), SQLiteCache(str(tmp_path / "ttl.sqlite3"), ttl=60, clock=clock)
+    ))
+
+    assert va._cached_insight("toyota", "corolla", 20_000) == "report 1"
+    now[0] += 30
+    assert va._cached_insight("toyota", "corolla", 20_000) == "report 1"
+    now[0] += 31
+    assert va._cached_insight("toyota", "corolla", 20_000) == "report 2"
+    assert len(openrouter.calls) == 2
+
+
+# -------------------- streamed reports --------------------
+def test_stream_yields_chunks_in_order_until_done(openrouter):
+    openrouter.events = [": keep-alive", sse("Hel"), sse("lo"), sse(""), sse(" world"), "data: [DONE]", sse("late")]
+
+    assert list(va._stream_request("toyota", "corolla", 20_000)) == ["Hel", "lo", " world"]
+    assert openrouter.calls[0]["stream"] is True
+
+
+def test_stream_error_event_raises(openrouter):
+    openrouter.events = [sse("partial"), sse(error={"code": 429, "message": "rate limited"})]
+
+    chunks = va._stream_request("toyota", "corolla", 20_000)
+    assert next(chunks) == "partial"
+    with pytest.raises(va.InsightAPIError) as exc:
+        next(chunks)
+    assert exc.value.status_code == 429
+
+
+def test_stream_error_is_reported_and_not_cached(openrouter):
+    openrouter.events = [sse("partial"), sse(error={"code": 502, "message": "bad gateway"})]
+
+    chunks = list(va.stream_vehicle_insight("toyota", "corolla", 20_000))
+
+    assert chunks == ["partial", "⚠️ DeepSeek API Error 502: bad gateway"]
+    key = va._cache_key("toyota", "corolla", va.price_bucket(20_000)[0])
+    assert va.insight_cache().get(key) is None
+
+
+def test_stream_records_timings_and_caches_the_report(openrouter):
+    pause = threading.Event()
+    openrouter.events = [sse("first"), pause, sse(" second"), "data: [DONE]"]
+    stats = {}
+
+    chunks = va.stream_vehicle_insight("toyota", "corolla", 20_000, stats=stats)
+    assert next(chunks) == "first"
+    time.sleep(0.05)
+    pause.set()
+    assert list(chunks) == [" second"]
+
+    assert stats["source"] == "stream"
+    assert 0 < stats["ttft"] < stats["total"]
+    assert stats["total"] - stats["ttft"] >= 0.05
+    assert va.stream_stats()["stream"]["count"] >= 1
+
+    cached = {}
+    assert list(va.stream_vehicle_insight("toyota", "corolla", 20_000, stats=cached)) == ["first second"]
+    assert cached["source"] == "cache"
+    assert len(openrouter.calls) == 1
+
+
+def test_cancelled_stream_caches_nothing(openrouter):
+    pause = threading.Event()
+    openrouter.events = [sse("first"), pause, sse(" second"), "data: [DONE]"]
+    key = va._cache_key("toyota", "corolla", va.price_bucket(20_000)[0])
+
+    chunks = va.stream_vehicle_insight("toyota", "corolla", 20_000)
+    assert next(chunks) == "first"
+    future, owner = va._claim(key)
+    assert not owner  # the stream still holds the key
+    chunks.close()
+
+    with pytest.raises(va.InsightCancelled):
+        future.result(timeout=5)
+    assert va.insight_cache().get(key) is None
+    assert not va._inflight
+    pause.set()
@@ -0,0 +1,364 @@
+# ml-old-car-price-prediction/train_pipeline.py
+"""
+Retrain the model and write a complete artifact set.
+
+The steps of Notebooks/data cleaning.ipynb and Notebooks/Model_training.ipynb
+as one script:
+
+    raw CSV -> data_cleaning.clean_raw           cached as Parquet
+            -> feature_engineering, hot_encoding cached as Parquet
+            -> train/test split, K-fold target encoding of (brand, model)
+            -> scalers, model_map_enc and handle_scaling on the new artifacts
+            -> hyperparameter search, final fit, test metrics
+            -> artifacts/<version>/ with manifest.json, then publish
+
+Feature engineering, one-hot encoding, target-encoding lookups and scaling
+are prediction_helper's own functions, run on a registry over the new
+directory. Training features therefore go through the same code as
+inference inputs, and feature_order is the column order the model is
+trained on. The cleaned and encoded frames are cached under
+.cache/training/. Their keys include the SHA-1 of the raw file and of the
+code that produced them, so a rerun on the same data skips straight to the
+split.
+
+The search samples the notebook's RandomizedSearchCV space. Each candidate
+is fitted once on a validation split with early stopping, rather than with
+5-fold CV to a fixed number of rounds. Candidates run in a process pool of
+--jobs workers that share the CPUs between them. The best candidate is
+refitted on the whole training split with the number of rounds where it
+stopped.
+
+    python train_pipeline.py data/gcar_data.csv --jobs 4
+    python train_pipeline.py data/gcar_data.csv --n-iter 60 --compile-trees --no-publish
+
+Publishing points artifacts/manifest.json at the new directory, so a
+running app with ARTIFACTS_WATCH_SECONDS picks it up.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import data_cleaning
+import prediction_helper as ph
+import quantile_model
+from artifact_registry import ARTIFACTS_DIR, MANIFEST_FILE, ArtifactRegistry, check_feature_order
+from tree_compiler import file_sha1
+
+TARGET_COL = "price_in_euro"
+CACHE_DIR = os.getenv("TRAINING_CACHE_DIR", os.path.join(".cache", "training"))
+
+RAW_COLS = ["brand", "model", "color", "transmission_type", "fuel_type", "year", "registration_date",
+            "power_kw", "fuel_consumption_g_km", "mileage_in_km", "ev_range_km", TARGET_COL]
+PASSTHROUGH_COLS = ["reg_month_sin", "reg_month_cos", "mileage_per_year"]
+FEATURE_ORDER = (ph.LOG_SCALE_COLS + ph.DIRECT_SCALE_COLS + PASSTHROUGH_COLS + ph.ONEHOT_COLUMNS
+                 + ["model_target_enc"])
+
+# The notebook's RandomizedSearchCV space; n_estimators caps early stopping.
+PARAM_DISTRIBUTIONS = {
+    "n_estimators": [200, 300, 500, 800],
+    "learning_rate": [0.01, 0.05, 0.1, 0.2],
+    "max_depth": [4, 6, 8, 10],
+    "subsample": [0.6, 0.8, 1.0],
+    "colsample_bytree": [0.6, 0.8, 1.0],
+    "min_child_weight": [1, 3, 5, 7],
+    "reg_alpha": [0, 0.01, 0.1, 1],
+    "reg_lambda": [1, 1.5, 2, 3],
+}
+TARGET_ENCODING_FOLDS = 5
+
+
+# -------------------- Parquet cache --------------------
+def _digest(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+
+
+def cached_frame(cache_dir: str, stage: str, key: str, build, log=print) -> pd.DataFrame:
+    """build() once per key; later calls read the frame back from cache_dir/<stage>-<key>.parquet."""
+    path = os.path.join(cache_dir, f"{stage}-{key}.parquet")
+    if os.path.exists(path):
+        log(f"{stage}: cached {path}")
+        return pd.read_parquet(path)
+    start = time.perf_counter()
+    df = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    df.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    log(f"{stage}: {len(df):,} rows in {time.perf_counter() - start:,.1f} s -> {path}")
+    return df
+
+
+def load_raw(path: str) -> pd.DataFrame:
+    return pd.read_parquet(path) if path.lower().endswith((".parquet", ".pq")) else pd.read_csv(path)
+
+
+# -------------------- features --------------------
+def encode_features(cleaned: pd.DataFrame, registry) -> pd.DataFrame:
+    """
+    Cleaned listings through the inference feature engineering and one-hot
+    encoding. brand and model (without the brand prefix, as users enter it)
+    stay for the target encoding.
+    """
+    df = cleaned[RAW_COLS].copy()
+    df["model"] = [m[len(b) + 1:] if m.startswith(b + "_") else m for b, m in zip(df["brand"], df["model"])]
+    df = ph.feature_engineering(df)
+    df = ph.hot_encoding(df, registry)
+    return df.drop(columns=[f for f in ph.ONEHOT_FIELDS if f != "brand"])
+
+
+def unknown_categories(cleaned: pd.DataFrame, registry, top: int = 20) -> dict:
+    """
+    The most common one-hot field values hot_encoding has no flag for, as
+    {"field=value": rows}. Counted from the cleaned frame, so the figures
+    are the same whether or not the encoded frame came from the cache.
+    """
+    counts = {}
+    for field, positions in registry.get("onehot_index").items():
+        # Missing values come back from Parquet as None; count them as the "nan" a fresh frame gives.
+        values = cleaned[field].fillna("nan").astype(str).str.lower()
+        known = values.isin(list(positions)) | values.isin(list(ph.ONEHOT_REFERENCE.get(field, ())))
+        for value, n in values[~known].value_counts().items():
+            counts[f"{field}={value}"] = int(n)
+    return dict(sorted(counts.items(), key=lambda item: -item[1])[:top])
+
+
+def target_encode(train: pd.DataFrame, y: pd.Series, n_splits: int = TARGET_ENCODING_FOLDS, seed: int = 42):
+    """
+    Out-of-fold mean price per (brand, model) for the training rows, and the
+    model_target_mapping inference looks unseen rows up in (the mean of
+    each pair's out-of-fold encodings). Rows without one get the mean price.
+    """
+    from sklearn.model_selection import KFold
+
+    keys = pd.MultiIndex.from_arrays([train["brand"], train["model"]])
+    enc = np.full(len(train), np.nan)
+    for fit_idx, enc_idx in KFold(n_splits, shuffle=True, random_state=seed).split(train):
+        means = y.iloc[fit_idx].groupby(keys[fit_idx]).mean()
+        enc[enc_idx] = means.reindex(keys[enc_idx]).to_numpy()
+    mapping = (pd.DataFrame({"brand": train["brand"], "model": train["model"], "model_target_enc": enc})
+               .dropna().groupby(["brand", "model"], as_index=False)["model_target_enc"].mean())
+    return np.where(np.isnan(enc), y.mean(), enc), mapping
+
+
+def fit_scalers(train: pd.DataFrame) -> dict:
+    """log1p + StandardScaler for LOG_SCALE_COLS, StandardScaler for DIRECT_SCALE_COLS."""
+    from sklearn.preprocessing import FunctionTransformer, StandardScaler
+
+    log_transformer = FunctionTransformer(np.log1p, validate=False)
+    return {
+        "log_transformer": log_transformer,
+        "log_scaler": StandardScaler().fit(log_transformer.fit_transform(train[ph.LOG_SCALE_COLS])),
+        "direct_scaler": StandardScaler().fit(train[ph.DIRECT_SCALE_COLS]),
+    }
+
+
+# -------------------- hyperparameter search --------------------
+_search_data = None
+
+
+def _init_search_worker(X_train, y_train, X_valid, y_valid) -> None:
+    global _search_data
+    _search_data = (X_train, y_train, X_valid, y_valid)
+
+
+def _regressor(params: dict, nthread: int, seed: int, **kwargs):
+    from xgboost import XGBRegressor
+
+    return XGBRegressor(objective="reg:squarederror", tree_method="hist", random_state=seed, n_jobs=nthread,
+                        **params, **kwargs)
+
+
+def _fit_candidate(params: dict, early_stopping_rounds: int, nthread: int, seed: int) -> dict:
+    X_train, y_train, X_valid, y_valid = _search_data
+    start = time.perf_counter()
+    model = _regressor(params, nthread, seed, eval_metric="mae", early_stopping_rounds=early_stopping_rounds)
+    model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+    return {"params": params, "best_iteration": int(model.best_iteration), "valid_mae": float(model.best_score),
+            "seconds": time.perf_counter() - start}
+
+
+def search(X, y, n_iter: int = 30, jobs: int = 1, valid_size: float = 0.1, early_stopping_rounds: int = 50,
+           seed: int = 42, log=print) -> list[dict]:
+    """
+    Fit n_iter sampled candidates with early stopping on a validation split;
+    returns their results, best (lowest validation MAE) first. With jobs > 1
+    candidates run in that many processes, each with cpu_count // jobs
+    threads.
+    """
+    from sklearn.model_selection import ParameterSampler, train_test_split
+
+    X_train, X_valid, y_train, y_valid = train_test_split(X, y, test_size=valid_size, random_state=seed)
+    candidates = list(ParameterSampler(PARAM_DISTRIBUTIONS, n_iter, random_state=seed))
+    nthread = max(1, (os.cpu_count() or 1) // jobs)
+    results = []
+
+    def report(r):
+        results.append(r)
+        log(f"  [{len(results)}/{len(candidates)}] valid MAE {r['valid_mae']:,.0f} after "
+            f"{r['best_iteration'] + 1} rounds, {r['seconds']:,.0f} s: {r['params']}")
+
+    if jobs > 1:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(jobs, mp_context=ctx, initializer=_init_search_worker,
+                                 initargs=(X_train, y_train, X_valid, y_valid)) as pool:
+            futures = [pool.submit(_fit_candidate, p, early_stopping_rounds, nthread, seed) for p in candidates]
+            for future in as_completed(futures):
+                report(future.result())
+    else:
+        _init_search_worker(X_train, y_train, X_valid, y_valid)
+        for params in candidates:
+            report(_fit_candidate(params, early_stopping_rounds, nthread, seed))
+    return sorted(results, key=lambda r: r["valid_mae"])
+
+
+def evaluate(y_true, y_pred) -> dict:
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    return {"mae": float(mean_absolute_error(y_true, y_pred)),
+            "rmse": float(np.sqrt(mean_squared_error(y_true, y_pred))),
+            "r2": float(r2_score(y_true, y_pred))}
+
+
+# -------------------- pipeline --------------------
+def _libraries() -> dict:
+    import sklearn
+    import xgboost
+
+    return {"xgboost": xgboost.__version__, "scikit-learn": sklearn.__version__, "pandas": pd.__version__,
+            "numpy": np.__version__, "joblib": joblib.__version__}
+
+
+def publish(out_dir: str, version: str, artifacts_dir: str = ARTIFACTS_DIR) -> str:
+    """Point artifacts_dir/manifest.json at out_dir (which must be inside it)."""
+    rel = os.path.relpath(out_dir, artifacts_dir)
+    if rel.startswith(os.pardir):
+        raise ValueError(f"{out_dir} is not inside {artifacts_dir}")
+    path = os.path.join(artifacts_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": version, "path": rel}, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def train(raw_path: str, out_dir: str | None = None, version: str | None = None, cache_dir: str = CACHE_DIR,
+          n_iter: int = 30, jobs: int = 1, test_size: float = 0.2, valid_size: float = 0.1,
+          early_stopping_rounds: int = 50, seed: int = 42, with_quantile: bool = True,
+          compile_trees: bool = False, log=print) -> dict:
+    """Run the whole pipeline into out_dir (default artifacts/<version>/); returns its manifest."""
+    from sklearn.model_selection import train_test_split
+
+    version = version or datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    out_dir = out_dir or os.path.join(ARTIFACTS_DIR, version)
+    os.makedirs(out_dir, exist_ok=True)
+    timings = {}
+    start = time.perf_counter()
+
+    # feature_order first: the one-hot encoding reads it through the registry.
+    joblib.dump(FEATURE_ORDER, os.path.join(out_dir, "feature_order.joblib"))
+    registry = ph.artifacts.open(out_dir, version)
+
+    raw_sha1 = file_sha1(raw_path)
+    clean_key = _digest(raw_sha1, file_sha1(data_cleaning.__file__))
+    cleaned = cached_frame(cache_dir, "cleaned", clean_key, lambda: data_cleaning.clean_raw(load_raw(raw_path)), log)
+    encoded = cached_frame(cache_dir, "encoded", _digest(clean_key, file_sha1(ph.__file__)),
+                           lambda: encode_features(cleaned, registry), log)
+    timings["prepare_seconds"] = time.perf_counter() - start
+
+    train_df, test_df = (df.reset_index(drop=True)
+                         for df in train_test_split(encoded, test_size=test_size, random_state=seed))
+    y_train, y_test = train_df.pop(TARGET_COL), test_df.pop(TARGET_COL)
+    enc, mapping = target_encode(train_df, y_train, seed=seed)
+    mapping.to_csv(os.path.join(out_dir, "model_target_mapping.csv"), index=False)
+    for name, fitted in fit_scalers(train_df).items():
+        joblib.dump(fitted, os.path.join(out_dir, f"{name}.joblib"))
+
+    X_train = ph.handle_scaling(train_df.drop(columns=["brand", "model"]).assign(model_target_enc=enc),
+                                registry)[FEATURE_ORDER]
+    X_test = ph.handle_scaling(ph.model_map_enc(test_df, registry).drop(columns=["brand"]), registry)[FEATURE_ORDER]
+    log(f"features: {len(X_train):,} train / {len(X_test):,} test rows, {len(FEATURE_ORDER)} columns")
+
+    step = time.perf_counter()
+    results = search(X_train, y_train, n_iter, jobs, valid_size, early_stopping_rounds, seed, log)
+    timings["search_seconds"] = time.perf_counter() - step
+    best = results[0]
+    params = {**best["params"], "n_estimators": best["best_iteration"] + 1}
+
+    step = time.perf_counter()
+    model = _regressor(params, -1, seed).fit(X_train, y_train)
+    timings["fit_seconds"] = time.perf_counter() - step
+    joblib.dump(model, os.path.join(out_dir, "model.joblib"))
+    metrics = evaluate(y_test, model.predict(X_test))
+    log(f"test: MAE {metrics['mae']:,.0f}, RMSE {metrics['rmse']:,.0f}, R2 {metrics['r2']:.4f} with {params}")
+
+    manifest = {
+        "version": version,
+        "path": ".",
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "data": {"path": os.path.abspath(raw_path), "sha1": raw_sha1, "clean_rows": len(cleaned),
+                 "train_rows": len(X_train), "test_rows": len(X_test)},
+        "search": {"n_iter": n_iter, "jobs": jobs, "valid_size": valid_size,
+                   "early_stopping_rounds": early_stopping_rounds, "seed": seed, "results": results},
+        "params": params,
+        "metrics": metrics,
+        "unknown_categories": unknown_categories(cleaned, registry),
+    }
+    if with_quantile:
+        step = time.perf_counter()
+        qmodel = quantile_model.fit(X_train, y_train, quantile_model.quantile_params(model))
+        qmodel.save_model(os.path.join(out_dir, quantile_model.QUANTILE_MODEL_FILE))
+        manifest["quantile_metrics"] = quantile_model.coverage(qmodel, X_test, y_test)
+        timings["quantile_seconds"] = time.perf_counter() - step
+    if compile_trees:
+        import tree_compiler
+
+        tree_compiler.export(out_dir, model)
+
+    check_feature_order(ArtifactRegistry(out_dir, version))
+    timings["total_seconds"] = time.perf_counter() - start
+    manifest["timings"] = timings
+    manifest["libraries"] = _libraries()
+    # Last, so a directory with a manifest is complete.
+    manifest["files"] = {name: file_sha1(os.path.join(out_dir, name)) for name in sorted(os.listdir(out_dir))
+                         if os.path.isfile(os.path.join(out_dir, name))}
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the raw listings, tune and train the model, "
+                                                 "and write a new artifact set.")
+    parser.add_argument("raw", help="raw listings CSV or Parquet (gcar_data.csv)")
+    parser.add_argument("--output", default=None, help="artifact directory (default: artifacts/<version>)")
+    parser.add_argument("--version", default=None, help="version name (default: a timestamp)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--n-iter", type=int, default=30, help="hyperparameter candidates")
+    parser.add_argument("--jobs", type=int, default=min(4, os.cpu_count() or 1), help="search processes")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--valid-size", type=float, default=0.1, help="share of train used for early stopping")
+    parser.add_argument("--early-stopping-rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-quantile", action="store_true", help="skip the quantile model")
+    parser.add_argument("--compile-trees", action="store_true", help="also export compiled_trees/")
+    parser.add_argument("--no-publish", action="store_true", help="do not update artifacts/manifest.json")
+    args = parser.parse_args()
+
+    manifest = train(args.raw, args.output, args.version, args.cache_dir, args.n_iter, args.jobs,
+                     args.test_size, args.valid_size, args.early_stopping_rounds, args.seed,
+                     with_quantile=not args.no_quantile, compile_trees=args.compile_trees)
+    out_dir = args.output or os.path.join(ARTIFACTS_DIR, manifest["version"])
+    print(f"wrote {out_dir} in {manifest['timings']['total_seconds']:,.0f} s")
+    if not args.no_publish:
+        print(f"published version {manifest['version']} in {publish(out_dir, manifest['version'])}")
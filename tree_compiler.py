@@ -0,0 +1,285 @@
+# ml-old-car-price-prediction/tree_compiler.py
+"""
+Compile the XGBoost ensemble to plain NumPy arrays and evaluate it without
+the XGBoost runtime.
+
+export() reads the model the registry loads (artifacts/model.ubj, else
+model.joblib) and writes artifacts/compiled_trees/,
+one .npy file per node field, covering every node of every tree:
+
+    feature       int64 feature index tested at the node
+    threshold     float32 split value; rows with x < threshold go left
+    left, right   int64 global node indices of the children
+    default_left  bool, the branch taken when the feature is NaN
+    value         float32 leaf output (0 on internal nodes)
+    roots         int64 index of each tree's root node
+    meta.json     base_score, max_depth, feature_order and the SHA-1 of
+                  the model file the trees came from
+
+Each tree is laid out breadth-first with right == left + 1, so one step
+is `node = left[node] + (x >= threshold)`. Leaves point to themselves
+with a NaN threshold, which keeps every row in place once it reaches a
+leaf, so all rows take max_depth steps without a leaf check.
+
+CompiledTrees.load() memory-maps the arrays, so worker processes share
+one copy of the pages. predict() walks every tree for a block of rows at
+once. Leaf values are added tree by tree in float32, in XGBoost's order,
+so the predictions match model.predict; validate() checks this on
+generated rows.
+
+    python tree_compiler.py                      # export and validate
+    python tree_compiler.py --validate-rows 100000
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+from collections import deque
+
+import numpy as np
+
+from artifact_registry import load_model, model_path
+from inference_engine import as_features
+
+TREES_DIR = "compiled_trees"
+FIELDS = ("feature", "threshold", "left", "right", "default_left", "value", "roots")
+
+# Rows evaluated together; keeps the (rows, trees) index arrays in cache.
+BLOCK_ROWS = 1024
+
+# Objectives whose prediction is the raw margin (no link function).
+IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:absoluteerror", "reg:pseudohubererror", "reg:quantileerror"}
+
+
+def file_sha1(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# -------------------- compiling --------------------
+def _tree_arrays(tree: dict, offset: int) -> tuple[dict, int]:
+    """One tree from XGBoost's JSON dump, renumbered breadth-first; also its depth."""
+    if any(tree["split_type"]):
+        raise NotImplementedError("categorical splits are not supported")
+    left, right = tree["left_children"], tree["right_children"]
+
+    order, depth, max_depth = [], {0: 0}, 0
+    queue = deque([0])
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        max_depth = max(max_depth, depth[node])
+        if left[node] != -1:
+            for child in (left[node], right[node]):
+                depth[child] = depth[node] + 1
+                queue.append(child)
+
+    n = len(order)
+    arrays = {
+        "feature": np.zeros(n, dtype=np.int64),
+        "threshold": np.full(n, np.nan, dtype=np.float32),
+        "left": np.arange(offset, offset + n, dtype=np.int64),
+        "right": np.arange(offset, offset + n, dtype=np.int64),
+        "default_left": np.ones(n, dtype=bool),
+        "value": np.zeros(n, dtype=np.float32),
+    }
+    next_child = 1
+    for new, node in enumerate(order):
+        if left[node] == -1:
+            arrays["value"][new] = tree["split_conditions"][node]
+            continue
+        arrays["feature"][new] = tree["split_indices"][node]
+        arrays["threshold"][new] = tree["split_conditions"][node]
+        arrays["default_left"][new] = bool(tree["default_left"][node])
+        arrays["left"][new] = offset + next_child
+        arrays["right"][new] = offset + next_child + 1
+        next_child += 2
+    return arrays, max_depth
+
+
+def compile_model(model) -> tuple[dict, dict]:
+    """(arrays, meta) for an XGBRegressor, using the rounds model.predict uses."""
+    config = json.loads(model.get_booster().save_raw("json"))
+    learner = config["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in IDENTITY_OBJECTIVES:
+        raise NotImplementedError(f"objective {objective} is not supported")
+    booster = learner["gradient_booster"]
+    if booster["name"] != "gbtree":
+        raise NotImplementedError(f"booster {booster['name']} is not supported")
+
+    start, end = model._get_iteration_range(None)
+    indptr = booster["model"]["iteration_indptr"]
+    trees = booster["model"]["trees"][indptr[start]:indptr[end] if end else None]
+
+    parts, roots, max_depth, offset = [], [], 0, 0
+    for tree in trees:
+        arrays, depth = _tree_arrays(tree, offset)
+        parts.append(arrays)
+        roots.append(offset)
+        max_depth = max(max_depth, depth)
+        offset += len(arrays["value"])
+    arrays = {name: np.concatenate([p[name] for p in parts]) for name in FIELDS if name != "roots"}
+    arrays["roots"] = np.asarray(roots, dtype=np.int64)
+    meta = {
+        "base_score": float(learner["learner_model_param"]["base_score"]),
+        "max_depth": max_depth,
+        "num_trees": len(trees),
+        "num_nodes": offset,
+        "num_feature": int(learner["learner_model_param"]["num_feature"]),
+    }
+    return arrays, meta
+
+
+# -------------------- evaluating --------------------
+class CompiledTrees:
+    """The compiled ensemble; predict() has the same contract as BoosterEngine.predict."""
+
+    def __init__(self, arrays: dict, meta: dict):
+        # Plain ndarray views: np.memmap's subclass hooks would run on every take().
+        for name in FIELDS:
+            setattr(self, name, arrays[name].view(np.ndarray))
+        self.meta = meta
+        self.base_score = np.float32(meta["base_score"])
+        self.max_depth = int(meta["max_depth"])
+        self.n_features = int(meta["num_feature"])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in FIELDS)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "CompiledTrees":
+        mode = "r" if mmap else None
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        return cls({name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in FIELDS},
+                   meta)
+
+    def predict(self, features) -> np.ndarray:
+        """float32 predictions for a (rows, n_features) array or frame in feature_order."""
+        x = as_features(features)
+        out = np.empty(x.shape[0], dtype=np.float32)
+        for start in range(0, x.shape[0], BLOCK_ROWS):
+            out[start:start + BLOCK_ROWS] = self._predict_block(x[start:start + BLOCK_ROWS])
+        return out
+
+    def _predict_block(self, x: np.ndarray) -> np.ndarray:
+        rows = x.shape[0]
+        flat = x.ravel()
+        row_offsets = (np.arange(rows) * x.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (rows, len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            values = flat.take(row_offsets + self.feature.take(node))
+            go_right = values >= self.threshold.take(node)
+            missing = np.isnan(values)
+            if missing.any():
+                go_right[missing] = ~self.default_left.take(node[missing])
+            node = self.left.take(node) + go_right
+
+        leaves = self.value.take(node)
+        out = np.full(rows, self.base_score, dtype=np.float32)
+        for t in range(leaves.shape[1]):
+            out += leaves[:, t]
+        return out
+
+
+# -------------------- export / load --------------------
+def export(root: str, model=None) -> str:
+    """Compile root's model (see model_path) into root/compiled_trees/; returns that directory."""
+    import joblib
+
+    model = model if model is not None else load_model(root)
+    arrays, meta = compile_model(model)
+    feature_order_path = os.path.join(root, "feature_order.joblib")
+    feature_order = (joblib.load(feature_order_path) if os.path.exists(feature_order_path)
+                     else model.get_booster().feature_names)
+    meta["feature_order"] = list(feature_order)
+    meta["model_sha1"] = file_sha1(model_path(root))
+
+    directory = os.path.join(root, TREES_DIR)
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    # meta.json last: load_for() treats a directory without it as not exported.
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return directory
+
+
+def load_for(root: str, feature_order) -> CompiledTrees | None:
+    """
+    The compiled trees for the artifacts in root, or None when they have not
+    been exported, root has no model file or the trees were compiled from a
+    different one.
+    """
+    directory = os.path.join(root, TREES_DIR)
+    path = model_path(root)
+    if not os.path.exists(os.path.join(directory, "meta.json")) or not os.path.exists(path):
+        return None
+    trees = CompiledTrees.load(directory)
+    if (trees.meta.get("model_sha1") != file_sha1(path)
+            or trees.meta["feature_order"] != list(feature_order)):
+        return None
+    return trees
+
+
+# -------------------- validation --------------------
+def sample_features(trees: CompiledTrees, rows: int, missing_rate: float = 0.01, seed: int = 0) -> np.ndarray:
+    """
+    Random float32 rows that exercise the splits: each feature is drawn
+    around its own thresholds (some exactly on one), with a few NaNs.
+    """
+    rng = np.random.default_rng(seed)
+    internal = ~np.isnan(trees.threshold)
+    x = rng.standard_normal((rows, trees.n_features)).astype(np.float32)
+    for f in range(trees.n_features):
+        thresholds = trees.threshold[internal & (trees.feature == f)]
+        if len(thresholds) == 0:
+            continue
+        lo, hi = float(thresholds.min()), float(thresholds.max())
+        pad = (hi - lo) * 0.1 + 1.0
+        x[:, f] = rng.uniform(lo - pad, hi + pad, rows)
+        exact = rng.random(rows) < 0.05
+        x[exact, f] = rng.choice(thresholds, exact.sum())
+    x[rng.random(x.shape) < missing_rate] = np.nan
+    return x
+
+
+def validate(trees: CompiledTrees, model, rows: int = 20_000, seed: int = 0) -> float:
+    """
+    Largest absolute difference from model.predict on generated rows.
+    Raises if any row is off by more than float32 rounding of the sum.
+    """
+    x = sample_features(trees, rows, seed=seed)
+    expected = model.get_booster().inplace_predict(x, iteration_range=model._get_iteration_range(None),
+                                                   validate_features=False)
+    diff = float(np.abs(trees.predict(x).astype(np.float64) - expected).max())
+    tolerance = float(np.abs(expected).max()) * 4 * np.finfo(np.float32).eps
+    if diff > tolerance:
+        raise ValueError(f"compiled trees differ from model.predict by {diff} (tolerance {tolerance})")
+    return diff
+
+
+if __name__ == "__main__":
+    from artifact_registry import ARTIFACTS_DIR, read_version
+
+    parser = argparse.ArgumentParser(description="Compile the model to NumPy tree arrays.")
+    parser.add_argument("--root", default=None, help="artifact directory (default: the live one)")
+    parser.add_argument("--validate-rows", type=int, default=20_000)
+    args = parser.parse_args()
+
+    root = args.root or read_version(ARTIFACTS_DIR)[1]
+    model = load_model(root)
+    directory = export(root, model)
+    trees = CompiledTrees.load(directory)
+    print(f"wrote {directory}: {trees.meta['num_trees']} trees, {trees.meta['num_nodes']:,} nodes, "
+          f"max depth {trees.max_depth}, {trees.nbytes / 1024:,.0f} KiB")
+    if args.validate_rows:
+        diff = validate(trees, model, args.validate_rows)
+        print(f"validated on {args.validate_rows:,} generated rows: max |diff| {diff:.3g}")
@@ -4,16 +4,70 @@ Delivers intelligent market insights, model comparisons, and recommendations
 using the DeepSeek-V3.1 model via OpenRouter.
 """
 
+import json
+import math
 import os
-import streamlit as st
-from dotenv import load_dotenv
-import requests
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+import profiling
+from cache import TieredCache
+from http_client import get_client
+
+# Overridable so a local fake endpoint can stand in for OpenRouter.
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+INSIGHT_MODEL = "deepseek/deepseek-chat"
+
+# ----------------------------------------
+# 💾 Insight cache: in-memory LRU + SQLite, keyed on (brand, model, price bucket)
+# ----------------------------------------
+INSIGHT_CACHE_PATH = os.getenv("INSIGHT_CACHE_PATH", os.path.join(".cache", "insights.sqlite3"))
+INSIGHT_CACHE_TTL = float(os.getenv("INSIGHT_CACHE_TTL", str(7 * 24 * 3600)))
+# Relative width of a price bucket: 0.15 puts prices within ~15% of each other together.
+INSIGHT_PRICE_BUCKET = float(os.getenv("INSIGHT_PRICE_BUCKET", "0.15"))
+
+_insight_cache: TieredCache | None = None
+_insight_cache_lock = threading.Lock()
+
+# In-flight reports by cache key, so concurrent callers share one API call.
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+# (source, time to first chunk, total seconds) of recent streamed reports.
+_stream_timings: deque = deque(maxlen=512)
+
+
+def insight_cache() -> TieredCache:
+    """The report cache, opened (and its SQLite file created) on first use."""
+    global _insight_cache
+    if _insight_cache is None:
+        with _insight_cache_lock:
+            if _insight_cache is None:
+                _insight_cache = TieredCache.open(INSIGHT_CACHE_PATH, maxsize=512, ttl=INSIGHT_CACHE_TTL or None)
+    return _insight_cache
+
+
+class InsightCancelled(Exception):
+    """A streaming reader stopped before the report it was generating finished."""
+
+
+class InsightAPIError(Exception):
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"{status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
 
 # ----------------------------------------
 # 🔑 API Key Loader
 # ----------------------------------------
 def _get_api_key():
     """Fetch API key from Streamlit secrets or .env"""
+    # Imported here so the pre-warm CLI and workers do not pay for streamlit.
+    import streamlit as st
+    from dotenv import load_dotenv
+
     try:
         if hasattr(st, "secrets") and "OPENROUTER_API_KEY" in st.secrets:
             return st.secrets["OPENROUTER_API_KEY"]
@@ -28,16 +82,22 @@ def _get_api_key():
 
 
 # ----------------------------------------
-# 🧠 DeepSeek Agent Function
+# 📝 Prompt + API call
 # ----------------------------------------
-def create_vehicle_insight_agent(brand: str, model: str, predicted_price: float = None):
+def price_bucket(price: float | None) -> tuple[int | None, float | None]:
     """
-    Generates advanced, data-driven automotive insights using DeepSeek-V3.1.
+    Map a price onto a log-scale bucket; returns (bucket index, representative
+    price rounded to two significant figures). (None, None) without a price.
     """
+    if not price or price <= 0:
+        return None, None
+    step = math.log1p(INSIGHT_PRICE_BUCKET)
+    index = math.floor(math.log(price) / step)
+    centre = math.exp((index + 0.5) * step)
+    return index, round(centre, 1 - int(math.floor(math.log10(centre))))
 
-    if not brand or not model:
-        return "⚠️ Brand or model not provided."
 
+def _build_prompt(brand: str, model: str, predicted_price: float | None) -> str:
     price_context = (
         f"The estimated used market price for {brand.title()} {model.title()} is around €{predicted_price:,.0f}."
         if predicted_price
@@ -98,33 +158,313 @@ def create_vehicle_insight_agent(brand: str, model: str, predicted_price: float
     Use emojis and bold subheadings.
     Keep under **600 words**, use bullet points and short paragraphs.
     """
+    return prompt
+
+
+def _request_payload(brand: str, model: str, predicted_price: float | None, stream: bool = False):
+    api_key = _get_api_key()
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "HTTP-Referer": "https://openrouter.ai",
+        "X-Title": "Vehicle Market Insight Agent"
+    }
+
+    data = {
+        "model": INSIGHT_MODEL,
+        "messages": [{"role": "user", "content": _build_prompt(brand, model, predicted_price)}]
+    }
+    if stream:
+        data["stream"] = True
+    return headers, data
 
+
+@profiling.instrument("insight.request")
+def _request_insight(brand: str, model: str, predicted_price: float | None) -> str:
+    """One OpenRouter call; raises InsightAPIError on a non-200 response."""
+    headers, data = _request_payload(brand, model, predicted_price)
+    response = get_client().post(OPENROUTER_URL, headers=headers, json=data, timeout=90)
+    if response.status_code != 200:
+        raise InsightAPIError(response.status_code, response.text)
+    return response.json()["choices"][0]["message"]["content"].strip()
+
+
+def _stream_request(brand: str, model: str, predicted_price: float | None) -> Iterator[str]:
+    """One streaming OpenRouter call; yields content deltas from the SSE events."""
+    headers, data = _request_payload(brand, model, predicted_price, stream=True)
+    response = get_client().post(OPENROUTER_URL, headers=headers, json=data, stream=True, timeout=90)
     try:
-        api_key = _get_api_key()
+        if response.status_code != 200:
+            raise InsightAPIError(response.status_code, response.text)
+        response.encoding = "utf-8"
+        # chunk_size=None hands over each HTTP chunk as it arrives instead of
+        # waiting for a 512-byte buffer to fill.
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            # Events are "data: {...}" lines; ":"-prefixed lines are keep-alive comments.
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                return
+            event = json.loads(payload)
+            if "error" in event:
+                error = event["error"]
+                raise InsightAPIError(error.get("code", 500), error.get("message", ""))
+            delta = event["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+    finally:
+        response.close()
 
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "HTTP-Referer": "https://openrouter.ai",
-            "X-Title": "Vehicle Market Insight Agent"
-        }
 
-        data = {
-            "model": "deepseek/deepseek-chat",
-            "messages": [{"role": "user", "content": prompt}]
-        }
+def _cache_key(brand: str, model: str, bucket: int | None) -> str:
+    return json.dumps([INSIGHT_MODEL, brand.lower(), model.lower(), bucket])
+
+
+def _claim(key: str) -> tuple[Future, bool]:
+    """The in-flight future for key, and whether this caller now owns it."""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future, False
+        future = _inflight[key] = Future()
+        return future, True
+
+
+def _release(key: str) -> None:
+    with _inflight_lock:
+        _inflight.pop(key, None)
+
+
+def _cached_insight(brand: str, model: str, predicted_price: float | None) -> str:
+    """
+    Cached report for the price bucket. Concurrent misses on the same key
+    wait for the first caller's request instead of sending their own.
+    """
+    bucket, representative = price_bucket(predicted_price)
+    key = _cache_key(brand, model, bucket)
+    while True:
+        cached = insight_cache().get(key)
+        if cached is not None:
+            return cached
+        future, owner = _claim(key)
+        if owner:
+            break
+        try:
+            return future.result()
+        except InsightCancelled:
+            continue  # the streaming reader left; take over
 
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=90
-        )
+    try:
+        # A previous owner may have finished between our miss and taking the slot.
+        content = insight_cache().get(key)
+        if content is None:
+            content = _request_insight(brand, model, representative)
+            insight_cache().set(key, content)
+        future.set_result(content)
+        return content
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _release(key)
 
-        if response.status_code == 200:
-            content = response.json()["choices"][0]["message"]["content"]
-            return content.strip()
-        else:
-            return f"⚠️ DeepSeek API Error {response.status_code}: {response.text}"
 
+# ----------------------------------------
+# 🧠 DeepSeek Agent Function
+# ----------------------------------------
+@profiling.instrument("insight.report")
+def create_vehicle_insight_agent(brand: str, model: str, predicted_price: float = None, use_cache: bool = True):
+    """
+    Generates advanced, data-driven automotive insights using DeepSeek-V3.1.
+    Reports are cached per (brand, model, price bucket); errors are not cached.
+    """
+
+    if not brand or not model:
+        return "⚠️ Brand or model not provided."
+
+    try:
+        if use_cache:
+            return _cached_insight(brand, model, predicted_price)
+        return _request_insight(brand, model, predicted_price)
+    except InsightAPIError as e:
+        return f"⚠️ DeepSeek API Error {e.status_code}: {e.text}"
     except Exception as e:
         return f"⚠️ DeepSeek Agent Error: {str(e)}"
+
+
+# ----------------------------------------
+# 📡 Streaming variant (server-sent events)
+# ----------------------------------------
+def _stream_or_cached(brand: str, model: str, predicted_price: float | None, use_cache: bool, stats: dict):
+    if not use_cache:
+        stats["source"] = "stream"
+        yield from _stream_request(brand, model, predicted_price)
+        return
+
+    bucket, representative = price_bucket(predicted_price)
+    key = _cache_key(brand, model, bucket)
+    while True:
+        cached = insight_cache().get(key)
+        if cached is not None:
+            stats["source"] = "cache"
+            yield cached
+            return
+        future, owner = _claim(key)
+        if owner:
+            break
+        try:
+            content = future.result()
+        except InsightCancelled:
+            continue
+        stats["source"] = "shared"
+        yield content
+        return
+
+    stats["source"] = "stream"
+    parts = []
+    try:
+        for chunk in _stream_request(brand, model, representative):
+            parts.append(chunk)
+            yield chunk
+        content = "".join(parts).strip()
+        if content:
+            insight_cache().set(key, content)
+        future.set_result(content)
+    except GeneratorExit:
+        future.set_exception(InsightCancelled())
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _release(key)
+
+
+def stream_vehicle_insight(brand: str, model: str, predicted_price: float = None, use_cache: bool = True,
+                           stats: dict | None = None) -> Iterator[str]:
+    """
+    Streaming create_vehicle_insight_agent: yields markdown chunks as they
+    arrive. A cached report, or one another caller is already generating,
+    comes back as a single chunk. Errors are yielded as a "⚠️" message.
+    stats, if given, receives source, ttft and total (seconds).
+    """
+    stats = {} if stats is None else stats
+    stats.update(source=None, ttft=None, total=None)
+    start = time.perf_counter()
+    if not brand or not model:
+        yield "⚠️ Brand or model not provided."
+        return
+
+    try:
+        for chunk in _stream_or_cached(brand, model, predicted_price, use_cache, stats):
+            if stats["ttft"] is None:
+                stats["ttft"] = time.perf_counter() - start
+            yield chunk
+    except InsightAPIError as e:
+        yield f"⚠️ DeepSeek API Error {e.status_code}: {e.text}"
+    except Exception as e:
+        yield f"⚠️ DeepSeek Agent Error: {str(e)}"
+    finally:
+        stats["total"] = time.perf_counter() - start
+        if stats["ttft"] is not None:
+            _stream_timings.append((stats["source"], stats["ttft"], stats["total"]))
+            profiling.observe((f"insight.stream.{stats['source']}", stats["total"]),
+                              (f"insight.stream.{stats['source']}.ttft", stats["ttft"]))
+
+
+def stream_stats() -> dict:
+    """Time-to-first-chunk and total time (seconds) of recent reports, per source."""
+    out = {}
+    for source in ("stream", "shared", "cache"):
+        rows = [(ttft, total) for s, ttft, total in list(_stream_timings) if s == source]
+        if not rows:
+            continue
+        ttft, total = (sorted(col) for col in zip(*rows))
+        out[source] = {
+            "count": len(rows),
+            "ttft_p50": ttft[len(ttft) // 2],
+            "ttft_max": ttft[-1],
+            "total_p50": total[len(total) // 2],
+            "total_max": total[-1],
+        }
+    return out
+
+
+# ----------------------------------------
+# 🔥 Cache pre-warming
+# ----------------------------------------
+def prewarm_insights(mapping: dict[str, list[str]], price_for=None, max_workers: int = 4, log=print) -> dict:
+    """
+    Fill the insight cache for every (brand, model) in mapping.
+    price_for(brand, model) gives the price to bucket on (None = no price).
+    Pairs already cached are skipped; returns counts of warmed/cached/failed.
+    """
+    pairs = [(brand, model) for brand, models in mapping.items() for model in models]
+    counts = {"warmed": 0, "cached": 0, "failed": 0}
+
+    def warm(pair):
+        brand, model = pair
+        price = price_for(brand, model) if price_for else None
+        if insight_cache().get(_cache_key(brand, model, price_bucket(price)[0])) is not None:
+            return "cached"
+        try:
+            _cached_insight(brand, model, price)
+            return "warmed"
+        except Exception as e:
+            log(f"{brand} {model}: {e}")
+            return "failed"
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="insight-warm") as pool:
+        for done, outcome in enumerate(pool.map(warm, pairs), 1):
+            counts[outcome] += 1
+            if done % 50 == 0:
+                log(f"{done}/{len(pairs)} pairs")
+    return counts
+
+
+# The car the app predicts when only brand and model are changed from its defaults.
+TYPICAL_CAR = {
+    "color": "black",
+    "registration_date": "2015-01-01",
+    "year": 2015,
+    "power_hp": 120,
+    "transmission_type": "manual",
+    "fuel_type": "petrol",
+    "fuel_efficiency": 20.0,
+    "mileage_in_km": 40000,
+    "ev_range_km": 0,
+}
+
+
+def _typical_car_prices(mapping: dict[str, list[str]]):
+    """
+    price_for() giving the EUR prediction for TYPICAL_CAR of each pair, so
+    the warmed buckets are ones the app's predictions actually land in.
+    All pairs are scored in one predict_batch call.
+    """
+    from prediction_helper import predict_batch
+
+    pairs = [(brand, model) for brand, models in mapping.items() for model in models]
+    _, prices = predict_batch([{"brand": brand, "model": model, **TYPICAL_CAR} for brand, model in pairs])
+    by_pair = dict(zip(pairs, prices.tolist()))
+
+    def price_for(brand, model):
+        return by_pair.get((brand, model))
+
+    return price_for
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from catalog import brand_model_mapping
+
+    parser = argparse.ArgumentParser(description="Pre-warm the vehicle insight cache.")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent API calls (default 4)")
+    parser.add_argument("--no-price", action="store_true",
+                        help="warm the price-less reports instead of each model's typical-car price bucket")
+    args = parser.parse_args()
+
+    price_for = None if args.no_price else _typical_car_prices(brand_model_mapping)
+    print(prewarm_insights(brand_model_mapping, price_for, max_workers=args.workers))